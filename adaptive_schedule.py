@@ -0,0 +1,90 @@
+import os
+from datetime import datetime
+from typing import Dict
+from database import execute_query
+from pipeline import DEFAULT_PROFILE, get_profile
+
+# DAG запускается по базовому расписанию раз в MIN_INTERVAL минут, а задача
+# проверки пропускает запуски, пока не прошел выбранный интервал.
+# Данные не должны устаревать больше чем на FRESHNESS_SLA минут
+MIN_INTERVAL = 6
+FRESHNESS_SLA = float(os.environ.get('FRESHNESS_SLA_MINUTES', 60))
+
+# Интервал подбирается так, чтобы за него накапливалось около TARGET_CHANGES
+# новых и обновленных вакансий (по сглаженной скорости изменений)
+TARGET_CHANGES = 100
+SMOOTHING = 0.5
+HISTORY = 10
+
+# Объем обхода (на источник): растет, если изменилась большая доля
+# обойденных вакансий (изменения, вероятно, есть и дальше), и уменьшается,
+# если изменений почти нет
+GROW_FRACTION = 0.5
+SHRINK_FRACTION = 0.1
+MIN_CRAWL = 500
+MAX_CRAWL = 10000
+PAGE_SIZE = 100
+
+# Запуски, часть страниц которых отдана из кэша без запроса, изменений
+# на этих страницах не видят и занижают скорость - они не учитываются
+RUNS_QUERY = """
+    SELECT started_at, max_vacancies, loaded, inserted, updated
+    FROM pipeline_run
+    WHERE profile = %s AND cached_pages = 0
+    ORDER BY started_at DESC
+    LIMIT %s;
+"""
+
+
+def change_rate(runs) -> float:
+    """Сглаженная скорость изменений (вакансий в минуту) по запускам от новых к старым"""
+    rate = None
+    for newer, older in reversed(list(zip(runs, runs[1:]))):
+        minutes = max((newer[0] - older[0]).total_seconds() / 60, 1)
+        observed = (newer[3] + newer[4]) / minutes
+        rate = observed if rate is None else SMOOTHING * observed + (1 - SMOOTHING) * rate
+    return rate
+
+
+def plan_next_run(profile: str = DEFAULT_PROFILE) -> Dict:
+    """Интервал до следующего запуска, объем обхода и due - прошел ли интервал (пока запусков меньше двух - минимальные)"""
+    runs = execute_query(RUNS_QUERY, (profile, HISTORY), fetch=True)
+    max_vacancies = get_profile(profile)['max_vacancies']
+    if not runs:
+        return {'due': True, 'interval': MIN_INTERVAL, 'max_vacancies': max_vacancies, 'change_rate': None}
+
+    rate = change_rate(runs)
+    if rate is None:
+        interval = MIN_INTERVAL
+    elif rate > 0:
+        interval = min(max(TARGET_CHANGES / rate, MIN_INTERVAL), FRESHNESS_SLA)
+    else:
+        interval = FRESHNESS_SLA
+
+    started_at, last_size, loaded, inserted, updated = runs[0]
+    fraction = (inserted + updated) / loaded if loaded else 0
+    size = last_size
+    if fraction >= GROW_FRACTION:
+        size = last_size * 2
+    elif fraction <= SHRINK_FRACTION:
+        size = last_size * 3 // 4
+    size = min(max(size // PAGE_SIZE * PAGE_SIZE, MIN_CRAWL), MAX_CRAWL)
+
+    elapsed = (datetime.now() - started_at).total_seconds() / 60
+    return {
+        'due': elapsed >= interval,
+        'interval': interval,
+        'max_vacancies': size,
+        'change_rate': rate
+    }
+
+
+def should_run(profile: str = DEFAULT_PROFILE) -> bool:
+    """Условие для ShortCircuitOperator: пора ли запускать загрузку"""
+    plan = plan_next_run(profile)
+    rate = f"{plan['change_rate']:.1f} в минуту" if plan['change_rate'] is not None else "неизвестна"
+    print(
+        f"Скорость изменений {rate}, интервал {plan['interval']:.0f} мин, "
+        f"объем обхода {plan['max_vacancies']}: {'запуск' if plan['due'] else 'пропуск'}"
+    )
+    return plan['due']
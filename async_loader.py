@@ -0,0 +1,394 @@
+import asyncio
+import asyncpg
+import pandas as pd
+from datetime import date
+from time import perf_counter
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from database import DB_CONFIG
+from http_fetcher import crawl_pages
+from sources import SourceAdapter, crawl_sources
+from database_operations import (
+    prepare_region_data,
+    prepare_company_data,
+    prepare_vacancy_data,
+    prepare_skill_data
+)
+from skills import skill_cache
+
+# Колонки и типы целевых таблиц (порядок важен для бинарного COPY)
+REGION_COLUMNS = {
+    'region_code': str,
+    'region_name': str,
+    'city': str
+}
+
+COMPANY_COLUMNS = {
+    'company_code': str,
+    'region_code': str,
+    'source': str,
+    'company_email': str,
+    'company_hr_agency': bool,
+    'company_inn': str,
+    'company_kpp': str,
+    'company_name': str,
+    'company_ogrn': str,
+    'company_url': str
+}
+
+VACANCY_COLUMNS = {
+    'id': str,
+    'company_code': str,
+    'salary_min': int,
+    'salary_max': int,
+    'job_name': str,
+    'vac_url': str,
+    'employment': str,
+    'schedule': str,
+    'category_specialisation': str,
+    'requirement_education': str,
+    'requirement_experience': str,
+    'data_hash': str,
+    'created_at': date,
+    'salary_norm_min': Optional[int],
+    'salary_norm_max': Optional[int],
+    'salary_norm_mid': Optional[int],
+    'salary_quality': str
+}
+
+VACANCY_SKILL_COLUMNS = ['vacancy_id', 'skill_id']
+
+STAGE_TABLES = [
+    'CREATE TEMP TABLE region_stage (LIKE region) ON COMMIT DELETE ROWS;',
+    'CREATE TEMP TABLE company_stage (LIKE company) ON COMMIT DELETE ROWS;',
+    'CREATE TEMP TABLE vacancy_stage (LIKE vacancy) ON COMMIT DELETE ROWS;',
+    'CREATE TEMP TABLE vacancy_skill_stage (LIKE vacancy_skill) ON COMMIT DELETE ROWS;'
+]
+
+MERGE_REGIONS = """
+INSERT INTO region (region_code, region_name, city)
+SELECT DISTINCT ON (region_code) region_code, region_name, city
+FROM region_stage
+ON CONFLICT (region_code) DO NOTHING;
+"""
+
+MERGE_COMPANIES = """
+INSERT INTO company (
+    company_code, region_code, source, company_email,
+    company_hr_agency, company_inn, company_kpp,
+    company_name, company_ogrn, company_url
+)
+SELECT DISTINCT ON (company_code)
+    company_code, region_code, source, company_email,
+    company_hr_agency, company_inn, company_kpp,
+    company_name, company_ogrn, company_url
+FROM company_stage
+ON CONFLICT (company_code) DO NOTHING;
+"""
+
+# Возвращает число добавленных и обновленных вакансий
+# (xmax = 0 у строки, вставленной, а не обновленной этим запросом)
+MERGE_VACANCIES = """
+WITH merged AS (
+INSERT INTO vacancy (
+    id, company_code, salary_min, salary_max,
+    job_name, vac_url, employment, schedule,
+    category_specialisation, requirement_education,
+    requirement_experience, data_hash, created_at,
+    salary_norm_min, salary_norm_max, salary_norm_mid, salary_quality
+)
+SELECT DISTINCT ON (id)
+    id, company_code, salary_min, salary_max,
+    job_name, vac_url, employment, schedule,
+    category_specialisation, requirement_education,
+    requirement_experience, data_hash, created_at,
+    salary_norm_min, salary_norm_max, salary_norm_mid, salary_quality
+FROM vacancy_stage
+ON CONFLICT (id) DO {action}
+RETURNING (xmax = 0) AS inserted
+)
+SELECT count(*) FILTER (WHERE inserted) AS inserted,
+       count(*) FILTER (WHERE NOT inserted) AS updated
+FROM merged;
+"""
+
+# При обновлении вакансий их навыки заменяются целиком
+REPLACE_SKILLS = """
+DELETE FROM vacancy_skill
+WHERE vacancy_id IN (SELECT id FROM vacancy_stage);
+"""
+
+MERGE_SKILLS = """
+INSERT INTO vacancy_skill (vacancy_id, skill_id)
+SELECT DISTINCT vacancy_id, skill_id
+FROM vacancy_skill_stage
+ON CONFLICT (vacancy_id, skill_id) DO NOTHING;
+"""
+
+# Отметка загруженных вакансий: источник и проход (crawl_pass) по имени источника
+MERGE_SEEN = """
+INSERT INTO vacancy_seen (id, source, last_seen, last_seen_pass)
+SELECT DISTINCT ON (v.id) v.id, s.source, CURRENT_TIMESTAMP, p.pass_id
+FROM vacancy_stage v
+LEFT JOIN unnest($1::text[], $2::text[]) AS s(id, source) ON s.id = v.id
+LEFT JOIN unnest($3::text[], $4::integer[]) AS p(source, pass_id) ON p.source = s.source
+ORDER BY v.id
+ON CONFLICT (id) DO UPDATE SET
+    last_seen = EXCLUDED.last_seen,
+    source = COALESCE(EXCLUDED.source, vacancy_seen.source),
+    last_seen_pass = GREATEST(vacancy_seen.last_seen_pass, EXCLUDED.last_seen_pass);
+"""
+
+UPDATE_ACTION = """UPDATE SET
+    company_code = EXCLUDED.company_code,
+    salary_min = EXCLUDED.salary_min,
+    salary_max = EXCLUDED.salary_max,
+    job_name = EXCLUDED.job_name,
+    vac_url = EXCLUDED.vac_url,
+    employment = EXCLUDED.employment,
+    schedule = EXCLUDED.schedule,
+    category_specialisation = EXCLUDED.category_specialisation,
+    requirement_education = EXCLUDED.requirement_education,
+    requirement_experience = EXCLUDED.requirement_experience,
+    data_hash = EXCLUDED.data_hash,
+    created_at = COALESCE(vacancy.created_at, EXCLUDED.created_at),
+    salary_norm_min = EXCLUDED.salary_norm_min,
+    salary_norm_max = EXCLUDED.salary_norm_max,
+    salary_norm_mid = EXCLUDED.salary_norm_mid,
+    salary_quality = EXCLUDED.salary_quality,
+    last_updated = CURRENT_TIMESTAMP
+WHERE vacancy.data_hash IS DISTINCT FROM EXCLUDED.data_hash
+   OR (vacancy.created_at IS NULL AND EXCLUDED.created_at IS NOT NULL)"""
+
+
+def get_dsn(db_config: Dict) -> str:
+    """Собирает DSN для asyncpg из словаря в формате DB_CONFIG"""
+    return (
+        f"postgresql://{db_config['user']}:{db_config['password']}"
+        f"@{db_config['host']}:{db_config['port']}/{db_config['dbname']}"
+    )
+
+def to_records(df: pd.DataFrame, columns: Dict[str, type]) -> List[tuple]:
+    """Приводит колонки к типам таблицы и возвращает кортежи для COPY"""
+    data = {}
+    for column, column_type in columns.items():
+        series = df[column]
+        if column_type is int:
+            series = pd.to_numeric(series, errors='coerce').fillna(0).astype(int)
+        elif column_type == Optional[int]:
+            series = series.map(lambda x: None if pd.isna(x) else int(x))
+        elif column_type is bool:
+            series = series.eq(True)
+        elif column_type is date:
+            series = pd.to_datetime(series, errors='coerce')
+            series = series.dt.date.astype(object).where(series.notna(), None)
+        else:
+            series = series.where(series.notna(), None).map(
+                lambda x: x if x is None else str(x)
+            )
+        data[column] = series.tolist()
+    return list(zip(*data.values()))
+
+def seen_records(vacancies: List[Dict]) -> List[tuple]:
+    """(id, источник) вакансий страницы для vacancy_seen"""
+    return [(item['vacancy'].get('id'), item.get('source_name')) for item in vacancies]
+
+def new_buffer() -> Dict[str, List[tuple]]:
+    """Пустой буфер записей загрузки"""
+    return {'region': [], 'company': [], 'vacancy': [], 'skill': [], 'seen': []}
+
+def split_frames(processed_df: pd.DataFrame) -> Dict[str, List[tuple]]:
+    """Готовит записи регионов, компаний и вакансий для загрузки"""
+    if processed_df.empty:
+        # Вся страница ушла в карантин
+        return {'region': [], 'company': [], 'vacancy': [], 'skill': []}
+    df_region = prepare_region_data(processed_df).rename(columns={
+        'код региона': 'region_code',
+        'название': 'region_name',
+        'город': 'city'
+    })
+    return {
+        'region': to_records(df_region, REGION_COLUMNS),
+        'company': to_records(prepare_company_data(processed_df), COMPANY_COLUMNS),
+        'vacancy': to_records(prepare_vacancy_data(processed_df), VACANCY_COLUMNS),
+        # id навыков подставляются при записи (см. flush)
+        'skill': list(prepare_skill_data(processed_df).itertuples(index=False, name=None))
+    }
+
+async def harvest(
+    queue: asyncio.Queue,
+    pages: Iterator[List[Dict]],
+    stats: Dict
+):
+    """Производитель: скачивает страницы API в ограниченную очередь (при медленной загрузке сбор притормаживает)"""
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            started = perf_counter()
+            vacancies = await loop.run_in_executor(None, next, pages, None)
+            stats['fetch_seconds'] += perf_counter() - started
+            if vacancies is None:
+                break
+            stats['fetched'] += len(vacancies)
+            await queue.put(vacancies)
+            print(f"Собрано {stats['fetched']} вакансий...")
+    finally:
+        await queue.put(None)
+
+async def flush(
+    conn: asyncpg.Connection,
+    buffer: Dict[str, List[tuple]],
+    merge_vacancies: str,
+    update_existing: bool,
+    passes: Optional[Dict[str, int]] = None,
+    dry_run: bool = False
+) -> Tuple[int, int]:
+    """Загружает буфер одной транзакцией через бинарный COPY (dry_run - с откатом), возвращает число добавленных и обновленных"""
+    # Навыки переводятся в id до транзакции: новые навыки фиксируются сразу,
+    # поэтому кэш id не разойдется с БД при откате загрузки
+    skill_ids = await skill_cache.resolve(conn, [skill for _, skill in buffer['skill']])
+    vacancy_skills = [(vacancy_id, skill_ids[skill]) for vacancy_id, skill in buffer['skill']]
+
+    transaction = conn.transaction()
+    await transaction.start()
+    try:
+        await conn.copy_records_to_table(
+            'region_stage', records=buffer['region'], columns=list(REGION_COLUMNS)
+        )
+        await conn.copy_records_to_table(
+            'company_stage', records=buffer['company'], columns=list(COMPANY_COLUMNS)
+        )
+        await conn.copy_records_to_table(
+            'vacancy_stage', records=buffer['vacancy'], columns=list(VACANCY_COLUMNS)
+        )
+        await conn.copy_records_to_table(
+            'vacancy_skill_stage', records=vacancy_skills, columns=VACANCY_SKILL_COLUMNS
+        )
+        await conn.execute(MERGE_REGIONS)
+        await conn.execute(MERGE_COMPANIES)
+        merged = await conn.fetchrow(merge_vacancies)
+        if update_existing:
+            await conn.execute(REPLACE_SKILLS)
+        await conn.execute(MERGE_SKILLS)
+        passes = passes or {}
+        await conn.execute(
+            MERGE_SEEN,
+            [vacancy_id for vacancy_id, _ in buffer['seen']],
+            [source for _, source in buffer['seen']],
+            list(passes), list(passes.values())
+        )
+    except BaseException:
+        await transaction.rollback()
+        raise
+    if dry_run:
+        await transaction.rollback()
+    else:
+        await transaction.commit()
+    return merged['inserted'], merged['updated']
+
+async def load(
+    queue: asyncio.Queue,
+    prepare: Callable[[pd.DataFrame], pd.DataFrame],
+    db_config: Dict,
+    commit_size: int,
+    update_existing: bool,
+    stats: Dict,
+    passes: Optional[Dict[str, int]] = None,
+    dry_run: bool = False
+):
+    """Потребитель: обрабатывает страницы и пишет их в БД пачками по commit_size"""
+    loop = asyncio.get_running_loop()
+    merge_vacancies = MERGE_VACANCIES.format(
+        action=UPDATE_ACTION if update_existing else 'NOTHING'
+    )
+    conn = await asyncpg.connect(get_dsn(db_config))
+    try:
+        for query in STAGE_TABLES:
+            await conn.execute(query)
+
+        buffer = new_buffer()
+        while True:
+            vacancies = await queue.get()
+            if vacancies is not None:
+                # Обработка (NLP) тяжелая, поэтому уводим ее из цикла событий
+                started = perf_counter()
+                records = await loop.run_in_executor(
+                    None, lambda: split_frames(prepare(pd.DataFrame(vacancies)))
+                )
+                stats['prepare_seconds'] += perf_counter() - started
+                for table, rows in records.items():
+                    buffer[table].extend(rows)
+                buffer['seen'].extend(seen_records(vacancies))
+
+            if buffer['vacancy'] and (vacancies is None or len(buffer['vacancy']) >= commit_size):
+                started = perf_counter()
+                inserted, updated = await flush(
+                    conn, buffer, merge_vacancies, update_existing, passes, dry_run
+                )
+                stats['inserted'] += inserted
+                stats['updated'] += updated
+                stats['written'] += inserted + updated
+                stats['loaded'] += len(buffer['vacancy'])
+                stats['load_seconds'] += perf_counter() - started
+                buffer = new_buffer()
+                print(f"Загружено {stats['loaded']} вакансий")
+
+            if vacancies is None:
+                break
+    finally:
+        await conn.close()
+
+async def run_pipeline_async(
+    fetch_page: Optional[Callable[[int, int], List[Dict]]],
+    prepare: Callable[[pd.DataFrame], pd.DataFrame],
+    max_vacancies: int = 2000,
+    batch_size: int = 100,
+    queue_size: int = 5,
+    commit_size: int = 500,
+    update_existing: bool = False,
+    delay: float = 1.0,
+    db_config: Optional[Dict] = None,
+    sources: Optional[List[SourceAdapter]] = None,
+    passes: Optional[Dict[str, int]] = None,
+    dry_run: bool = False
+) -> Dict:
+    """Параллельно собирает вакансии из fetch_page или источников sources и загружает их в БД"""
+    stats = {
+        'fetched': 0, 'loaded': 0, 'written': 0, 'inserted': 0, 'updated': 0,
+        'fetch_seconds': 0.0, 'prepare_seconds': 0.0, 'load_seconds': 0.0, 'total_seconds': 0.0,
+        'sources': [adapter.name for adapter in sources or []], 'complete_sources': []
+    }
+    queue = asyncio.Queue(maxsize=queue_size)
+    started = perf_counter()
+    complete = set()
+    if sources:
+        pages = crawl_sources(sources, max_vacancies, complete=complete)
+    else:
+        pages = crawl_pages(fetch_page, max_vacancies, batch_size=batch_size, delay=delay)
+    producer = asyncio.ensure_future(harvest(queue, pages, stats))
+    consumer = asyncio.ensure_future(
+        load(queue, prepare, db_config or DB_CONFIG, commit_size, update_existing, stats, passes, dry_run)
+    )
+    await asyncio.wait([producer, consumer], return_when=asyncio.FIRST_EXCEPTION)
+    if consumer.done() and consumer.exception():
+        # Загрузка упала: не оставляем сбор висеть на заполненной очереди
+        producer.cancel()
+        raise consumer.exception()
+    # Сбор завершился (успешно или нет) и положил в очередь маркер конца:
+    # дожидаемся записи уже собранных страниц, затем пробрасываем ошибку сбора
+    await consumer
+    if producer.exception():
+        raise producer.exception()
+    stats['complete_sources'] = sorted(complete)
+    stats['total_seconds'] = perf_counter() - started
+    return stats
+
+def run_pipeline(*args, **kwargs) -> Dict:
+    """Синхронная обертка над run_pipeline_async"""
+    stats = asyncio.run(run_pipeline_async(*args, **kwargs))
+    print(
+        f"Собрано {stats['fetched']}, загружено {stats['loaded']} вакансий "
+        f"(новых {stats['inserted']}, обновлено {stats['updated']}) за {stats['total_seconds']:.1f} с "
+        f"(сбор {stats['fetch_seconds']:.1f} с, обработка {stats['prepare_seconds']:.1f} с, "
+        f"загрузка {stats['load_seconds']:.1f} с)"
+    )
+    return stats
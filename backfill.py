@@ -0,0 +1,372 @@
+import argparse
+import asyncio
+import multiprocessing
+import multiprocessing.connection
+import os
+import socket
+import asyncpg
+import pandas as pd
+from datetime import datetime
+from functools import partial
+from time import monotonic
+from typing import Callable, Dict, List, Optional
+from psycopg2.extras import execute_values
+from database import DB_CONFIG, execute_query, get_db_connection
+from http_fetcher import CircuitOpenError
+from async_loader import (
+    MERGE_VACANCIES, STAGE_TABLES, UPDATE_ACTION, flush, get_dsn, new_buffer, seen_records, split_frames
+)
+from pipeline import get_profile
+from skills import skill_cache
+from sources import DEFAULT_SOURCES, SourceAdapter, get_sources
+from vacancy_expiry import START_PASS_QUERY
+from vacancy_processor import prepare_vacancies
+
+# Часть (unit) - диапазон смещений одного источника, загружаемый одной транзакцией
+# вместе с отметкой о выполнении. Размер части - commit_size профиля backfill
+PROFILE = 'backfill'
+
+# Часть, взятая упавшим обработчиком, снова выдается после LEASE без отметок
+# (обработчик отмечается после каждой страницы и перед записью части)
+LEASE = '5 minutes'
+
+# Столько раз часть берется в работу, прежде чем остаться в статусе failed
+MAX_ATTEMPTS = 3
+
+# Период печати прогресса, секунд
+PROGRESS_INTERVAL = 30
+
+CLAIM_QUERY = f"""
+UPDATE backfill_job SET
+    status = 'running',
+    worker = $1,
+    claimed_at = now(),
+    attempts = attempts + 1,
+    error = NULL
+WHERE job_id = (
+    SELECT job_id FROM backfill_job
+    WHERE source = ANY($2::text[])
+      AND (
+          status = 'pending'
+          OR (status = 'running' AND claimed_at < now() - interval '{LEASE}')
+          OR (status = 'failed' AND attempts < {MAX_ATTEMPTS})
+      )
+    ORDER BY job_id
+    LIMIT 1
+    FOR UPDATE SKIP LOCKED
+)
+RETURNING job_id, source, offset_from, offset_to, pass_id, claimed_at;
+"""
+
+# Запросы ниже меняют часть, только пока ее аренда (worker, claimed_at)
+# принадлежит этому обработчику
+HEARTBEAT_QUERY = """
+UPDATE backfill_job SET claimed_at = now()
+WHERE job_id = $1 AND worker = $2 AND claimed_at = $3
+RETURNING claimed_at;
+"""
+
+COMPLETE_QUERY = """
+UPDATE backfill_job SET status = 'done', finished_at = now(), vacancies = $4
+WHERE job_id = $1 AND worker = $2 AND claimed_at = $3
+RETURNING job_id;
+"""
+
+FAIL_QUERY = """
+UPDATE backfill_job SET status = 'failed', error = $4
+WHERE job_id = $1 AND worker = $2 AND claimed_at = $3;
+"""
+
+# Части, исчерпавшие MAX_ATTEMPTS, снова выдаются только после сброса попыток
+RETRY_FAILED_QUERY = """
+UPDATE backfill_job SET status = 'pending', attempts = 0
+WHERE status = 'failed' AND source = ANY(%s);
+"""
+
+# Источник недоступен (предохранитель) - часть возвращается без траты попытки
+RELEASE_QUERY = """
+UPDATE backfill_job SET status = 'pending', attempts = attempts - 1
+WHERE job_id = $1 AND worker = $2 AND claimed_at = $3;
+"""
+
+PROGRESS_QUERY = """
+SELECT status, count(*), COALESCE(sum(vacancies), 0), COALESCE(sum(offset_to - offset_from), 0)
+FROM backfill_job
+GROUP BY status;
+"""
+
+# Незавершенный проход догрузки источника: его части продолжаются
+OPEN_PASS_QUERY = """
+SELECT pass_id FROM crawl_pass
+WHERE source = %s AND profile = %s AND finished_at IS NULL
+ORDER BY pass_id DESC
+LIMIT 1;
+"""
+
+# Проход завершен полностью, когда выполнены все его части
+FINISH_PASS_QUERY = """
+UPDATE crawl_pass p SET finished_at = now(), complete = TRUE
+FROM (
+    SELECT pass_id FROM backfill_job
+    WHERE source = ANY(%s)
+    GROUP BY pass_id
+    HAVING bool_and(status = 'done')
+) j
+WHERE p.pass_id = j.pass_id AND p.finished_at IS NULL
+RETURNING p.source;
+"""
+
+
+TABLES = [
+    # Части полной догрузки: диапазон смещений источника,
+    # статус pending/running/done/failed и кто и когда взял часть в работу
+    '''CREATE TABLE IF NOT EXISTS backfill_job (
+        job_id SERIAL PRIMARY KEY,
+        source VARCHAR(50) NOT NULL,
+        offset_from INTEGER NOT NULL,
+        offset_to INTEGER NOT NULL,
+        status VARCHAR(10) NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        worker VARCHAR(100),
+        claimed_at TIMESTAMP,
+        finished_at TIMESTAMP,
+        vacancies INTEGER,
+        error TEXT,
+        UNIQUE (source, offset_from)
+    );''',
+    '''CREATE INDEX IF NOT EXISTS idx_backfill_job_status
+        ON backfill_job (status, job_id);''',
+    # Проход догрузки, к которому относится часть (crawl_pass)
+    '''ALTER TABLE backfill_job ADD COLUMN IF NOT EXISTS pass_id INTEGER;'''
+]
+
+
+class LeaseLostError(Exception):
+    """Аренда части истекла, и часть взял другой обработчик"""
+
+
+def plan_backfill(source_names: Optional[List[str]] = None, unit_size: Optional[int] = None) -> int:
+    """Разбивает каталоги источников на части текущего прохода в backfill_job, возвращает число добавленных частей"""
+    unit_size = unit_size or get_profile(PROFILE)['commit_size']
+    added = 0
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            for adapter in get_sources(source_names):
+                total = adapter.total()
+                cursor.execute(OPEN_PASS_QUERY, (adapter.name, PROFILE))
+                row = cursor.fetchone()
+                if row:
+                    pass_id = row[0]
+                else:
+                    cursor.execute(START_PASS_QUERY, (adapter.name, PROFILE))
+                    pass_id = cursor.fetchone()[0]
+                    cursor.execute("DELETE FROM backfill_job WHERE source = %s;", (adapter.name,))
+                    print(f"Источник {adapter.name}: новый проход {pass_id}")
+                # Часть - целое число страниц источника
+                size = max(unit_size // adapter.page_size, 1) * adapter.page_size
+                units = [
+                    (adapter.name, offset, min(offset + size, total), pass_id)
+                    for offset in range(0, total, size)
+                ]
+                added += len(execute_values(cursor, """
+                    INSERT INTO backfill_job (source, offset_from, offset_to, pass_id)
+                    VALUES %s
+                    ON CONFLICT (source, offset_from) DO NOTHING
+                    RETURNING job_id;
+                """, units, fetch=True)) if units else 0
+                print(f"Источник {adapter.name}: {total} вакансий, частей по {size}: {len(units)}")
+            conn.commit()
+    print(f"Добавлено частей: {added}")
+    return added
+
+
+async def heartbeat(conn: asyncpg.Connection, job: Dict, worker: str) -> datetime:
+    """Продлевает аренду части и возвращает новый claimed_at, LeaseLostError - если аренда уже чужая"""
+    claimed_at = await conn.fetchval(HEARTBEAT_QUERY, job['job_id'], worker, job['claimed_at'])
+    if claimed_at is None:
+        raise LeaseLostError(f"Часть {job['job_id']} взята другим обработчиком")
+    return claimed_at
+
+
+async def load_unit(
+    conn: asyncpg.Connection,
+    adapter: SourceAdapter,
+    job: Dict,
+    worker: str,
+    prepare: Callable[[pd.DataFrame], pd.DataFrame],
+    merge_vacancies: str,
+    update_existing: bool
+) -> int:
+    """Скачивает страницы части и загружает их одной транзакцией вместе с отметкой done"""
+    buffer = new_buffer()
+    for offset in range(job['offset_from'], job['offset_to'], adapter.page_size):
+        page = adapter.fetch_page(offset, adapter.page_size)
+        if not page:
+            break
+        for table, rows in split_frames(prepare(pd.DataFrame(page))).items():
+            buffer[table].extend(rows)
+        buffer['seen'].extend(seen_records(page))
+        job['claimed_at'] = await heartbeat(conn, job, worker)
+        await asyncio.sleep(1.0 / adapter.rate_limit)
+
+    # Навыки переводятся в id до транзакции части (см. flush)
+    await skill_cache.resolve(conn, [skill for _, skill in buffer['skill']])
+    async with conn.transaction():
+        # Продленная аренда держит строку части заблокированной до фиксации,
+        # поэтому CLAIM_QUERY не выдаст ее другому обработчику во время записи
+        claimed_at = await heartbeat(conn, job, worker)
+        if buffer['vacancy']:
+            await flush(conn, buffer, merge_vacancies, update_existing, {adapter.name: job['pass_id']})
+        completed = await conn.fetchval(
+            COMPLETE_QUERY, job['job_id'], worker, claimed_at, len(buffer['vacancy'])
+        )
+        if completed is None:
+            raise LeaseLostError(f"Часть {job['job_id']} взята другим обработчиком")
+    return len(buffer['vacancy'])
+
+
+async def work_async(source_names: Optional[List[str]], rate_limit: float, db_config: Dict):
+    """Обработчик: берет свободные части, пока они есть"""
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    settings = get_profile(PROFILE)
+    prepare = partial(prepare_vacancies, nlp=settings['nlp'])
+    merge_vacancies = MERGE_VACANCIES.format(
+        action=UPDATE_ACTION if settings['update_existing'] else 'NOTHING'
+    )
+    adapters = {adapter.name: adapter for adapter in get_sources(source_names, rate_limit=rate_limit)}
+
+    conn = await asyncpg.connect(get_dsn(db_config))
+    try:
+        for query in STAGE_TABLES:
+            await conn.execute(query)
+        while True:
+            row = await conn.fetchrow(CLAIM_QUERY, worker, list(adapters))
+            if row is None:
+                break
+            job = dict(row)
+            adapter = adapters[job['source']]
+            try:
+                loaded = await load_unit(
+                    conn, adapter, job, worker, prepare, merge_vacancies, settings['update_existing']
+                )
+                print(f"[{worker}] {job['source']} {job['offset_from']}-{job['offset_to']}: {loaded} вакансий")
+            except LeaseLostError as e:
+                print(f"[{worker}] {e}")
+            except CircuitOpenError:
+                await conn.execute(RELEASE_QUERY, job['job_id'], worker, job['claimed_at'])
+                await asyncio.sleep(adapter.http.breaker.remaining())
+            except Exception as e:
+                print(f"[{worker}] Часть {job['job_id']} не загружена: {e}")
+                await conn.execute(FAIL_QUERY, job['job_id'], worker, job['claimed_at'], str(e))
+    finally:
+        await conn.close()
+
+
+def work(source_names: Optional[List[str]], rate_limit: float, db_config: Dict):
+    """Точка входа процесса-обработчика"""
+    asyncio.run(work_async(source_names, rate_limit, db_config))
+
+
+def get_progress() -> Dict[str, Dict]:
+    """Части, вакансии и смещения по статусам"""
+    return {
+        status: {'units': units, 'vacancies': vacancies, 'offsets': offsets}
+        for status, units, vacancies, offsets in execute_query(PROGRESS_QUERY, fetch=True)
+    }
+
+
+def report_progress(started_at: float, done_at_start: int):
+    """Печатает прогресс и оценку оставшегося времени по скорости текущего запуска"""
+    progress = get_progress()
+    empty = {'units': 0, 'vacancies': 0, 'offsets': 0}
+    done = progress.get('done', empty)
+    total_offsets = sum(item['offsets'] for item in progress.values())
+    left_offsets = total_offsets - done['offsets']
+    rate = (done['offsets'] - done_at_start) / max(monotonic() - started_at, 1e-9)
+    eta = f"~{left_offsets / rate / 60:.0f} мин" if rate > 0 else "неизвестно"
+    print(
+        f"Догрузка: {done['units']}/{sum(item['units'] for item in progress.values())} частей "
+        f"({done['offsets'] / max(total_offsets, 1):.0%}), {done['vacancies']} вакансий, "
+        f"в работе {progress.get('running', empty)['units']}, "
+        f"с ошибкой {progress.get('failed', empty)['units']}, осталось {eta}"
+    )
+
+
+def finish_passes(source_names: List[str]) -> List[str]:
+    """Завершает проходы, все части которых выполнены; возвращает их источники"""
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(FINISH_PASS_QUERY, (source_names,))
+            finished = [source for (source,) in cursor.fetchall()]
+            conn.commit()
+    if finished:
+        print(f"Проход догрузки завершен полностью: {', '.join(finished)}")
+    return finished
+
+
+def run_backfill(
+    workers: int = 4,
+    source_names: Optional[List[str]] = None,
+    unit_size: Optional[int] = None,
+    rate_limit: float = 1.0,
+    retry_failed: bool = False
+) -> Dict[str, Dict]:
+    """Полная догрузка каталогов источников несколькими процессами с продолжением после прерывания"""
+    source_names = source_names or get_profile(PROFILE)['sources'] or DEFAULT_SOURCES
+    plan_backfill(source_names, unit_size)
+    if retry_failed:
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(RETRY_FAILED_QUERY, (source_names,))
+                print(f"Попытки сброшены у {cursor.rowcount} частей с ошибкой")
+                conn.commit()
+    done_at_start = get_progress().get('done', {'offsets': 0})['offsets']
+    started_at = monotonic()
+
+    # Обработчики запускаются через spawn: при fork они унаследовали бы
+    # HTTP-сессию (открытые keep-alive сокеты) и предохранитель, которые
+    # plan_backfill уже использовал в этом процессе
+    context = multiprocessing.get_context('spawn')
+    processes = [
+        context.Process(
+            target=work,
+            args=(source_names, rate_limit / workers, DB_CONFIG),
+            name=f"backfill-{i}"
+        )
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    # Прогресс печатается раз в PROGRESS_INTERVAL и при завершении каждого процесса
+    running = list(processes)
+    while running:
+        multiprocessing.connection.wait([process.sentinel for process in running], timeout=PROGRESS_INTERVAL)
+        running = [process for process in running if process.is_alive()]
+        report_progress(started_at, done_at_start)
+
+    progress = get_progress()
+    finish_passes(source_names)
+    if progress.get('failed'):
+        print(
+            f"Часть частей не загружена (причины - в backfill_job.error): части, исчерпавшие "
+            f"{MAX_ATTEMPTS} попытки, загрузит только запуск с --retry-failed"
+        )
+    print(f"Догрузка завершена {datetime.now():%Y-%m-%d %H:%M:%S}")
+    return progress
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Полная догрузка каталогов вакансий")
+    parser.add_argument('--workers', type=int, default=4, help="число процессов-обработчиков")
+    parser.add_argument('--sources', help="источники через запятую (по умолчанию - профиля backfill)")
+    parser.add_argument('--unit-size', type=int, help="вакансий в одной части")
+    parser.add_argument('--rate-limit', type=float, default=1.0, help="запросов в секунду к источнику")
+    parser.add_argument('--retry-failed', action='store_true', help="снова загрузить части, исчерпавшие попытки")
+    args = parser.parse_args()
+    run_backfill(
+        workers=args.workers,
+        source_names=args.sources.split(',') if args.sources else None,
+        unit_size=args.unit_size,
+        rate_limit=args.rate_limit,
+        retry_failed=args.retry_failed
+    )
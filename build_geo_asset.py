@@ -0,0 +1,103 @@
+import json
+import os
+import re
+import sys
+import numpy as np
+import requests
+from typing import Dict, List
+from geo import ASSET_PATH, REGION_NAMES
+
+# Исходная карта регионов (GeoJSON с названиями субъектов в properties.name)
+SOURCE_URL = "https://raw.githubusercontent.com/codeforamerica/click_that_hood/master/public/data/russia.geojson"
+
+# Допуск упрощения геометрии (в градусах) и точность координат
+SIMPLIFY_TOLERANCE = 0.02
+COORD_PRECISION = 3
+
+# Служебные слова, которые по-разному пишутся в разных источниках
+NAME_STOP_WORDS = {
+    'республика', 'область', 'обл', 'край', 'автономный', 'автономная',
+    'округ', 'ао', 'город', 'г', 'федерального', 'значения', 'югра', 'алания'
+}
+
+def normalize_region_name(name: str) -> str:
+    """Приводит название региона к виду для сопоставления между источниками"""
+    words = re.findall(r'[а-яa-z]+', name.lower().replace('ё', 'е'))
+    return ' '.join(word for word in words if word not in NAME_STOP_WORDS)
+
+def simplify_line(points: np.ndarray, tolerance: float) -> np.ndarray:
+    """Упрощает ломаную алгоритмом Дугласа-Пекера"""
+    if len(points) < 3:
+        return points
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        segment = points[end] - points[start]
+        inner = points[start + 1:end] - points[start]
+        length = np.hypot(*segment)
+        if length == 0:
+            distances = np.hypot(inner[:, 0], inner[:, 1])
+        else:
+            distances = np.abs(segment[0] * inner[:, 1] - segment[1] * inner[:, 0]) / length
+        index = int(np.argmax(distances))
+        if distances[index] > tolerance:
+            middle = start + 1 + index
+            keep[middle] = True
+            stack.extend([(start, middle), (middle, end)])
+    return points[keep]
+
+def simplify_polygon(rings: List, tolerance: float) -> List:
+    """Упрощает кольца полигона, отбрасывая выродившиеся"""
+    simplified = []
+    for ring in rings:
+        points = simplify_line(np.asarray(ring, dtype=float)[:, :2], tolerance)
+        if len(points) >= 4:
+            simplified.append(np.round(points, COORD_PRECISION).tolist())
+    return simplified
+
+def build_region_geojson(source: Dict, tolerance: float = SIMPLIFY_TOLERANCE) -> Dict:
+    """Строит упрощенную карту с id признаков = код субъекта РФ"""
+    codes_by_name = {normalize_region_name(name): code for code, name in REGION_NAMES.items()}
+    features = []
+    for feature in source['features']:
+        code = codes_by_name.get(normalize_region_name(feature['properties'].get('name', '')))
+        if code is None:
+            print(f"Регион не сопоставлен: {feature['properties'].get('name')}")
+            continue
+        geometry = feature['geometry']
+        if geometry['type'] == 'Polygon':
+            polygons = [simplify_polygon(geometry['coordinates'], tolerance)]
+        else:
+            polygons = [simplify_polygon(rings, tolerance) for rings in geometry['coordinates']]
+        polygons = [rings for rings in polygons if rings]
+        features.append({
+            'type': 'Feature',
+            'id': code,
+            'properties': {'code': code, 'name': REGION_NAMES[code]},
+            'geometry': {'type': 'MultiPolygon', 'coordinates': polygons}
+        })
+    return {'type': 'FeatureCollection', 'features': features}
+
+def build_asset(source: str = SOURCE_URL, path: str = ASSET_PATH) -> Dict:
+    """Скачивает (или читает) исходную карту, упрощает и сохраняет локально"""
+    if os.path.exists(source):
+        with open(source, encoding='utf-8') as f:
+            source_geojson = json.load(f)
+    else:
+        response = requests.get(source, timeout=60)
+        response.raise_for_status()
+        source_geojson = response.json()
+
+    geojson = build_region_geojson(source_geojson)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(geojson, f, ensure_ascii=False, separators=(',', ':'))
+    print(f"Карта сохранена в {path}: {len(geojson['features'])} регионов")
+    return geojson
+
+if __name__ == "__main__":
+    build_asset(*sys.argv[1:2])
@@ -0,0 +1,217 @@
+import pandas as pd
+from datetime import date
+from typing import Optional, Tuple
+from database import execute_query, get_db_connection
+
+# Колонки, которые отдает get_changes_since
+CHANGE_COLUMNS = [
+    'change_id', 'vacancy_id', 'operation', 'old_hash',
+    'new_hash', 'changed_fields', 'changed_at', 'txid'
+]
+
+# Начальный водяной знак: "с самого начала журнала"
+INITIAL_WATERMARK = (0, 0)
+
+# Транзакции с txid ниже xmin снимка уже завершены: их записи в журнале
+# видны целиком, и новых записей с меньшим txid больше не появится
+SNAPSHOT_XMIN_SQL = "txid_snapshot_xmin(txid_current_snapshot())"
+
+TABLES = [
+    # Журнал изменений вакансий (только добавление), секционирован по месяцам.
+    # operation: I - вставка, U - изменение, D - удаление (пишет триггер),
+    # N - пересчет нормализованной зарплаты (пишет refresh_salary_bounds)
+    '''CREATE TABLE IF NOT EXISTS vacancy_changes (
+        change_id BIGSERIAL,
+        vacancy_id VARCHAR(36) NOT NULL,
+        operation CHAR(1) NOT NULL,
+        old_hash VARCHAR(32),
+        new_hash VARCHAR(32),
+        changed_fields TEXT[],
+        changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        txid BIGINT NOT NULL DEFAULT txid_current(),
+        PRIMARY KEY (changed_at, change_id)
+    ) PARTITION BY RANGE (changed_at);''',
+    '''CREATE TABLE IF NOT EXISTS vacancy_changes_default
+        PARTITION OF vacancy_changes DEFAULT;''',
+    '''CREATE INDEX IF NOT EXISTS idx_vacancy_changes_vacancy_id
+        ON vacancy_changes (vacancy_id);''',
+    # Журнал, созданный до колонки txid: старым записям достается txid миграции
+    '''ALTER TABLE vacancy_changes
+        ADD COLUMN IF NOT EXISTS txid BIGINT NOT NULL DEFAULT txid_current();''',
+    '''CREATE INDEX IF NOT EXISTS idx_vacancy_changes_txid
+        ON vacancy_changes (txid, change_id);''',
+    # Запись в журнал выполняется триггером, поэтому ее не обойти
+    # ни одним из путей загрузки (insert/update_vacancies_batch, async_loader)
+    '''CREATE OR REPLACE FUNCTION log_vacancy_change() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            INSERT INTO vacancy_changes (vacancy_id, operation, old_hash, new_hash)
+            VALUES (NEW.id, 'I', NULL, NEW.data_hash);
+        ELSIF TG_OP = 'UPDATE' THEN
+            INSERT INTO vacancy_changes (vacancy_id, operation, old_hash, new_hash, changed_fields)
+            SELECT NEW.id, 'U', OLD.data_hash, NEW.data_hash, array_agg(n.key ORDER BY n.key)
+            FROM jsonb_each(to_jsonb(NEW)) n
+            JOIN jsonb_each(to_jsonb(OLD)) o ON o.key = n.key
+            WHERE n.value IS DISTINCT FROM o.value
+              AND n.key NOT IN ('last_updated', 'data_hash', 'search_vector');
+        ELSE
+            INSERT INTO vacancy_changes (vacancy_id, operation, old_hash, new_hash)
+            VALUES (OLD.id, 'D', OLD.data_hash, NULL);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;''',
+    '''DROP TRIGGER IF EXISTS vacancy_changes_insert_delete ON vacancy;
+    CREATE TRIGGER vacancy_changes_insert_delete
+        AFTER INSERT OR DELETE ON vacancy
+        FOR EACH ROW EXECUTE FUNCTION log_vacancy_change();''',
+    '''DROP TRIGGER IF EXISTS vacancy_changes_update ON vacancy;
+    CREATE TRIGGER vacancy_changes_update
+        AFTER UPDATE ON vacancy
+        FOR EACH ROW
+        WHEN (OLD.data_hash IS DISTINCT FROM NEW.data_hash)
+        EXECUTE FUNCTION log_vacancy_change();''',
+    # Водяные знаки потребителей журнала изменений
+    '''CREATE TABLE IF NOT EXISTS etl_watermark (
+        name VARCHAR(50) PRIMARY KEY,
+        txid BIGINT NOT NULL,
+        change_id BIGINT NOT NULL
+    );''',
+    # Водяные знаки по changed_at сбрасываются: потребители один раз пересчитают все
+    '''ALTER TABLE etl_watermark
+        DROP COLUMN IF EXISTS changed_at,
+        ADD COLUMN IF NOT EXISTS txid BIGINT;''',
+    '''DELETE FROM etl_watermark WHERE txid IS NULL;''',
+    '''ALTER TABLE etl_watermark ALTER COLUMN txid SET NOT NULL;'''
+]
+
+def add_months(month_start: date, months: int) -> date:
+    """Сдвигает первое число месяца на заданное число месяцев"""
+    month_index = month_start.year * 12 + month_start.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+def ensure_change_partitions(months_ahead: int = 1):
+    """Создает месячные секции журнала изменений на текущий и будущие месяцы"""
+    current = date.today().replace(day=1)
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            for i in range(months_ahead + 1):
+                start = add_months(current, i)
+                end = add_months(start, 1)
+                name = f"vacancy_changes_{start:%Y_%m}"
+                cursor.execute("SELECT to_regclass(%s);", (name,))
+                if cursor.fetchone()[0] is None:
+                    # Строки месяца, попавшие в секцию по умолчанию, переносятся
+                    # в новую секцию до ее подключения, иначе ATTACH не пройдет
+                    cursor.execute(f"""
+                        LOCK TABLE vacancy_changes_default IN ACCESS EXCLUSIVE MODE;
+                        CREATE TABLE {name}
+                            (LIKE vacancy_changes INCLUDING DEFAULTS INCLUDING CONSTRAINTS);
+                        WITH moved AS (
+                            DELETE FROM vacancy_changes_default
+                            WHERE changed_at >= '{start}' AND changed_at < '{end}'
+                            RETURNING *
+                        )
+                        INSERT INTO {name} SELECT * FROM moved;
+                        ALTER TABLE vacancy_changes ATTACH PARTITION {name}
+                            FOR VALUES FROM ('{start}') TO ('{end}');
+                    """)
+                conn.commit()
+
+def drop_expired_change_partitions(retention_months: int = 3):
+    """Удаляет секции журнала старше срока хранения и такие же строки секции по умолчанию"""
+    cutoff = add_months(date.today().replace(day=1), -retention_months)
+    partitions = execute_query("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = 'vacancy_changes'
+          AND c.relname ~ '^vacancy_changes_[0-9]{4}_[0-9]{2}$';
+    """, fetch=True)
+
+    dropped = 0
+    for (name,) in partitions:
+        year, month = map(int, name.rsplit('_', 2)[1:])
+        if add_months(date(year, month, 1), 1) <= cutoff:
+            execute_query(f"DROP TABLE IF EXISTS {name};")
+            dropped += 1
+    execute_query(
+        "DELETE FROM vacancy_changes_default WHERE changed_at < %s;", (cutoff,)
+    )
+    print(f"Удалено {dropped} устаревших секций журнала изменений")
+
+def get_changes_since(
+    watermark: Optional[Tuple[int, int]] = None,
+    limit: int = 10000
+) -> Tuple[pd.DataFrame, Tuple[int, int]]:
+    """Изменения после водяного знака (txid, change_id) из завершенных транзакций и новый водяной знак"""
+    txid, change_id = watermark or INITIAL_WATERMARK
+    rows = execute_query(f"""
+        SELECT change_id, vacancy_id, operation, old_hash,
+               new_hash, changed_fields, changed_at, txid
+        FROM vacancy_changes
+        WHERE (txid, change_id) > (%s, %s)
+          AND txid < {SNAPSHOT_XMIN_SQL}
+        ORDER BY txid, change_id
+        LIMIT %s;
+    """, (txid, change_id, limit), fetch=True)
+
+    df_changes = pd.DataFrame(rows, columns=CHANGE_COLUMNS)
+    if df_changes.empty:
+        return df_changes, (txid, change_id)
+
+    last = df_changes.iloc[-1]
+    return df_changes, (int(last['txid']), int(last['change_id']))
+
+def get_changes_start(watermark: Tuple[int, int]) -> Optional[date]:
+    """Самый ранний день изменений после водяного знака (None, если изменений нет)"""
+    rows = execute_query(f"""
+        SELECT min(changed_at)::date
+        FROM vacancy_changes
+        WHERE (txid, change_id) > (%s, %s)
+          AND txid < {SNAPSHOT_XMIN_SQL};
+    """, watermark, fetch=True)
+    return rows[0][0]
+
+def load_watermark(name: str) -> Optional[Tuple[int, int]]:
+    """Читает сохраненный водяной знак потребителя журнала"""
+    rows = execute_query(
+        "SELECT txid, change_id FROM etl_watermark WHERE name = %s;",
+        (name,), fetch=True
+    )
+    return (rows[0][0], rows[0][1]) if rows else None
+
+def save_watermark(name: str, watermark: Tuple[int, int]):
+    """Сохраняет водяной знак потребителя журнала"""
+    execute_query("""
+        INSERT INTO etl_watermark (name, txid, change_id)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (name) DO UPDATE SET
+            txid = EXCLUDED.txid,
+            change_id = EXCLUDED.change_id;
+    """, (name, watermark[0], watermark[1]))
+
+def get_changed_ids(
+    name: str,
+    limit: int = 10000,
+    skip_operations: Tuple[str, ...] = ()
+) -> Tuple[set, Optional[Tuple[int, int]]]:
+    """id вакансий, изменившихся после водяного знака потребителя, и новый водяной знак (None при первом запуске)"""
+    watermark = load_watermark(name)
+    if watermark is None:
+        return set(), None
+
+    changed_ids = set()
+    while True:
+        df_changes, new_watermark = get_changes_since(watermark, limit=limit)
+        if df_changes.empty:
+            break
+        changed_ids.update(df_changes.loc[~df_changes['operation'].isin(skip_operations), 'vacancy_id'])
+        watermark = new_watermark
+    return changed_ids, watermark
+
+def get_current_watermark() -> Tuple[int, int]:
+    """Водяной знак конца журнала (для полного пересчета с нуля)"""
+    rows = execute_query(f"SELECT {SNAPSHOT_XMIN_SQL}, 0;", fetch=True)
+    return (rows[0][0], rows[0][1])
@@ -1,46 +1,151 @@
 import streamlit as st
+import threading
+from collections import OrderedDict
+import numpy as np
 import pandas as pd
 import plotly.express as px
-import psycopg2
-from datetime import datetime
+from datetime import date, datetime, timedelta
 import plotly.graph_objects as go
 import matplotlib.pyplot as plt
 import seaborn as sns
+from search import search_vacancies
+from salary_stats import ALL as ALL_REGIONS, get_salary_stats
+from geo import REGION_NAMES, load_region_geojson, region_key
+from metrics_rollup import count_companies, get_rollup
+from skills import get_top_skills
+from leaderboard import PERIODS, get_leaderboard
+from salary import USABLE_QUALITY
+from database import get_db_connection, get_read_status
 
-# Настройки подключения к БД
-DB_CONFIG = {
-    'dbname': 'postgres',
-    'user': 'postgres',
-    'password': '11111',
-    'host': '127.0.0.1',
-    'port': '5432'
+# Колонки вакансий для дашборда: выражение, имя и тип массива при загрузке
+# (целые с NULL читаются в float64, как это делал pd.read_sql)
+DATA_COLUMNS = [
+    ('v.id', 'id', object),
+    ('v.job_name', 'job_name', object),
+    ('v.salary_norm_min', 'salary_norm_min', 'float64'),
+    ('v.salary_norm_max', 'salary_norm_max', 'float64'),
+    ('v.salary_norm_mid', 'salary_norm_mid', 'float64'),
+    ('v.salary_quality', 'salary_quality', object),
+    ('v.employment', 'employment', object),
+    ('v.schedule', 'schedule', object),
+    ('v.category_specialisation', 'category_specialisation', object),
+    ('v.requirement_education', 'requirement_education', object),
+    ('v.requirement_experience', 'requirement_experience', object),
+    ('v.cluster_id', 'cluster_id', object),
+    ('v.created_at', 'created_at', object),
+    ('v.last_updated', 'last_updated', 'datetime64[ns]'),
+    ('c.company_name', 'company_name', object),
+    ('c.region_code', 'region_code', object),
+    ('r.region_name', 'region_name', object),
+    ('r.city', 'city', object)
+]
+
+DATA_QUERY = f"""
+    SELECT {', '.join(expression for expression, _, _ in DATA_COLUMNS)}
+    FROM vacancy v
+    LEFT JOIN company c ON v.company_code = c.company_code
+    LEFT JOIN region r ON c.region_code = r.region_code
+"""
+
+# Строк в одной порции чтения и в предпросмотре во время загрузки
+DATA_CHUNK_SIZE = 20000
+PREVIEW_ROWS = 200
+PREVIEW_COLUMNS = ['job_name', 'company_name', 'region_name', 'city', 'employment']
+
+# Как долго загруженные вакансии считаются актуальными, секунд
+DATA_TTL = 3600
+
+# Сколько отфильтрованных таблиц и графиков хранить в сессии пользователя
+VIEW_CACHE_SIZE = 32
+
+# Подписи рядов динамики вакансий
+ROLLUP_LABELS = {
+    'posted': 'Опубликовано',
+    'active': 'Активно',
+    'updated': 'Обновлено',
+    'expired': 'Снято'
+}
+
+# Окна таблицы лидеров для топов
+LEADERBOARD_PERIODS = {
+    'За 7 дней': '7d',
+    'За 30 дней': '30d',
+    'За все время': 'all'
 }
 
-@st.cache_data(ttl=3600)
+# Подписи кодов требуемого опыта
+EXPERIENCE_LABELS = {
+    '0': 'Без опыта',
+    '1': '1-3 года',
+    '2': '3-6 лет',
+    '3': '6+ лет'
+}
+
+@st.cache_resource
+def get_data_store():
+    """Общие для всех сессий загруженные вакансии (без копии на каждый вызов, как у cache_data)"""
+    return {'df': None, 'loaded_at': None, 'lock': threading.Lock()}
+
+def read_vacancies(on_chunk=None):
+    """Читает вакансии серверным курсором порциями по DATA_CHUNK_SIZE в заранее выделенные массивы"""
+    with get_db_connection(readonly=True) as conn:
+        # Число строк и сами строки из одного снимка БД
+        conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM vacancy;")
+            total = cursor.fetchone()[0]
+        buffers = {name: np.empty(total, dtype=dtype) for _, name, dtype in DATA_COLUMNS}
+        loaded = 0
+        with conn.cursor(name='dashboard_load') as cursor:
+            cursor.itersize = DATA_CHUNK_SIZE
+            cursor.execute(DATA_QUERY)
+            while True:
+                rows = cursor.fetchmany(DATA_CHUNK_SIZE)
+                if not rows:
+                    break
+                for (_, name, _), values in zip(DATA_COLUMNS, zip(*rows)):
+                    buffers[name][loaded:loaded + len(rows)] = values
+                loaded += len(rows)
+                if on_chunk:
+                    on_chunk(buffers, loaded, total)
+    return pd.DataFrame({name: column[:loaded] for name, column in buffers.items()}, copy=False)
+
 def load_data():
-    """Загрузка данных из БД"""
-    conn = psycopg2.connect(**DB_CONFIG)
-    
-    queries = {
-        'vacancies': """
-            SELECT v.*, c.company_name, c.region_code, r.region_name, r.city 
-            FROM vacancy v
-            LEFT JOIN company c ON v.company_code = c.company_code
-            LEFT JOIN region r ON c.region_code = r.region_code
-        """,
-    }
-    
-    df = pd.read_sql(queries['vacancies'], conn)
-    conn.close()
+    """Загрузка данных из БД (раз в DATA_TTL секунд на все сессии, с прогрессом)"""
+    store = get_data_store()
+    with store['lock']:
+        if store['df'] is None or (datetime.now() - store['loaded_at']).total_seconds() > DATA_TTL:
+            progress = st.progress(0.0, text="Загрузка вакансий...")
+            preview = st.empty()
+
+            def on_chunk(buffers, loaded, total):
+                progress.progress(min(loaded / max(total, 1), 1.0), text=f"Загружено {loaded} из {total} вакансий")
+                if loaded <= DATA_CHUNK_SIZE:
+                    preview.dataframe(pd.DataFrame({
+                        name: buffers[name][:PREVIEW_ROWS] for name in PREVIEW_COLUMNS
+                    }), use_container_width=True)
+
+            store['df'] = prepare_data(read_vacancies(on_chunk))
+            store['loaded_at'] = datetime.now()
+            progress.empty()
+            preview.empty()
+    return store['df']
+
+def prepare_data(df):
+    """Преобразования загруженных вакансий для графиков и таблиц"""
+    # Откуда и когда загружены данные - для отметки об их свежести
+    df.attrs['read_status'] = {**get_read_status(), 'loaded_at': datetime.now()}
 
     df['city'] = df['city'].str.strip()
+    # Вакансии, еще не попавшие в кластеризацию, считаются уникальными
+    df['cluster_id'] = df['cluster_id'].fillna(df['id'])
     
-    df['salary_max'] = df.apply(
-        lambda x: x['salary_min'] if x['salary_max'] == 0 else x['salary_max'],
-        axis=1
-    )
+    # Зарплаты нормализованы при загрузке (salary.py); в средние
+    # не попадают неуказанные и выбивающиеся значения
+    df['salary_min'] = df['salary_norm_min']
+    df['salary_max'] = df['salary_norm_max']
+    df['salary_avg'] = df['salary_norm_mid'].where(df['salary_quality'].isin(USABLE_QUALITY))
     # Преобразуем данные
-    df['salary_avg'] = (df['salary_min'] + df['salary_max']) / 2
     df['date'] = pd.to_datetime(df['last_updated'])
     # df['experience'] = df['requirement_experience'].fillna('Не указан')
 
@@ -62,42 +167,185 @@ def load_data():
     
     return df
 
-def show_vacancies_table(df):
+def show_data_freshness(df):
+    """Отметка о свежести данных: сервер, отставание реплики и время загрузки"""
+    status = df.attrs.get('read_status')
+    if not status:
+        return
+    age = (datetime.now() - status['loaded_at']).total_seconds()
+    staleness = age + status['lag_seconds']
+    if status['endpoint'] == 'replica':
+        source = f"реплика (отставание {status['lag_seconds']:.0f} с)"
+    else:
+        source = "основной сервер" + (f" ({status['reason']})" if status['reason'] else "")
+    st.sidebar.caption(
+        f"Данные: {source}, загружены {status['loaded_at']:%H:%M:%S}, "
+        f"отстают от БД не более чем на {staleness / 60:.0f} мин"
+    )
+    if status['reason']:
+        st.sidebar.warning(f"Чтение переключено на основной сервер: {status['reason']}")
+
+def get_data_version(df):
+    """Версия загруженных данных: меняется после каждой перезагрузки из БД"""
+    return (len(df), str(df['date'].max()))
+
+def count_postings(df, column, unique):
+    """Число вакансий по значениям column (unique - похожие вакансии одного кластера считаются один раз)"""
+    if unique:
+        return df.groupby(column, observed=True)['cluster_id'].nunique().sort_values(ascending=False)
+    return df[column].value_counts()
+
+def memoize_view(name, key, builder):
+    """Кэш отфильтрованных таблиц и графиков сессии (LRU) по версии данных и фильтрам из key"""
+    cache = st.session_state.setdefault('view_cache', OrderedDict())
+    cache_key = (name,) + tuple(key)
+    if cache_key in cache:
+        cache.move_to_end(cache_key)
+        return cache[cache_key]
+    value = builder()
+    cache[cache_key] = value
+    while len(cache) > VIEW_CACHE_SIZE:
+        cache.popitem(last=False)
+    return value
+
+@st.cache_data(ttl=600)
+def load_salary_stats(region_code):
+    """Статистика зарплат по опыту работы для региона (кэшируется по выбору)"""
+    return get_salary_stats(region_code, experience=None)
+
+@st.cache_data(ttl=600)
+def load_top_skills(category, region_name):
+    """Топ навыков по направлению и региону (кэшируется по выбору)"""
+    return get_top_skills(category, region_name)
+
+@st.cache_data(ttl=600)
+def load_leaderboard(dimension, period, limit, order='postings'):
+    """Топ из таблицы лидеров: limit строк из БД (кэшируется по выбору)"""
+    return get_leaderboard(dimension, period, limit, order)
+
+def select_period(key):
+    """Выбор окна для топов"""
+    label = st.radio("Период", list(LEADERBOARD_PERIODS), index=2, horizontal=True, key=key)
+    return LEADERBOARD_PERIODS[label]
+
+def top_postings(df, column, period, limit, unique):
+    """Топ-limit значений column по числу вакансий за окно period (из таблицы лидеров)"""
+    if not unique:
+        top = load_leaderboard(column, period, limit)
+        return pd.Series(top['postings'].to_numpy(), index=pd.Index(top['key'], name=column))
+    days = PERIODS[period]
+    if days is not None:
+        posted = pd.to_datetime(df['created_at']).fillna(df['last_updated']).dt.date
+        df = df[posted > date.today() - timedelta(days=days)]
+    return count_postings(df, column, unique).nlargest(limit)
+
+@st.cache_data(ttl=600)
+def cached_search(query, categories, regions, employment, salary_range, limit, offset):
+    """Поиск в БД с кэшированием страницы результатов"""
+    return search_vacancies(
+        query,
+        categories=categories,
+        regions=regions,
+        employment=employment,
+        salary_range=salary_range,
+        limit=limit,
+        offset=offset
+    )
+
+def show_search_results(query, selected_jobs, selected_regions, employment_types, salary_range):
+    """Таблица результатов поиска: ранжирование и постраничный вывод на стороне БД"""
+    page_size = 50
+    page = st.number_input("Страница", min_value=1, value=1, step=1)
+    results, total = cached_search(
+        query,
+        tuple(selected_jobs),
+        tuple(selected_regions),
+        tuple(employment_types),
+        salary_range,
+        page_size,
+        (page - 1) * page_size
+    )
+    st.caption(f"Найдено вакансий: {total}")
+    st.dataframe(
+        results[[
+            'job_name', 'company_name', 'region_name',
+            'salary_min', 'salary_max', 'salary_avg',
+            'employment', 'category_specialisation', 'city', 'date'
+        ]],
+        height=600,
+        use_container_width=True
+    )
+
+def filter_vacancies(df, selected_jobs, selected_regions, salary_range, employment_types):
+    """Применяет фильтры таблицы и сортирует по дате (salary_range=None - без фильтра по зарплате)"""
+    return df[
+        (df['category_specialisation'].isin(selected_jobs) if selected_jobs else True) &
+        (df['region_name'].isin(selected_regions) if selected_regions else True) &
+        (df['salary_avg'].between(salary_range[0], salary_range[1]) if salary_range else True) &
+        (df['employment'].isin(employment_types))
+    ].sort_values('date', ascending=False)
+
+def show_vacancies_table(df, version):
     st.header("Таблица вакансий")
     
+    # Значения для фильтров считаются один раз на версию данных
+    options = memoize_view('filter_options', (version,), lambda: {
+        'jobs': df['category_specialisation'].unique(),
+        'regions': df['region_name'].unique(),
+        'employment': df['employment'].unique(),
+        'salary': (int(df['salary_avg'].min()), int(df['salary_avg'].max()))
+    })
+    
     # Фильтры в сайдбаре
     st.sidebar.subheader("Фильтры таблицы")
     
     selected_jobs = st.sidebar.multiselect(
         "Направления",
-        df['category_specialisation'].unique()
+        options['jobs']
     )
     
     selected_regions = st.sidebar.multiselect(
         "Регионы",
-        df['region_name'].unique()
+        options['regions']
     )
     
     salary_range = st.sidebar.slider(
         "Диапазон зарплат (средних)",
-        int(df['salary_avg'].min()),
-        int(df['salary_avg'].max()),
-        (int(df['salary_avg'].min()), int(df['salary_avg'].max()))
+        options['salary'][0],
+        options['salary'][1],
+        options['salary']
     )
     
     employment_types = st.sidebar.multiselect(
         "Тип занятости",
-        df['employment'].unique(),
-        default=df['employment'].unique()
+        options['employment'],
+        default=options['employment']
     )
     
-    # Применяем фильтры
-    filtered_df = df[
-        (df['category_specialisation'].isin(selected_jobs) if selected_jobs else True) &
-        (df['region_name'].isin(selected_regions) if selected_regions else True) &
-        (df['salary_avg'].between(salary_range[0], salary_range[1])) &
-        (df['employment'].isin(employment_types))
-    ]
+    # Пока диапазон не сужен, вакансии без зарплаты тоже показываются
+    salary_filter = tuple(salary_range) if tuple(salary_range) != options['salary'] else None
+    
+    search_query = st.text_input("🔍 Поиск по названию вакансии и компании")
+    if search_query.strip():
+        show_search_results(
+            search_query, selected_jobs, selected_regions,
+            employment_types, salary_filter
+        )
+        return
+    
+    # Применяем фильтры (результат переиспользуется, пока фильтры не изменились)
+    filter_key = (
+        version, tuple(selected_jobs), tuple(selected_regions),
+        salary_filter, tuple(employment_types)
+    )
+    filtered_df = memoize_view('filtered_table', filter_key, lambda: filter_vacancies(
+        df, selected_jobs, selected_regions, salary_filter, employment_types
+    ))
+    
+    st.caption(
+        f"Вакансий: {len(filtered_df)}, "
+        f"без учета похожих: {filtered_df['cluster_id'].nunique()}"
+    )
     
     # Показываем таблицу с возможностью сортировки
     st.dataframe(
@@ -105,134 +353,151 @@ def show_vacancies_table(df):
             'job_name', 'region_name',
             'salary_min', 'salary_max', 'salary_avg',
             'employment', 'category_specialisation', 'city', 'date'
-        ]].sort_values('date', ascending=False),
+        ]],
         height=600,
         use_container_width=True
     )
     
-    # Кнопка экспорта
-    st.download_button(
-        "Экспорт в CSV",
-        filtered_df.to_csv(index=False),
-        "vacancies.csv",
-        "text/csv"
-    )
+    # CSV формируется только по запросу пользователя и для текущих фильтров
+    if st.button("Подготовить CSV"):
+        st.session_state['csv_key'] = filter_key
+    if st.session_state.get('csv_key') == filter_key:
+        st.download_button(
+            "Экспорт в CSV",
+            memoize_view('csv', filter_key, lambda: filtered_df.to_csv(index=False)),
+            "vacancies.csv",
+            "text/csv"
+        )
 
-def show_visualizations(df):
+def show_visualizations(df, version):
     st.header("📊 Визуализации и аналитика")
     
     # Выбор типа визуализации
     viz_type = st.sidebar.selectbox(
         "Выберите тип анализа",
-        ["География вакансий", "Анализ зарплат", "Топы по категориям"]
+        ["География вакансий", "Анализ зарплат", "Топы по категориям", "Навыки"]
+    )
+    # Крупные работодатели размещают одну вакансию много раз в разных городах.
+    # По умолчанию считаются размещения: топы читаются из таблицы лидеров,
+    # а число кластеров дельтами не поддерживается и считается по всем данным
+    unique = st.sidebar.checkbox(
+        "Считать похожие вакансии один раз",
+        value=False,
+        help="Топы считаются по всем загруженным вакансиям, а не из таблицы лидеров"
     )
     
     if viz_type == "География вакансий":
         st.subheader("Распределение вакансий по регионам")
         
-        # Карта России с вакансиями
-        region_stats = df.groupby('region_name').agg({
-            'id': 'count',
-            'salary_avg': 'mean'
-        }).reset_index()
+        # Карта России с вакансиями: соединение по коду субъекта, а не по названию
+        geojson = load_region_geojson()
+        def build_region_map():
+            region_stats = df.assign(region_key=df['region_code'].map(region_key)) \
+                .groupby('region_key').agg({
+                    'id': 'count',
+                    'cluster_id': 'nunique',
+                    'salary_avg': 'mean'
+                }).reset_index()
+            count_column = 'cluster_id' if unique else 'id'
+            region_stats['region'] = region_stats['region_key'].map(REGION_NAMES)
+            
+            fig = px.choropleth(
+                region_stats,
+                geojson=geojson,
+                locations='region_key',
+                featureidkey="id",
+                color=count_column,
+                hover_name='region',
+                hover_data=['salary_avg'],
+                # color_continuous_scale='Blues',
+                title='<b>Количество вакансий по регионам</b>',
+                labels={count_column: 'Вакансий', 'region_key': 'Код региона'},
+                height=700,
+                projection='mercator'
+            )
+            fig.update_geos(fitbounds="locations", visible=False)
+            return fig
         
-        fig1 = px.choropleth(
-            region_stats,
-            geojson="https://raw.githubusercontent.com/codeforamerica/click_that_hood/master/public/data/russia.geojson",
-            locations='region_name',
-            featureidkey="properties.name",
-            color='id',
-            hover_name='region_name',
-            hover_data=['salary_avg'],
-            # color_continuous_scale='Blues',
-            title='<b>Количество вакансий по регионам</b>',
-            labels={'id': 'Вакансий'},
-            scope='europe',
-            height=1500,
-            width = 5000,
-            center={'lat': 62, 'lon': 94},
-            projection='mercator'
-        )
-        # fig1.update_geos(fitbounds="locations", visible=False)
-        st.plotly_chart(fig1, use_container_width=True)
+        if geojson is None:
+            st.warning("Карта регионов недоступна: файл assets/russia_regions.geojson не собран (python build_geo_asset.py)")
+        else:
+            fig1 = memoize_view('region_map', (version, unique), build_region_map)
+            st.plotly_chart(fig1, use_container_width=True)
         
         # Топ-15 городов
         st.subheader("Топ-15 регионов по количеству вакансий")
-        city_counts = df['region_name'].value_counts().nlargest(15)
-        fig2 = px.bar(
-            city_counts,
-            x=city_counts.values,
-            y=city_counts.index,
-            orientation='h',
-            color=city_counts.values,
-            color_continuous_scale='Blues',
-            text=city_counts.values,
-            labels={'x': 'Количество вакансий', 'y': 'Регион'},
-            height=600
-        )
-        fig2.update_traces(textposition='outside')
+        period = select_period('top_regions_period')
+        def build_top_regions():
+            city_counts = top_postings(df, 'region_name', period, 15, unique)
+            fig = px.bar(
+                city_counts,
+                x=city_counts.values,
+                y=city_counts.index,
+                orientation='h',
+                color=city_counts.values,
+                color_continuous_scale='Blues',
+                text=city_counts.values,
+                labels={'x': 'Количество вакансий', 'y': 'Регион'},
+                height=600
+            )
+            fig.update_traces(textposition='outside')
+            return fig
+        
+        fig2 = memoize_view('top_regions', (version, unique, period), build_top_regions)
         st.plotly_chart(fig2, use_container_width=True)
     
     elif viz_type == "Анализ зарплат":
         st.subheader("Анализ зарплатных предложений")
-        possible_categories = ['Без опыта', '1-3 года', '3-6 лет', '6+ лет']
-        existing_categories = [cat for cat in possible_categories 
-                            if cat in df['experience'].unique()]
-        
-        # Если нет ни одной категории опыта
-        if not existing_categories:
-            st.warning("В данных не найдены категории опыта работы")
-            return
-        
-        df['experience'] = pd.Categorical(
-            df['experience'], 
-            categories=existing_categories,
-            ordered=True
-        )
         
         # Создаем селектор для выбора региона 
-        if 'region_name' in df.columns:
-            all_regions = ['Все регионы'] + sorted(df['region_name'].dropna().unique().tolist())
-            selected_region = st.selectbox(
-                '📍 Выберите регион:', 
-                all_regions,
-                index=0
-            )
-            
-            # Фильтруем данные по региону
-            if selected_region != 'Все регионы':
-                filtered_df = df[df['region_name'] == selected_region]
-            else:
-                filtered_df = df.copy()
+        regions = df[['region_name', 'region_code']].dropna() \
+            .drop_duplicates('region_code') \
+            .sort_values('region_name')
+        all_regions = ['Все регионы'] + regions['region_name'].astype(str).tolist()
+        selected_region = st.selectbox(
+            '📍 Выберите регион:', 
+            all_regions,
+            index=0
+        )
+        if selected_region != 'Все регионы':
+            region_code = regions.loc[
+                regions['region_name'] == selected_region, 'region_code'
+            ].iloc[0]
         else:
-            filtered_df = df.copy()
-            selected_region = 'Все регионы'
+            region_code = ALL_REGIONS
         
-        # Группируем данные по средним зарплатам
-        salary_stats = filtered_df.groupby('experience', observed=True) \
-            .agg(avg_salary=('salary_avg', 'mean')) \
-            .reset_index()
+        # Статистика предрассчитана в БД (salary_stats) и кэшируется по выбранному региону
+        salary_stats = load_salary_stats(region_code)
         
         # Проверяем, есть ли данные для отображения
         if salary_stats.empty:
             st.warning("Нет данных для отображения по выбранным параметрам")
             return
         
-        # Создаем интерактивный график
+        salary_stats['experience'] = pd.Categorical(
+            salary_stats['experience'].map(EXPERIENCE_LABELS),
+            categories=list(EXPERIENCE_LABELS.values()),
+            ordered=True
+        )
+        salary_stats = salary_stats.sort_values('experience')
+        
+        # Медиана устойчива к выбросам, межквартильный размах показываем "усами"
         fig = px.bar(
             salary_stats,
             x='experience',
-            y='avg_salary',
+            y='salary_median',
             color='experience',
-            title=f'Средняя зарплата по опыту работы {"в регионе " + selected_region if selected_region != "Все регионы" else ""}',
-            labels={'avg_salary': 'Средняя зарплата', 'experience': 'Опыт работы'},
-            text_auto='.2f'
+            error_y=salary_stats['salary_p75'] - salary_stats['salary_median'],
+            error_y_minus=salary_stats['salary_median'] - salary_stats['salary_p25'],
+            title=f'Медианная зарплата по опыту работы {"в регионе " + selected_region if selected_region != "Все регионы" else ""}',
+            labels={'salary_median': 'Медианная зарплата', 'experience': 'Опыт работы'},
+            text_auto='.0f'
         )
         
         # Настраиваем отображение графика
         fig.update_layout(
             xaxis_title='Опыт работы',
-            yaxis_title='Средняя зарплата',
+            yaxis_title='Медианная зарплата',
             showlegend=False,
             hovermode='x unified'
         )
@@ -248,17 +513,24 @@ def show_visualizations(df):
         # Показываем таблицу с данными
         st.subheader('📈 Статистика по зарплатам')
         st.dataframe(
-            salary_stats.rename(columns={
-                'avg_salary': 'Средняя зарплата',
-                'experience': 'Опыт работы'
+            salary_stats[[
+                'experience', 'salary_count', 'salary_mean', 'salary_median',
+                'salary_p25', 'salary_p75', 'salary_p90'
+            ]].rename(columns={
+                'experience': 'Опыт работы',
+                'salary_count': 'Вакансий',
+                'salary_mean': 'Средняя зарплата',
+                'salary_median': 'Медиана',
+                'salary_p25': '25-й перцентиль',
+                'salary_p75': '75-й перцентиль',
+                'salary_p90': '90-й перцентиль'
             }),
             hide_index=True
         )  
 
-
         # Зарплаты по опыту
         st.subheader("Зарплаты в зависимости от требуемого образования")
-        fig2 = px.box(
+        fig2 = memoize_view('education_box', (version,), lambda: px.box(
             df,
             x='requirement_education',
             y='salary_avg',
@@ -266,62 +538,104 @@ def show_visualizations(df):
             points=False,
             labels={'salary_avg': 'Зарплата (руб)', 'requirement_education': 'Требуемый опыт'},
             height=500
-        )
+        ))
         st.plotly_chart(fig2, use_container_width=True)
     
     elif viz_type == "Топы по категориям":
+        period = select_period('top_period')
         col1, col2 = st.columns(2)
         
-        with col1:
-            st.subheader("Топ-10 профессий")
-            top_jobs = df['job_name'].value_counts().nlargest(10)
-            fig1 = px.bar(
-                top_jobs,
-                x=top_jobs.values,
-                y=top_jobs.index,
+        def build_top_counts(column, color_scale):
+            top_values = top_postings(df, column, period, 10, unique)
+            return px.bar(
+                top_values,
+                x=top_values.values,
+                y=top_values.index,
                 orientation='h',
-                color=top_jobs.values,
-                color_continuous_scale='Teal',
-                text=top_jobs.values,
+                color=top_values.values,
+                color_continuous_scale=color_scale,
+                text=top_values.values,
                 labels={'x': 'Количество', 'y': ''},
                 height=500
             )
+        
+        with col1:
+            st.subheader("Топ-10 профессий")
+            fig1 = memoize_view('top_jobs', (version, unique, period), lambda: build_top_counts('job_name', 'Teal'))
             st.plotly_chart(fig1, use_container_width=True)
         
         with col2:
             st.subheader("Топ-10 компаний")
-            top_companies = df['company_name'].value_counts().nlargest(10)
-            fig2 = px.bar(
-                top_companies,
-                x=top_companies.values,
-                y=top_companies.index,
+            fig2 = memoize_view('top_companies', (version, unique, period), lambda: build_top_counts('company_name', 'Peach'))
+            st.plotly_chart(fig2, use_container_width=True)
+        
+        st.subheader("Топ-10 по средней зарплате")
+        def build_top_salary():
+            top_salary = load_leaderboard('company_name', period, 10, order='salary') \
+                .dropna(subset=['salary_avg']) \
+                .rename(columns={'key': 'company_name'})
+            fig = px.bar(
+                top_salary,
+                x='salary_avg',
+                y='company_name',
                 orientation='h',
-                color=top_companies.values,
-                color_continuous_scale='Peach',
-                text=top_companies.values,
-                labels={'x': 'Количество', 'y': ''},
+                color='salary_avg',
+                color_continuous_scale='Purp',
+                text=top_salary['salary_avg'].apply(lambda x: f"{int(x):,} ₽"),
+                labels={'salary_avg': 'Средняя зарплата', 'company_name': ''},
                 height=500
             )
-            st.plotly_chart(fig2, use_container_width=True)
+            fig.update_traces(textposition='outside')
+            fig.update_layout(xaxis_title="Средняя зарплата (руб)")
+            return fig
         
-        st.subheader("Топ-10 по средней зарплате")
-        top_salary = df.groupby('company_name')['salary_avg'].mean().nlargest(10).reset_index()
-        fig3 = px.bar(
-            top_salary,
-            x='salary_avg',
-            y='company_name',
-            orientation='h',
-            color='salary_avg',
-            color_continuous_scale='Purp',
-            text=top_salary['salary_avg'].apply(lambda x: f"{int(x):,} ₽"),
-            labels={'salary_avg': 'Средняя зарплата', 'company_name': ''},
-            height=500
-        )
-        fig3.update_traces(textposition='outside')
-        fig3.update_layout(xaxis_title="Средняя зарплата (руб)")
+        fig3 = memoize_view('top_salary', (version, period), build_top_salary)
         st.plotly_chart(fig3, use_container_width=True)
+    
+    elif viz_type == "Навыки":
+        st.subheader("Топ-20 востребованных навыков")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            category = st.selectbox(
+                "Направление",
+                ["Все направления"] + sorted(df['category_specialisation'].unique())
+            )
+        with col2:
+            region = st.selectbox("Регион", ["Все регионы"] + sorted(df['region_name'].dropna().unique()))
+        
+        # Топ считается в БД по индексам vacancy_skill, а не по таблице в памяти
+        top_skills = load_top_skills(
+            None if category == "Все направления" else category,
+            None if region == "Все регионы" else region
+        )
+        if top_skills.empty:
+            st.warning("Нет данных о навыках для выбранных направления и региона")
+        else:
+            fig = px.bar(
+                top_skills.iloc[::-1],
+                x='vacancies',
+                y='skill',
+                orientation='h',
+                color='vacancies',
+                color_continuous_scale='Teal',
+                text='vacancies',
+                labels={'vacancies': 'Вакансий', 'skill': ''},
+                height=600
+            )
+            fig.update_traces(textposition='outside')
+            st.plotly_chart(fig, use_container_width=True)
+
+@st.cache_data(ttl=600)
+def load_rollup(since, freq):
+    """Динамика из дневных агрегатов (O(дней) строк вместо всех вакансий)"""
+    return get_rollup(since, freq)
+
+@st.cache_data(ttl=600)
+def load_company_count(since):
+    return count_companies(since)
 
-def show_metrics_analysis(df):
+def show_metrics_analysis(version):
     st.header("Анализ ключевых метрик")
     
     # Выбор временного периода
@@ -331,26 +645,34 @@ def show_metrics_analysis(df):
     )
     
     # Фильтрация по времени
-    now = datetime.now()
+    today = date.today()
     if time_period == "Последние 7 дней":
-        time_filter = now - pd.Timedelta(days=7)
+        time_filter = today - timedelta(days=7)
     elif time_period == "Последний месяц":
-        time_filter = now - pd.Timedelta(days=30)
+        time_filter = today - timedelta(days=30)
     elif time_period == "Последний год":
-        time_filter = now - pd.Timedelta(days=365)
+        time_filter = today - timedelta(days=365)
     else:
-        time_filter = df['date'].min()
+        time_filter = None
     
-    time_df = df[df['date'] >= time_filter]
+    daily_df = load_rollup(time_filter, 'D')
+    if daily_df.empty:
+        st.warning("Нет данных за выбранный период")
+        return
     
     # Показываем метрики
-    col1, col2, col3 = st.columns(3)
+    col1, col2, col3, col4 = st.columns(4)
+    # Среднее по вакансиям периода, а не по дням: дни весят по числу зарплат
+    salary_count = daily_df['salary_count'].sum()
+    salary_avg = daily_df['salary_sum'].sum() / salary_count if salary_count else None
     with col1:
-        st.metric("Всего вакансий", time_df.shape[0])
+        st.metric("Опубликовано вакансий", int(daily_df['posted'].sum()))
     with col2:
-        st.metric("Средняя зарплата", f"{int(time_df['salary_avg'].mean())} ₽")
+        st.metric("Активных вакансий", int(daily_df['active'].iloc[-1]))
     with col3:
-        st.metric("Уникальных компаний", time_df['company_name'].nunique())
+        st.metric("Средняя зарплата", f"{int(salary_avg)} ₽" if salary_avg is not None else "—")
+    with col4:
+        st.metric("Уникальных компаний", load_company_count(time_filter))
     
     # Графики динамики
     st.subheader("Динамика вакансий")
@@ -368,18 +690,19 @@ def show_metrics_analysis(df):
     else:
         freq_param = 'M'
     
-    dynamic_df = time_df.groupby(pd.Grouper(key='date', freq=freq_param)).agg({
-        'id': 'count',
-        'salary_avg': 'mean'
-    }).reset_index()
-    
-    fig = px.line(
-        dynamic_df,
-        x='date',
-        y='id',
-        title='Количество вакансий',
-        labels={'id': 'Количество', 'date': 'Дата'}
-    )
+    # Недели и месяцы собираются в БД из дневных агрегатов
+    def build_dynamics():
+        dynamic_df = daily_df if freq_param == 'D' else load_rollup(time_filter, freq_param)
+        
+        return px.line(
+            dynamic_df,
+            x='date',
+            y=['posted', 'active', 'updated', 'expired'],
+            title='Количество вакансий',
+            labels={'value': 'Количество', 'date': 'Дата', 'variable': ''}
+        ).for_each_trace(lambda trace: trace.update(name=ROLLUP_LABELS[trace.name]))
+    
+    fig = memoize_view('dynamics', (version, time_filter, freq_param), build_dynamics)
     st.plotly_chart(fig, use_container_width=True)
     
 
@@ -388,9 +711,11 @@ def main():
     
     # Загрузка данных
     df = load_data()
+    version = get_data_version(df)
     
     # Навигация в сайдбаре
     st.sidebar.title("Навигация")
+    show_data_freshness(df)
     page = st.sidebar.radio(
         "Выберите раздел",
         ["Таблица вакансий", "Визуализации", "Анализ метрик"]
@@ -398,11 +723,11 @@ def main():
     
     # Отображение выбранной страницы
     if page == "Таблица вакансий":
-        show_vacancies_table(df)
+        show_vacancies_table(df, version)
     elif page == "Визуализации":
-        show_visualizations(df)
+        show_visualizations(df, version)
     elif page == "Анализ метрик":
-        show_metrics_analysis(df)
+        show_metrics_analysis(version)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
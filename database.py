@@ -1,21 +1,84 @@
+import os
 import psycopg2
 from psycopg2 import sql
 from contextlib import contextmanager
+from time import monotonic
 
 # Конфигурация подключения (лучше вынести в отдельный config.py)
+# Хост можно переопределить переменной окружения DB_HOST (например, в контейнерах Airflow)
 DB_CONFIG = {
     'dbname': 'postgres',
     'user': 'postgres',
     'password': '11111',
-    'host': '127.0.0.1',
+    'host': os.environ.get('DB_HOST', '127.0.0.1'),
     'port': '5432'
 }
 
+# Реплика для запросов только на чтение (дашборд): DB_READ_HOST, DB_READ_PORT.
+# Без DB_READ_HOST все запросы идут на основной сервер
+READ_DB_CONFIG = {
+    **DB_CONFIG,
+    'host': os.environ['DB_READ_HOST'],
+    'port': os.environ.get('DB_READ_PORT', DB_CONFIG['port'])
+} if os.environ.get('DB_READ_HOST') else None
+
+# Реплика, отстающая больше MAX_REPLICA_LAG секунд, не используется
+MAX_REPLICA_LAG = float(os.environ.get('DB_MAX_REPLICA_LAG', 300))
+# Как часто перепроверять отставание (и доступность после отказа), секунд
+REPLICA_CHECK_SECONDS = 30
+REPLICA_CONNECT_TIMEOUT = 3
+
+# Отставание реплики: 0, если все полученное уже применено (или это не реплика)
+REPLICA_LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END;
+"""
+
+# Куда сейчас идут запросы на чтение (для показа в дашборде)
+_read_status = {'endpoint': 'primary', 'lag_seconds': 0.0, 'reason': None, 'checked_at': None}
+
+def get_read_status():
+    """Сервер для чтения ('replica' или 'primary'), отставание реплики и причина перехода на основной"""
+    return dict(_read_status)
+
+def connect_read():
+    """Соединение для чтения: реплика, если она настроена, доступна и не отстает, иначе основной сервер"""
+    checked_at = _read_status['checked_at']
+    recheck = checked_at is None or monotonic() - checked_at > REPLICA_CHECK_SECONDS
+    if READ_DB_CONFIG is not None and (recheck or _read_status['endpoint'] == 'replica'):
+        try:
+            conn = psycopg2.connect(**READ_DB_CONFIG, connect_timeout=REPLICA_CONNECT_TIMEOUT)
+        except psycopg2.OperationalError as e:
+            print(f"Реплика недоступна, чтение с основного сервера: {e}")
+            _read_status.update(endpoint='primary', lag_seconds=0.0, reason='реплика недоступна', checked_at=monotonic())
+        else:
+            if recheck:
+                with conn.cursor() as cursor:
+                    cursor.execute(REPLICA_LAG_QUERY)
+                    lag = float(cursor.fetchone()[0])
+                conn.rollback()
+                if lag > MAX_REPLICA_LAG:
+                    conn.close()
+                    _read_status.update(endpoint='primary', lag_seconds=0.0, reason=f"реплика отстает на {lag:.0f} с", checked_at=monotonic())
+                else:
+                    _read_status.update(endpoint='replica', lag_seconds=lag, reason=None, checked_at=monotonic())
+            if _read_status['endpoint'] == 'replica':
+                return conn
+    return psycopg2.connect(**DB_CONFIG)
+
 @contextmanager
-def get_db_connection():
+def get_db_connection(readonly=False):
+    """Соединение с БД (readonly=True - только чтение, с реплики, если она есть)"""
     conn = None
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
+        if readonly:
+            conn = connect_read()
+            conn.set_session(readonly=True)
+        else:
+            conn = psycopg2.connect(**DB_CONFIG)
         yield conn
     except psycopg2.Error as e:
         print(f"Ошибка подключения к БД: {e}")
@@ -24,9 +87,9 @@ def get_db_connection():
         if conn:
             conn.close()
 
-def execute_query(query, params=None, fetch=False):
+def execute_query(query, params=None, fetch=False, readonly=False):
 
-    with get_db_connection() as conn:
+    with get_db_connection(readonly) as conn:
         with conn.cursor() as cursor:
             try:
                 cursor.execute(query, params)
@@ -2,10 +2,21 @@ import pandas as pd
 from typing import List, Dict
 from psycopg2.extras import execute_batch
 from database import execute_query, get_db_connection
+from vacancy_expiry import touch_vacancies
+from salary import normalize_salaries
 import hashlib
 
 def create_tables():
     """Создает все необходимые таблицы в БД"""
+    # Таблицы функций объявлены в их модулях (импорт здесь - без циклов импорта).
+    # Порядок важен: архив (vacancy_expiry) копирует колонки vacancy,
+    # а следующие модули добавляют свои колонки в обе таблицы
+    import backfill, change_feed, dedup, leaderboard, metrics_rollup, pipeline
+    import salary, salary_stats, search, skills, vacancy_columns, vacancy_expiry
+    modules = [
+        change_feed, vacancy_expiry, search, salary_stats, metrics_rollup, dedup,
+        skills, salary, backfill, vacancy_columns, pipeline, leaderboard
+    ]
     queries = [
         '''CREATE TABLE IF NOT EXISTS region (
             region_code VARCHAR(20) PRIMARY KEY,
@@ -40,8 +51,13 @@ def create_tables():
             last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             data_hash VARCHAR(32),
             FOREIGN KEY (company_code) REFERENCES company(company_code)
-        );'''
+        );''',
+        # Дата публикации вакансии из API (last_updated - это время последней записи)
+        '''ALTER TABLE vacancy ADD COLUMN IF NOT EXISTS created_at DATE;''',
+        '''CREATE INDEX IF NOT EXISTS idx_vacancy_created_at ON vacancy (created_at);'''
     ]
+    for module in modules:
+        queries.extend(module.TABLES)
     
     for query in queries:
         execute_query(query)
@@ -95,8 +111,33 @@ def prepare_vacancy_data(df: pd.DataFrame) -> pd.DataFrame:
         axis=1
     )
     
+    # Дата публикации вакансии (в хеш не входит)
+    created_at = pd.to_datetime(
+        df.get('creation-date', pd.Series(index=df.index, dtype=object)),
+        errors='coerce'
+    )
+    df_vacancy['created_at'] = created_at.dt.date.astype(object).where(created_at.notna(), None)
+    
+    # Нормализованные зарплаты и флаг качества (в хеш не входят)
+    df_vacancy = df_vacancy.join(normalize_salaries(
+        df_vacancy['salary_min'],
+        df_vacancy['salary_max'],
+        df_vacancy['category_specialisation']
+    ))
+    
     return df_vacancy
 
+def prepare_skill_data(df: pd.DataFrame) -> pd.DataFrame:
+    """Подготавливает навыки вакансий (одна строка на пару вакансия-навык)"""
+    if 'skills' not in df.columns:
+        return pd.DataFrame(columns=['vacancy_id', 'skill'])
+    df_skill = pd.DataFrame({
+        'vacancy_id': df['id'],
+        'skill': df['skills']
+    }).explode('skill').dropna().drop_duplicates()
+    
+    return df_skill
+
 def calculate_data_hash(data: Dict) -> str:
     """Вычисляет хеш данных вакансии"""
     hash_fields = [
@@ -159,8 +200,9 @@ def insert_vacancies_batch(df_vacancy: pd.DataFrame):
                 id, company_code, salary_min, salary_max,
                 job_name, vac_url, employment, schedule,
                 category_specialisation, requirement_education, 
-                requirement_experience, data_hash
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                requirement_experience, data_hash, created_at,
+                salary_norm_min, salary_norm_max, salary_norm_mid, salary_quality
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
             ON CONFLICT (id) DO NOTHING;
             """
             
@@ -172,12 +214,15 @@ def insert_vacancies_batch(df_vacancy: pd.DataFrame):
                     row['category_specialisation'],
                     row['requirement_education'], 
                     row['requirement_experience'],
-                    row['data_hash']
+                    row['data_hash'], row['created_at'],
+                    row['salary_norm_min'], row['salary_norm_max'],
+                    row['salary_norm_mid'], row['salary_quality']
                 )
                 for _, row in df_vacancy.iterrows()
             ]
             execute_batch(cursor, insert_query, data)
             conn.commit()
+    touch_vacancies(df_vacancy['id'])
     print(f"Вставлено {len(df_vacancy)} вакансий")
 
 def update_vacancies_batch(df_vacancy: pd.DataFrame):
@@ -197,6 +242,11 @@ def update_vacancies_batch(df_vacancy: pd.DataFrame):
                 requirement_education = %s,
                 requirement_experience = %s,
                 data_hash = %s,
+                created_at = COALESCE(created_at, %s),
+                salary_norm_min = %s,
+                salary_norm_max = %s,
+                salary_norm_mid = %s,
+                salary_quality = %s,
                 last_updated = CURRENT_TIMESTAMP
             WHERE id = %s AND data_hash != %s;
             """
@@ -207,7 +257,10 @@ def update_vacancies_batch(df_vacancy: pd.DataFrame):
                     row['job_name'], row['vac_url'], row['employment'],
                     row['schedule'], row['category_specialisation'],
                     row['requirement_education'], row['requirement_experience'],
-                    row['data_hash'], row['id'], row['data_hash']
+                    row['data_hash'], row['created_at'],
+                    row['salary_norm_min'], row['salary_norm_max'],
+                    row['salary_norm_mid'], row['salary_quality'],
+                    row['id'], row['data_hash']
                 )
                 for _, row in df_vacancy.iterrows()
             ]
@@ -0,0 +1,201 @@
+import hashlib
+import re
+import numpy as np
+from typing import Dict, Iterable, List
+from psycopg2.extras import execute_values
+from database import get_db_connection
+from change_feed import get_changed_ids, get_current_watermark, save_watermark
+
+# Имя потребителя журнала изменений для водяного знака
+WATERMARK_NAME = 'dedup'
+
+# MinHash: NUM_PERM хеш-функций, LSH: BANDS полос по NUM_PERM // BANDS значений.
+# Вероятность стать кандидатами 1 - (1 - s^4)^16: ~0.64 при сходстве s = 0.5,
+# ~0.9998 при s = 0.8
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+
+# Оценка сходства Жаккара, начиная с которой вакансии считаются одной
+SIMILARITY_THRESHOLD = 0.8
+
+# Коэффициенты хеш-функций h(x) = (a * x + b) mod p (p = 2^31 - 1, без переполнения uint64)
+PRIME = (1 << 31) - 1
+_random = np.random.RandomState(20240601)
+PERM_A = _random.randint(1, PRIME, size=NUM_PERM, dtype=np.uint64)
+PERM_B = _random.randint(0, PRIME, size=NUM_PERM, dtype=np.uint64)
+
+# Округление зарплаты, чтобы мелкие правки суммы не разводили дубликаты
+SALARY_STEP = 5000
+
+BATCH_SIZE = 1000
+
+SOURCE_QUERY = """
+    SELECT v.id, v.job_name, c.company_name, v.salary_min, v.salary_max,
+           v.requirement_education, v.requirement_experience
+    FROM vacancy v
+    LEFT JOIN company c ON v.company_code = c.company_code
+    WHERE v.id = ANY(%s)
+    ORDER BY v.created_at NULLS LAST, v.id;
+"""
+
+# Кандидаты из индекса: вакансии, попавшие хотя бы в одну общую корзину
+CANDIDATES_QUERY = """
+    SELECT b.band, b.bucket, b.vacancy_id, m.signature, COALESCE(v.cluster_id, v.id)
+    FROM unnest(%s::smallint[], %s::bigint[]) AS q(band, bucket)
+    JOIN vacancy_lsh_band b ON b.band = q.band AND b.bucket = q.bucket
+    JOIN vacancy_minhash m ON m.vacancy_id = b.vacancy_id
+    JOIN vacancy v ON v.id = b.vacancy_id;
+"""
+
+
+TABLES = [
+    # Кластеры похожих вакансий: MinHash-подписи и корзины LSH по полосам
+    # (индекс хранится между запусками), cluster_id - id первой вакансии кластера
+    '''ALTER TABLE vacancy ADD COLUMN IF NOT EXISTS cluster_id VARCHAR(36);''',
+    '''ALTER TABLE vacancy_archive ADD COLUMN IF NOT EXISTS cluster_id VARCHAR(36);''',
+    '''CREATE INDEX IF NOT EXISTS idx_vacancy_cluster_id ON vacancy (cluster_id);''',
+    '''CREATE TABLE IF NOT EXISTS vacancy_minhash (
+        vacancy_id VARCHAR(36) PRIMARY KEY,
+        signature BYTEA NOT NULL
+    );''',
+    '''CREATE TABLE IF NOT EXISTS vacancy_lsh_band (
+        band SMALLINT NOT NULL,
+        bucket BIGINT NOT NULL,
+        vacancy_id VARCHAR(36) NOT NULL,
+        PRIMARY KEY (band, bucket, vacancy_id)
+    );''',
+    '''CREATE INDEX IF NOT EXISTS idx_vacancy_lsh_band_vacancy_id
+        ON vacancy_lsh_band (vacancy_id);'''
+]
+
+
+def normalize_text(value) -> str:
+    return ' '.join(re.findall(r'\w+', str(value or '').lower()))
+
+
+def shingles(row: Dict) -> set:
+    """Признаки вакансии без города и адреса: триграммы и слова названия, компания, зарплата, требования"""
+    job_name = normalize_text(row['job_name'])
+    features = {f"w:{word}" for word in job_name.split()}
+    padded = f" {job_name} "
+    features.update(f"t:{padded[i:i + 3]}" for i in range(len(padded) - 2))
+    salary_max = row['salary_max'] or row['salary_min']
+    features.update({
+        f"c:{normalize_text(row['company_name'])}",
+        f"s:{(row['salary_min'] or 0) // SALARY_STEP}-{(salary_max or 0) // SALARY_STEP}",
+        f"e:{normalize_text(row['requirement_education'])}",
+        f"x:{normalize_text(row['requirement_experience'])}"
+    })
+    return features
+
+
+def minhash(features: Iterable[str]) -> np.ndarray:
+    """MinHash-подпись набора признаков (NUM_PERM значений uint64)"""
+    values = np.fromiter(
+        (int.from_bytes(hashlib.md5(f.encode()).digest()[:4], 'little') % PRIME for f in features),
+        dtype=np.uint64
+    )
+    if not len(values):
+        return np.full(NUM_PERM, PRIME, dtype=np.uint64)
+    return ((np.outer(values, PERM_A) + PERM_B) % PRIME).min(axis=0)
+
+
+def band_buckets(signature: np.ndarray) -> List[int]:
+    """Корзины LSH по полосам подписи (знаковые 64-битные для BIGINT)"""
+    return [
+        int.from_bytes(hashlib.md5(band.tobytes()).digest()[:8], 'little', signed=True)
+        for band in signature.reshape(BANDS, ROWS)
+    ]
+
+
+def similarity(first: np.ndarray, second: np.ndarray) -> float:
+    """Оценка сходства Жаккара по доле совпавших значений подписей"""
+    return float(np.mean(first == second))
+
+
+def cluster_batch(cursor, vacancy_ids: List[str]) -> int:
+    """Пересчитывает подписи пачки вакансий и назначает кластеры, возвращает число попавших в чужой кластер"""
+    cursor.execute("DELETE FROM vacancy_lsh_band WHERE vacancy_id = ANY(%s);", (vacancy_ids,))
+    cursor.execute("DELETE FROM vacancy_minhash WHERE vacancy_id = ANY(%s);", (vacancy_ids,))
+
+    columns = ['id', 'job_name', 'company_name', 'salary_min', 'salary_max',
+               'requirement_education', 'requirement_experience']
+    cursor.execute(SOURCE_QUERY, (vacancy_ids,))
+    rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    if not rows:
+        return 0
+
+    signatures = [minhash(shingles(row)) for row in rows]
+    buckets = [band_buckets(signature) for signature in signatures]
+
+    bands = [band for row_buckets in buckets for band in range(BANDS)]
+    flat_buckets = [bucket for row_buckets in buckets for bucket in row_buckets]
+    # Корзины индекса, общие с пачкой: (полоса, корзина) -> id вакансий
+    cursor.execute(CANDIDATES_QUERY, (bands, flat_buckets))
+    index, candidates = {}, {}
+    for band, bucket, vacancy_id, signature, cluster_id in cursor.fetchall():
+        index.setdefault((band, bucket), []).append(vacancy_id)
+        candidates[vacancy_id] = (np.frombuffer(bytes(signature), dtype=np.uint64), cluster_id)
+
+    assigned = []
+    merged = 0
+    for row, signature, row_buckets in zip(rows, signatures, buckets):
+        best_id, best_similarity = row['id'], SIMILARITY_THRESHOLD
+        seen = set()
+        for band, bucket in enumerate(row_buckets):
+            for candidate_id in index.get((band, bucket), []):
+                if candidate_id in seen:
+                    continue
+                seen.add(candidate_id)
+                candidate_signature, candidate_cluster = candidates[candidate_id]
+                score = similarity(signature, candidate_signature)
+                if score >= best_similarity:
+                    best_id, best_similarity = candidate_cluster, score
+        if best_id != row['id']:
+            merged += 1
+        assigned.append((row['id'], best_id))
+        candidates[row['id']] = (signature, best_id)
+        for band, bucket in enumerate(row_buckets):
+            index.setdefault((band, bucket), []).append(row['id'])
+
+    execute_values(cursor, """
+        INSERT INTO vacancy_minhash (vacancy_id, signature) VALUES %s;
+    """, [(row['id'], signature.tobytes()) for row, signature in zip(rows, signatures)])
+    execute_values(cursor, """
+        INSERT INTO vacancy_lsh_band (band, bucket, vacancy_id) VALUES %s;
+    """, [
+        (band, bucket, row['id'])
+        for row, row_buckets in zip(rows, buckets)
+        for band, bucket in enumerate(row_buckets)
+    ])
+    execute_values(cursor, """
+        UPDATE vacancy v SET cluster_id = a.cluster_id
+        FROM (VALUES %s) AS a(id, cluster_id)
+        WHERE v.id = a.id;
+    """, assigned)
+    return merged
+
+
+def refresh_clusters(full: bool = False, batch_size: int = BATCH_SIZE):
+    """Обновляет кластеры похожих вакансий (vacancy.cluster_id) по журналу изменений"""
+    # Пересчет нормализованной зарплаты (N) признаки вакансии не меняет
+    changed_ids, watermark = get_changed_ids(WATERMARK_NAME, skip_operations=('N',))
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            if full or watermark is None:
+                watermark = get_current_watermark()
+                cursor.execute("TRUNCATE vacancy_lsh_band, vacancy_minhash;")
+                cursor.execute("UPDATE vacancy SET cluster_id = NULL WHERE cluster_id IS NOT NULL;")
+                cursor.execute("SELECT id FROM vacancy ORDER BY created_at NULLS LAST, id;")
+                vacancy_ids = [vacancy_id for (vacancy_id,) in cursor.fetchall()]
+            else:
+                vacancy_ids = sorted(changed_ids)
+
+            merged = 0
+            for start in range(0, len(vacancy_ids), batch_size):
+                merged += cluster_batch(cursor, vacancy_ids[start:start + batch_size])
+            conn.commit()
+    save_watermark(WATERMARK_NAME, watermark)
+    print(f"Кластеры обновлены: {len(vacancy_ids)} вакансий, {merged} похожих на уже известные")
+
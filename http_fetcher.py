@@ -0,0 +1,345 @@
+import hashlib
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from time import perf_counter, sleep
+from typing import Callable, Dict, Iterator, List, Optional
+
+API_URL = "https://opendata.trudvsem.ru/api/v1/vacancies"
+
+# Каталог дискового кэша ответов и время жизни записи (секунды)
+CACHE_DIR = os.path.join(tempfile.gettempdir(), 'vacancy_http_cache')
+CACHE_TTL = 600
+# Записи старше CACHE_MAX_AGE удаляются, а каталог ужимается до CACHE_MAX_BYTES
+CACHE_MAX_AGE = 24 * 3600
+CACHE_MAX_BYTES = 500 * 1024 * 1024
+
+# brotli декодируется urllib3 только при установленном пакете brotli
+try:
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = 'br, gzip, deflate'
+except ImportError:
+    ACCEPT_ENCODING = 'gzip, deflate'
+
+# Коды ответа, после которых запрос имеет смысл повторить
+RETRYABLE_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class FetchError(Exception):
+    """Страницу не удалось получить"""
+
+
+class RetryableFetchError(FetchError):
+    """Временная ошибка: повтор запроса может помочь"""
+
+
+class CircuitOpenError(FetchError):
+    """Предохранитель разомкнут: запросы к API временно не выполняются"""
+
+
+class IncompleteCrawlError(FetchError):
+    """Обход завершился, но часть страниц так и не удалось получить"""
+
+    def __init__(self, failed_offsets: List[int], resume_offset: Optional[int] = None):
+        self.failed_offsets = failed_offsets
+        self.resume_offset = resume_offset
+        super().__init__(
+            f"Не получены страницы со смещениями {failed_offsets}"
+            + (f", обход прерван на смещении {resume_offset}" if resume_offset is not None else "")
+        )
+
+
+def classify_error(exc: Exception) -> FetchError:
+    """Переводит исключение запроса во временную или постоянную ошибку"""
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        status = exc.response.status_code
+        error_class = RetryableFetchError if status in RETRYABLE_STATUSES else FetchError
+        return error_class(f"HTTP {status}: {exc}")
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)):
+        return RetryableFetchError(str(exc))
+    if isinstance(exc, ValueError):
+        # Оборванное или испорченное тело ответа
+        return RetryableFetchError(f"Некорректный JSON: {exc}")
+    return FetchError(str(exc))
+
+
+class CircuitBreaker:
+    """Предохранитель: после серии ошибок подряд перестает обращаться к API до пробного запроса"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+
+    def remaining(self) -> float:
+        """Сколько секунд осталось до пробного запроса"""
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def check(self):
+        if self.opened_at is not None and self.remaining() > 0:
+            raise CircuitOpenError(
+                f"API недоступно, повтор через {self.remaining():.0f} с"
+            )
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class CachedFetcher:
+    """HTTP-клиент с постоянной сессией, сжатием, условными запросами и дисковым кэшем"""
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = CACHE_DIR,
+        ttl: int = CACHE_TTL,
+        pool_size: int = 10,
+        timeout: int = 30,
+        max_retries: int = 4,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({'Accept-Encoding': ACCEPT_ENCODING})
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.stats = {
+            'pages': 0, 'cache_hits': 0, 'not_modified': 0,
+            'downloaded': 0, 'bytes': 0, 'seconds': 0.0,
+            'retries': 0, 'failures': 0
+        }
+        # Клиент общий для потоков сбора, счетчики меняются под блокировкой
+        self.stats_lock = threading.Lock()
+
+    def count(self, **deltas):
+        """Прибавляет значения к счетчикам stats"""
+        with self.stats_lock:
+            for key, delta in deltas.items():
+                self.stats[key] += delta
+
+    def cache_path(self, url: str, params: Dict) -> str:
+        """Путь к файлу кэша для запроса"""
+        key = url + '?' + '&'.join(f"{k}={params[k]}" for k in sorted(params))
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode()).hexdigest() + '.json')
+
+    def read_cache(self, path: str) -> Optional[Dict]:
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write_cache(self, path: str, entry: Dict):
+        # Пишем во временный файл и подменяем, чтобы не оставить битую запись
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def purge_cache(self, max_age: float = CACHE_MAX_AGE, max_bytes: int = CACHE_MAX_BYTES) -> int:
+        """Удаляет устаревшие записи кэша и самые старые сверх max_bytes, возвращает число удаленных"""
+        if not self.cache_dir:
+            return 0
+        entries = sorted(
+            (entry.stat().st_mtime, entry.stat().st_size, entry.path)
+            for entry in os.scandir(self.cache_dir) if entry.is_file()
+        )
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for mtime, size, path in entries:
+            if time.time() - mtime < max_age and total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+    def get_json(self, url: str, params: Optional[Dict] = None, max_age: Optional[float] = None) -> Dict:
+        """Возвращает JSON-ответ, по возможности из кэша (max_age - срок свежести вместо ttl)"""
+        params = params or {}
+        ttl = self.ttl if max_age is None else max_age
+        self.count(pages=1)
+        path = self.cache_path(url, params) if self.cache_dir else None
+        entry = self.read_cache(path) if path else None
+
+        if entry and time.time() - entry['fetched_at'] < ttl:
+            self.count(cache_hits=1)
+            return entry['data']
+
+        headers = {}
+        if entry and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+        response, data = self.request_with_retries(url, params, headers)
+
+        if response.status_code == 304:
+            if not entry:
+                self.count(failures=1)
+                raise FetchError(f"HTTP 304 без записи в кэше: {url}")
+            self.count(not_modified=1)
+            entry['fetched_at'] = time.time()
+            self.write_cache(path, entry)
+            return entry['data']
+
+        # Content-Length - размер сжатого тела, то есть реальный трафик
+        self.count(downloaded=1, bytes=int(response.headers.get('Content-Length', len(response.content))))
+
+        if path:
+            self.write_cache(path, {
+                'data': data,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'fetched_at': time.time()
+            })
+        return data
+
+    def backoff(self, attempt: int, response: Optional[requests.Response] = None) -> float:
+        """Пауза перед повтором: экспонента с полным джиттером или Retry-After"""
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def request_with_retries(self, url: str, params: Dict, headers: Dict):
+        """Запрос с повторами временных ошибок: ответ и JSON (None для 304) или FetchError"""
+        for attempt in range(self.max_retries + 1):
+            self.breaker.check()
+            response = None
+            started = perf_counter()
+            try:
+                response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+                if response.status_code == 304:
+                    data = None
+                else:
+                    response.raise_for_status()
+                    data = response.json()
+            except Exception as e:
+                error = classify_error(e)
+                self.breaker.record_failure()
+                if not isinstance(error, RetryableFetchError) or attempt == self.max_retries:
+                    self.count(failures=1)
+                    raise error from e
+                self.count(retries=1)
+                delay = self.backoff(attempt, response)
+                print(f"Ошибка при запросе ({error}), повтор через {delay:.1f} с")
+                sleep(delay)
+            else:
+                self.breaker.record_success()
+                return response, data
+            finally:
+                self.count(seconds=perf_counter() - started)
+
+    def report(self) -> Dict:
+        """Сводка по трафику и задержкам на страницу"""
+        with self.stats_lock:
+            report = dict(self.stats)
+        network_pages = report['downloaded'] + report['not_modified']
+        report['bytes_per_page'] = report['bytes'] / max(report['pages'], 1)
+        report['latency_per_request'] = report['seconds'] / max(network_pages, 1)
+        print(
+            f"Страниц: {report['pages']} (из кэша {report['cache_hits']}, "
+            f"304: {report['not_modified']}, скачано {report['downloaded']}); "
+            f"трафик {report['bytes'] / 1024:.1f} КБ, "
+            f"{report['bytes_per_page'] / 1024:.1f} КБ/стр., "
+            f"задержка {report['latency_per_request'] * 1000:.0f} мс/запрос; "
+            f"повторов {report['retries']}, ошибок {report['failures']}"
+        )
+        return report
+
+
+def crawl_pages(
+    fetch_page: Callable[[int, int], List[Dict]],
+    max_vacancies: int,
+    batch_size: int = 100,
+    delay: float = 1.0,
+    resume_passes: int = 2,
+    max_open_waits: int = 3,
+    breaker: Optional[CircuitBreaker] = None
+) -> Iterator[List[Dict]]:
+    """Обходит страницы API и отдает их по одной, неудавшиеся страницы перезапрашивает в конце"""
+    breaker = breaker or fetcher.breaker
+    failed = []
+    collected = 0
+    offset = 0
+    open_waits = 0
+    while collected < max_vacancies:
+        try:
+            vacancies = fetch_page(offset, batch_size)
+        except CircuitOpenError:
+            open_waits += 1
+            if open_waits > max_open_waits:
+                raise IncompleteCrawlError(failed, resume_offset=offset)
+            wait = breaker.remaining()
+            print(f"API недоступно, ждем {wait:.0f} с")
+            sleep(wait)
+            continue
+        except FetchError as e:
+            print(f"Страница {offset} не получена: {e}")
+            failed.append(offset)
+            offset += batch_size
+            continue
+        open_waits = 0
+        if not vacancies:
+            break
+        vacancies = vacancies[:max_vacancies - collected]
+        collected += len(vacancies)
+        offset += batch_size
+        yield vacancies
+        sleep(delay)
+
+    for resume_pass in range(resume_passes):
+        if not failed:
+            break
+        print(f"Повторный запрос {len(failed)} страниц (проход {resume_pass + 1})")
+        sleep(breaker.remaining())
+        still_failed = []
+        for failed_offset in failed:
+            if collected >= max_vacancies:
+                break
+            try:
+                vacancies = fetch_page(failed_offset, batch_size)
+            except FetchError:
+                still_failed.append(failed_offset)
+                continue
+            vacancies = vacancies[:max_vacancies - collected]
+            if vacancies:
+                collected += len(vacancies)
+                yield vacancies
+            sleep(delay)
+        failed = still_failed
+
+    if failed:
+        raise IncompleteCrawlError(failed)
+
+
+# Общий клиент модуля: одна сессия и один пул соединений на процесс
+fetcher = CachedFetcher()
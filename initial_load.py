@@ -1,35 +1,26 @@
-import pandas as pd
-from vacancy_processor import collect_vacancies, prepare_vacancies
-from database_operations import (
-    create_tables,
-    prepare_region_data,
-    prepare_company_data,
-    prepare_vacancy_data,
-    insert_regions_batch,
-    insert_companies_batch,
-    insert_vacancies_batch
-)
+import sys
+from database_operations import create_tables
+from pipeline import DEFAULT_PROFILE, run
+from backfill import run_backfill
 
-def main():
-    # 1. Сбор данных
-    print("Сбор вакансий...")
-    raw_df = collect_vacancies(max_vacancies=2000)
-    processed_df = prepare_vacancies(raw_df)
-    
-    # 2. Подготовка данных
-    print("Подготовка данных...")
-    df_region = prepare_region_data(processed_df)
-    df_company = prepare_company_data(processed_df)
-    df_vacancy = prepare_vacancy_data(processed_df)
-    
-    # 3. Загрузка в БД
-    print("Загрузка в БД...")
+def main(full_catalogue: bool = False):
+    # 1. Создание таблиц
     create_tables()
-    insert_regions_batch(df_region)
-    insert_companies_batch(df_company)
-    insert_vacancies_batch(df_vacancy)
+
+    # Полный каталог грузится частями в несколько процессов с продолжением
+    # после прерывания (python initial_load.py --backfill)
+    if full_catalogue:
+        run_backfill()
+        return
+
+    # 2. Сбор, подготовка и загрузка в БД выполняются параллельно:
+    # пока обрабатывается и пишется одна пачка, скачивается следующая.
+    # Источники обходятся одновременно; одинаковые вакансии разных
+    # источников сохраняются и объединяются в кластеры dedup.refresh_clusters
+    print("Сбор и загрузка вакансий...")
+    run(DEFAULT_PROFILE)
     
     print("Первоначальная загрузка завершена!")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(full_catalogue='--backfill' in sys.argv[1:])
\ No newline at end of file
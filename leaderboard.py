@@ -0,0 +1,207 @@
+import sys
+import pandas as pd
+from database import execute_query, get_db_connection
+from salary import SALARY_MID_SQL
+
+# Измерения таблицы лидеров (совпадают с колонками данных дашборда)
+DIMENSIONS = ['job_name', 'company_name', 'region_name']
+
+# Окна по дате публикации: число последних дней, None - за все время
+PERIODS = {'7d': 7, '30d': 30, 'all': None}
+
+# Порядок топа; выражения совпадают с индексами таблицы leaderboard,
+# поэтому топ читается из индекса без сортировки
+ORDERS = {
+    'postings': 'postings DESC, key',
+    'salary': 'salary_sum::float8 / NULLIF(salary_count, 0) DESC NULLS LAST, key'
+}
+
+LEADERBOARD_COLUMNS = ['key', 'postings', 'salary_avg']
+
+# Дневные счетчики по всем живым вакансиям (полный пересчет).
+# Счетчики поддерживает триггер leaderboard_apply с теми же измерениями
+REBUILD_DAILY_QUERY = f"""
+    DELETE FROM leaderboard_daily;
+
+    INSERT INTO leaderboard_daily (dimension, key, day, postings, salary_sum, salary_count)
+    SELECT d.dimension, d.key, v.day, count(*), COALESCE(sum(v.salary), 0), count(v.salary)
+    FROM (
+        SELECT v.company_code, v.job_name,
+               COALESCE(v.created_at, v.last_updated::date, CURRENT_DATE) AS day,
+               {SALARY_MID_SQL.format(alias='v')} AS salary
+        FROM vacancy v
+    ) v
+    JOIN company c ON c.company_code = v.company_code
+    JOIN region r ON r.region_code = c.region_code
+    CROSS JOIN LATERAL (VALUES
+        ('job_name', v.job_name), ('company_name', c.company_name), ('region_name', r.region_name)
+    ) AS d(dimension, key)
+    GROUP BY 1, 2, 3;
+"""
+
+# Счетчики окон из дневных счетчиков: дни, вышедшие из окна, отбрасываются
+REBUILD_PERIODS_QUERY = """
+    DELETE FROM leaderboard WHERE period = ANY(%(periods)s);
+
+    INSERT INTO leaderboard (dimension, period, key, postings, salary_sum, salary_count)
+    SELECT l.dimension, p.period, l.key, sum(l.postings), sum(l.salary_sum), sum(l.salary_count)
+    FROM leaderboard_daily l
+    JOIN unnest(%(periods)s::text[], %(days)s::integer[]) AS p(period, days)
+      ON p.days IS NULL OR l.day > CURRENT_DATE - p.days
+    GROUP BY 1, 2, 3
+    HAVING sum(l.postings) <> 0 OR sum(l.salary_count) <> 0;
+
+    DELETE FROM leaderboard_daily WHERE postings = 0 AND salary_count = 0;
+"""
+
+
+TABLES = [
+    # Таблица лидеров: число вакансий и сумма зарплат по профессии, компании
+    # и региону - по дням публикации и за окна 7d, 30d, all. Счетчики
+    # меняются на разницу старых и новых строк vacancy триггером на
+    # инструкцию (один пересчет на пачку загрузки); окна сдвигает
+    # refresh_leaderboards
+    '''CREATE TABLE IF NOT EXISTS leaderboard_daily (
+        dimension VARCHAR(20) NOT NULL,
+        key VARCHAR(255) NOT NULL,
+        day DATE NOT NULL,
+        postings INTEGER NOT NULL DEFAULT 0,
+        salary_sum BIGINT NOT NULL DEFAULT 0,
+        salary_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (dimension, key, day)
+    );''',
+    '''CREATE TABLE IF NOT EXISTS leaderboard (
+        dimension VARCHAR(20) NOT NULL,
+        period VARCHAR(10) NOT NULL,
+        key VARCHAR(255) NOT NULL,
+        postings INTEGER NOT NULL DEFAULT 0,
+        salary_sum BIGINT NOT NULL DEFAULT 0,
+        salary_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (dimension, period, key)
+    );''',
+    '''CREATE INDEX IF NOT EXISTS idx_leaderboard_postings
+        ON leaderboard (dimension, period, postings DESC, key);''',
+    '''CREATE INDEX IF NOT EXISTS idx_leaderboard_salary
+        ON leaderboard (dimension, period, (salary_sum::float8 / NULLIF(salary_count, 0)) DESC NULLS LAST, key);''',
+    '''CREATE OR REPLACE FUNCTION leaderboard_apply() RETURNS trigger AS $$
+    DECLARE
+        changes TEXT;
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            changes := 'SELECT 1 AS sign, n.* FROM new_rows n';
+        ELSIF TG_OP = 'DELETE' THEN
+            changes := 'SELECT -1 AS sign, o.* FROM old_rows o';
+        ELSE
+            changes := 'SELECT -1 AS sign, o.* FROM old_rows o UNION ALL SELECT 1, n.* FROM new_rows n';
+        END IF;
+        -- Строки с нулевой разницей (изменились поля вне таблицы лидеров)
+        -- отбрасываются, счетчики обновляются в одном порядке во всех
+        -- транзакциях, чтобы параллельные загрузки не блокировали друг друга
+        EXECUTE format($sql$
+            WITH delta AS (
+                SELECT d.dimension, d.key, ch.day,
+                       sum(ch.sign) AS postings,
+                       COALESCE(sum(ch.sign * ch.salary), 0) AS salary_sum,
+                       COALESCE(sum(ch.sign) FILTER (WHERE ch.salary IS NOT NULL), 0) AS salary_count
+                FROM (
+                    SELECT sign, company_code, job_name,
+                           COALESCE(created_at, last_updated::date, CURRENT_DATE) AS day,
+                           CASE WHEN salary_quality IN ('ok', 'scaled', 'swapped') THEN salary_norm_mid END AS salary
+                    FROM (%s) changes
+                ) ch
+                JOIN company c ON c.company_code = ch.company_code
+                JOIN region r ON r.region_code = c.region_code
+                CROSS JOIN LATERAL (VALUES
+                    ('job_name', ch.job_name), ('company_name', c.company_name), ('region_name', r.region_name)
+                ) AS d(dimension, key)
+                GROUP BY 1, 2, 3
+                HAVING sum(ch.sign) <> 0
+                    OR COALESCE(sum(ch.sign * ch.salary), 0) <> 0
+                    OR COALESCE(sum(ch.sign) FILTER (WHERE ch.salary IS NOT NULL), 0) <> 0
+            ), daily AS (
+                INSERT INTO leaderboard_daily AS l (dimension, key, day, postings, salary_sum, salary_count)
+                SELECT dimension, key, day, postings, salary_sum, salary_count
+                FROM delta
+                ORDER BY dimension, key, day
+                ON CONFLICT (dimension, key, day) DO UPDATE SET
+                    postings = l.postings + EXCLUDED.postings,
+                    salary_sum = l.salary_sum + EXCLUDED.salary_sum,
+                    salary_count = l.salary_count + EXCLUDED.salary_count
+            )
+            INSERT INTO leaderboard AS l (dimension, period, key, postings, salary_sum, salary_count)
+            SELECT d.dimension, p.period, d.key, sum(d.postings), sum(d.salary_sum), sum(d.salary_count)
+            FROM delta d
+            JOIN (VALUES ('7d', 7), ('30d', 30), ('all', NULL)) AS p(period, days)
+              ON p.days IS NULL OR d.day > CURRENT_DATE - p.days
+            GROUP BY 1, 2, 3
+            ORDER BY 1, 2, 3
+            ON CONFLICT (dimension, period, key) DO UPDATE SET
+                postings = l.postings + EXCLUDED.postings,
+                salary_sum = l.salary_sum + EXCLUDED.salary_sum,
+                salary_count = l.salary_count + EXCLUDED.salary_count
+        $sql$, changes);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;''',
+    # Таблицы переходов допускаются только у триггера на одно событие
+    '''DROP TRIGGER IF EXISTS leaderboard_insert ON vacancy;
+    CREATE TRIGGER leaderboard_insert
+        AFTER INSERT ON vacancy
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION leaderboard_apply();''',
+    '''DROP TRIGGER IF EXISTS leaderboard_update ON vacancy;
+    CREATE TRIGGER leaderboard_update
+        AFTER UPDATE ON vacancy
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION leaderboard_apply();''',
+    '''DROP TRIGGER IF EXISTS leaderboard_delete ON vacancy;
+    CREATE TRIGGER leaderboard_delete
+        AFTER DELETE ON vacancy
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION leaderboard_apply();'''
+]
+
+
+def refresh_leaderboards(full: bool = False):
+    """Сдвигает окна 7d и 30d таблицы лидеров (при full=True или пустых счетчиках пересчитывает все)"""
+    if not full:
+        full = not execute_query("SELECT EXISTS (SELECT 1 FROM leaderboard_daily);", fetch=True)[0][0]
+    periods = [period for period, days in PERIODS.items() if full or days is not None]
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            # Загрузка ждет конца пересчета, чтобы ее приращения
+            # не потерялись между удалением и вставкой счетчиков
+            if full:
+                cursor.execute("LOCK TABLE vacancy IN SHARE MODE;")
+            cursor.execute("LOCK TABLE leaderboard IN SHARE ROW EXCLUSIVE MODE;")
+            if full:
+                cursor.execute(REBUILD_DAILY_QUERY)
+            cursor.execute(REBUILD_PERIODS_QUERY, {
+                'periods': periods,
+                'days': [PERIODS[period] for period in periods]
+            })
+            conn.commit()
+    print(f"Таблица лидеров {'пересчитана' if full else 'обновлена'}: {', '.join(periods)}")
+
+
+def get_leaderboard(dimension: str, period: str = 'all', limit: int = 10, order: str = 'postings') -> pd.DataFrame:
+    """Топ-limit значений измерения за окно по числу вакансий или средней зарплате (order)"""
+    if dimension not in DIMENSIONS:
+        raise ValueError(f"Неизвестное измерение: {dimension} (есть {', '.join(DIMENSIONS)})")
+    if period not in PERIODS:
+        raise ValueError(f"Неизвестное окно: {period} (есть {', '.join(PERIODS)})")
+    rows = execute_query(f"""
+        SELECT key, postings, salary_sum::float8 / NULLIF(salary_count, 0)
+        FROM leaderboard
+        WHERE dimension = %s AND period = %s AND postings > 0
+        ORDER BY {ORDERS[order]}
+        LIMIT %s;
+    """, (dimension, period, limit), fetch=True, readonly=True)
+    df = pd.DataFrame(rows, columns=LEADERBOARD_COLUMNS)
+    df['salary_avg'] = df['salary_avg'].astype(float)
+    return df
+
+
+if __name__ == "__main__":
+    refresh_leaderboards(full='--full' in sys.argv[1:])
@@ -0,0 +1,186 @@
+import pandas as pd
+from datetime import date
+from typing import List, Optional
+from database import execute_query, get_db_connection
+from change_feed import (
+    INITIAL_WATERMARK, get_changed_ids, get_changes_start,
+    load_watermark, get_current_watermark, save_watermark
+)
+from salary import SALARY_MID_SQL
+
+# Имя потребителя журнала изменений для водяного знака
+WATERMARK_NAME = 'daily_rollup'
+
+# Частота группировки дашборда -> единица date_trunc
+FREQ_UNITS = {'D': 'day', 'W': 'week', 'M': 'month'}
+
+ROLLUP_COLUMNS = ['date', 'posted', 'active', 'updated', 'expired', 'salary_sum', 'salary_count', 'salary_avg']
+
+# Вакансии (живые и архивные) с измерениями агрегатов
+SOURCE_QUERY = f"""
+    SELECT v.id, v.created_at, v.category_specialisation AS category, c.region_code,
+           {SALARY_MID_SQL.format(alias='v')} AS salary, NULL::timestamp AS archived_at
+    FROM vacancy v
+    JOIN company c ON v.company_code = c.company_code
+    {{vacancy_where}}
+    UNION ALL
+    SELECT a.id, a.created_at, a.category_specialisation, c.region_code,
+           {SALARY_MID_SQL.format(alias='a')}, a.archived_at
+    FROM vacancy_archive a
+    JOIN company c ON a.company_code = c.company_code
+    {{archive_where}}
+"""
+
+POSTED_QUERY = """
+    UPDATE vacancy_daily_rollup SET
+        posted = 0, salary_sum = 0, salary_count = 0, salary_min = NULL, salary_max = NULL
+    WHERE day = ANY(%(days)s);
+
+    INSERT INTO vacancy_daily_rollup (
+        day, category, region_code, posted, salary_sum, salary_count, salary_min, salary_max
+    )
+    SELECT created_at, category, region_code, count(*),
+           COALESCE(sum(salary), 0), count(salary), min(salary), max(salary)
+    FROM ({source}) s
+    GROUP BY created_at, category, region_code
+    ON CONFLICT (day, category, region_code) DO UPDATE SET
+        posted = EXCLUDED.posted,
+        salary_sum = EXCLUDED.salary_sum,
+        salary_count = EXCLUDED.salary_count,
+        salary_min = EXCLUDED.salary_min,
+        salary_max = EXCLUDED.salary_max;
+"""
+
+CHANGES_QUERY = """
+    UPDATE vacancy_daily_rollup SET updated = 0, expired = 0
+    WHERE day >= %(since)s;
+
+    INSERT INTO vacancy_daily_rollup (day, category, region_code, updated)
+    SELECT ch.changed_at::date, s.category, s.region_code, count(*)
+    FROM vacancy_changes ch
+    JOIN ({source}) s ON s.id = ch.vacancy_id
+    WHERE ch.operation = 'U' AND ch.changed_at >= %(since)s
+    GROUP BY 1, 2, 3
+    ON CONFLICT (day, category, region_code) DO UPDATE SET updated = EXCLUDED.updated;
+
+    INSERT INTO vacancy_daily_rollup (day, category, region_code, expired)
+    SELECT a.archived_at::date, a.category_specialisation, c.region_code, count(*)
+    FROM vacancy_archive a
+    JOIN company c ON a.company_code = c.company_code
+    WHERE a.archived_at >= %(since)s
+    GROUP BY 1, 2, 3
+    ON CONFLICT (day, category, region_code) DO UPDATE SET expired = EXCLUDED.expired;
+"""
+
+# Снимок числа активных вакансий на текущий день
+ACTIVE_QUERY = """
+    UPDATE vacancy_daily_rollup SET active = 0 WHERE day = CURRENT_DATE;
+
+    INSERT INTO vacancy_daily_rollup (day, category, region_code, active)
+    SELECT CURRENT_DATE, v.category_specialisation, c.region_code, count(*)
+    FROM vacancy v
+    JOIN company c ON v.company_code = c.company_code
+    GROUP BY 2, 3
+    ON CONFLICT (day, category, region_code) DO UPDATE SET active = EXCLUDED.active;
+"""
+
+TABLES = [
+    # Дневные агрегаты для анализа метрик: опубликовано, активно (снимок на день),
+    # обновлено, снято, зарплаты опубликованных за день вакансий
+    '''CREATE TABLE IF NOT EXISTS vacancy_daily_rollup (
+        day DATE NOT NULL,
+        category VARCHAR(100) NOT NULL,
+        region_code VARCHAR(20) NOT NULL,
+        posted INTEGER NOT NULL DEFAULT 0,
+        active INTEGER NOT NULL DEFAULT 0,
+        updated INTEGER NOT NULL DEFAULT 0,
+        expired INTEGER NOT NULL DEFAULT 0,
+        salary_sum NUMERIC NOT NULL DEFAULT 0,
+        salary_count INTEGER NOT NULL DEFAULT 0,
+        salary_min NUMERIC,
+        salary_max NUMERIC,
+        PRIMARY KEY (day, category, region_code)
+    );'''
+]
+
+def get_posted_days(vacancy_ids: Optional[List[str]] = None) -> List[date]:
+    """Даты публикации вакансий (всех или только перечисленных)"""
+    if vacancy_ids is None:
+        where, params = 'WHERE created_at IS NOT NULL', None
+    else:
+        where, params = 'WHERE id = ANY(%s)', (list(vacancy_ids), list(vacancy_ids))
+    rows = execute_query(f"""
+        SELECT created_at FROM vacancy {where}
+        UNION
+        SELECT created_at FROM vacancy_archive {where};
+    """, params, fetch=True)
+    return sorted(day for (day,) in rows if day is not None)
+
+def refresh_daily_rollup(full: bool = False):
+    """Обновляет дневные агрегаты vacancy_daily_rollup за дни, затронутые изменениями"""
+    previous = load_watermark(WATERMARK_NAME)
+    changed_ids, watermark = get_changed_ids(WATERMARK_NAME)
+    if full or watermark is None:
+        watermark = get_current_watermark()
+        posted_days = get_posted_days()
+        # Журнал хранится несколько месяцев: обновленные и снятые пересчитываются
+        # только за покрытый им период, более старые агрегаты остаются как есть
+        since = get_changes_start(INITIAL_WATERMARK)
+    else:
+        posted_days = get_posted_days(changed_ids) if changed_ids else []
+        since = get_changes_start(previous)
+
+    source = SOURCE_QUERY.format(
+        vacancy_where='WHERE v.created_at = ANY(%(days)s)',
+        archive_where='WHERE a.created_at = ANY(%(days)s)'
+    )
+    changes_source = SOURCE_QUERY.format(vacancy_where='', archive_where='')
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            if posted_days:
+                cursor.execute(POSTED_QUERY.format(source=source), {'days': posted_days})
+            if since is not None:
+                cursor.execute(CHANGES_QUERY.format(source=changes_source), {'since': since})
+            cursor.execute(ACTIVE_QUERY)
+            conn.commit()
+    save_watermark(WATERMARK_NAME, watermark)
+    print(f"Дневные агрегаты обновлены: {len(posted_days)} дней публикации, изменения с {since}")
+
+def get_rollup(since: Optional[date] = None, freq: str = 'D') -> pd.DataFrame:
+    """Динамика по дням, неделям или месяцам из дневных агрегатов"""
+    rows = execute_query("""
+        WITH daily AS (
+            SELECT day, sum(posted) AS posted, sum(active) AS active,
+                   sum(updated) AS updated, sum(expired) AS expired,
+                   sum(salary_sum) AS salary_sum, sum(salary_count) AS salary_count
+            FROM vacancy_daily_rollup
+            WHERE day >= %s
+            GROUP BY day
+        )
+        SELECT date_trunc(%s, day)::date AS period,
+               sum(posted),
+               (array_agg(active ORDER BY day DESC))[1],
+               sum(updated),
+               sum(expired),
+               sum(salary_sum),
+               sum(salary_count),
+               sum(salary_sum) / NULLIF(sum(salary_count), 0)
+        FROM daily
+        GROUP BY 1
+        ORDER BY 1;
+    """, (since or date(1970, 1, 1), FREQ_UNITS[freq]), fetch=True, readonly=True)
+    df = pd.DataFrame(rows, columns=ROLLUP_COLUMNS)
+    df['date'] = pd.to_datetime(df['date'])
+    df['salary_sum'] = df['salary_sum'].astype(float)
+    df['salary_count'] = df['salary_count'].astype(int)
+    df['salary_avg'] = df['salary_avg'].astype(float)
+    return df
+
+def count_companies(since: Optional[date] = None) -> int:
+    """Число компаний с вакансиями, опубликованными начиная с since"""
+    rows = execute_query("""
+        SELECT count(DISTINCT company_code)
+        FROM vacancy
+        WHERE created_at >= %s;
+    """, (since or date(1970, 1, 1),), fetch=True, readonly=True)
+    return rows[0][0]
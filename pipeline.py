@@ -0,0 +1,180 @@
+import sys
+from datetime import datetime
+from functools import partial
+from statistics import median
+from typing import Dict, List, Optional
+from database import execute_query
+
+# Сбор, обработка (pandas, spacy) и запись (asyncpg) импортируются в run():
+# профили и DEFAULT_PROFILE читаются при разборе DAG без тяжелых модулей
+
+# Профили загрузки для initial_load и DAG: max_vacancies - лимит на источник,
+# sources - None для sources.DEFAULT_SOURCES, cache_max_age - срок свежести
+# кэша HTTP (0 - перепроверка через ETag, None - CACHE_TTL)
+PROFILES = {
+    # Быстрый прогон без NLP (локальная проверка, замеры). Названия остаются
+    # исходными, поэтому в БД, заполненной профилем full, вакансии перезапишутся
+    'fast': {
+        'nlp': False,
+        'max_vacancies': 2000,
+        'commit_size': 500,
+        'queue_size': 5,
+        'update_existing': True,
+        'sources': None,
+        'cache_max_age': 0
+    },
+    'full': {
+        'nlp': True,
+        'max_vacancies': 2000,
+        'commit_size': 500,
+        'queue_size': 5,
+        'update_existing': True,
+        'sources': None,
+        'cache_max_age': 0
+    },
+    # Догрузка большого объема: крупные транзакции и длинная очередь
+    'backfill': {
+        'nlp': True,
+        'max_vacancies': 100000,
+        'commit_size': 5000,
+        'queue_size': 20,
+        'update_existing': True,
+        'sources': None,
+        'cache_max_age': None
+    }
+}
+
+DEFAULT_PROFILE = 'full'
+
+
+TABLES = [
+    # Статистика запусков загрузки: новые, обновленные и неизменные вакансии
+    # (по ней подбираются интервал запуска DAG и объем обхода)
+    '''CREATE TABLE IF NOT EXISTS pipeline_run (
+        run_id SERIAL PRIMARY KEY,
+        profile VARCHAR(20) NOT NULL,
+        started_at TIMESTAMP NOT NULL,
+        finished_at TIMESTAMP NOT NULL,
+        max_vacancies INTEGER NOT NULL,
+        fetched INTEGER NOT NULL,
+        loaded INTEGER NOT NULL,
+        inserted INTEGER NOT NULL,
+        updated INTEGER NOT NULL,
+        unchanged INTEGER NOT NULL,
+        total_seconds DOUBLE PRECISION NOT NULL
+    );''',
+    '''CREATE INDEX IF NOT EXISTS idx_pipeline_run_profile_started_at
+        ON pipeline_run (profile, started_at);''',
+    # Обойденные источники и те из них, чей каталог пройден до конца
+    # (для отчета; снятые вакансии определяются по crawl_pass)
+    '''ALTER TABLE pipeline_run
+        ADD COLUMN IF NOT EXISTS sources TEXT[] NOT NULL DEFAULT '{}',
+        ADD COLUMN IF NOT EXISTS complete_sources TEXT[] NOT NULL DEFAULT '{}';''',
+    # Страницы, отданные из свежего кэша HTTP без запроса к API
+    '''ALTER TABLE pipeline_run
+        ADD COLUMN IF NOT EXISTS cached_pages INTEGER NOT NULL DEFAULT 0;'''
+]
+
+
+def get_profile(name: str = DEFAULT_PROFILE, **overrides) -> Dict:
+    """Настройки профиля с переопределенными значениями"""
+    if name not in PROFILES:
+        raise ValueError(f"Неизвестный профиль загрузки: {name} (есть {', '.join(PROFILES)})")
+    return {**PROFILES[name], **overrides}
+
+
+def run(
+    profile: str = DEFAULT_PROFILE,
+    sources: Optional[List[str]] = None,
+    dry_run: bool = False,
+    **overrides
+) -> Dict:
+    """Собирает вакансии из источников и загружает их в БД по профилю (dry_run - без сохранения)"""
+    from async_loader import run_pipeline
+    from sources import get_sources
+    from vacancy_expiry import finish_passes, start_passes
+    from vacancy_processor import prepare_vacancies
+
+    settings = get_profile(profile, **overrides)
+    print(f"Профиль загрузки {profile}: {settings}")
+    started_at = datetime.now()
+    adapters = get_sources(sources or settings['sources'], max_age=settings['cache_max_age'])
+    fetchers = list({id(adapter.http): adapter.http for adapter in adapters}.values())
+    cache_hits = sum(http.stats['cache_hits'] for http in fetchers)
+    passes = {} if dry_run else start_passes([adapter.name for adapter in adapters], profile)
+    stats = run_pipeline(
+        fetch_page=None,
+        prepare=partial(prepare_vacancies, nlp=settings['nlp']),
+        max_vacancies=settings['max_vacancies'],
+        queue_size=settings['queue_size'],
+        commit_size=settings['commit_size'],
+        update_existing=settings['update_existing'],
+        sources=adapters,
+        passes=passes,
+        dry_run=dry_run
+    )
+    finish_passes(passes, stats['complete_sources'])
+    for http in fetchers:
+        http.purge_cache()
+    # Страницы из свежего кэша (без запроса): изменения на них не видны
+    stats['cached_pages'] = sum(http.stats['cache_hits'] for http in fetchers) - cache_hits
+    stats['profile'] = profile
+    if stats['total_seconds']:
+        print(f"Профиль {profile}: {stats['loaded'] / stats['total_seconds']:.1f} вакансий/с")
+    if not dry_run:
+        record_run(profile, settings, stats, started_at)
+    return stats
+
+
+def record_run(profile: str, settings: Dict, stats: Dict, started_at: datetime):
+    """Сохраняет статистику запуска (по ней adaptive_schedule выбирает интервал и объем обхода)"""
+    execute_query("""
+        INSERT INTO pipeline_run (
+            profile, started_at, finished_at, max_vacancies,
+            fetched, loaded, inserted, updated, unchanged, total_seconds,
+            sources, complete_sources, cached_pages
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
+    """, (
+        profile, started_at, datetime.now(), settings['max_vacancies'],
+        stats['fetched'], stats['loaded'], stats['inserted'], stats['updated'],
+        stats['loaded'] - stats['inserted'] - stats['updated'], stats['total_seconds'],
+        stats['sources'], stats['complete_sources'], stats.get('cached_pages', 0)
+    ))
+
+
+BENCHMARK_COLUMNS = ['fetch_seconds', 'prepare_seconds', 'load_seconds', 'total_seconds']
+
+
+def benchmark(
+    profiles: Optional[List[str]] = None,
+    sources: Optional[List[str]] = None,
+    max_vacancies: int = 2000,
+    repeat: int = 3
+) -> Dict[str, Dict]:
+    """Сравнивает профили загрузки на одном объеме вакансий в режиме dry_run, возвращает медианы"""
+    results = {}
+    for profile in profiles or list(PROFILES):
+        runs = [
+            run(profile, sources, dry_run=True, max_vacancies=max_vacancies, cache_max_age=None)
+            for _ in range(repeat + 1)
+        ][1:]
+        result = {column: median(stats[column] for stats in runs) for column in BENCHMARK_COLUMNS}
+        result['loaded'] = median(stats['loaded'] for stats in runs)
+        result['vacancies_per_second'] = result['loaded'] / result['total_seconds'] if result['total_seconds'] else 0.0
+        results[profile] = result
+
+    print(f"Замер профилей: {max_vacancies} вакансий на источник, медиана {repeat} запусков")
+    for profile, result in results.items():
+        print(
+            f"{profile:>10}: {result['vacancies_per_second']:8.1f} вакансий/с, "
+            f"сбор {result['fetch_seconds']:.1f} с, обработка {result['prepare_seconds']:.1f} с, "
+            f"загрузка {result['load_seconds']:.1f} с, всего {result['total_seconds']:.1f} с"
+        )
+    return results
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ['--benchmark']:
+        benchmark(sys.argv[2:] or None)
+    else:
+        run(*sys.argv[1:2])
@@ -0,0 +1,216 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from time import monotonic
+from typing import Dict, Optional, Tuple
+from psycopg2.extras import execute_values
+from database import execute_query, get_db_connection
+
+# Флаги качества зарплаты. В средних и перцентилях участвуют только USABLE_QUALITY
+QUALITY_OK = 'ok'
+QUALITY_SCALED = 'scaled'      # значение похоже на почасовую ставку и пересчитано в месячную
+QUALITY_SWAPPED = 'swapped'    # "от" больше "до", границы переставлены
+QUALITY_MISSING = 'missing'    # зарплата не указана
+QUALITY_OUTLIER = 'outlier'    # вне границ для категории
+USABLE_QUALITY = (QUALITY_OK, QUALITY_SCALED, QUALITY_SWAPPED)
+
+# Средняя зарплата для SQL: NULL, если значение не годится для статистики
+SALARY_MID_SQL = "CASE WHEN {alias}.salary_quality IN ('ok', 'scaled', 'swapped') THEN {alias}.salary_norm_mid END"
+
+# Значения меньше HOURLY_LIMIT считаются почасовыми (часов в месяце при 40-часовой неделе)
+HOURLY_LIMIT = 1000
+HOURS_PER_MONTH = 164
+
+# Границы выбросов: медиана +- MAD_K * MAD по логарифму зарплаты в категории
+# (при нулевом MAD - IQR_K межквартильных размахов от квартилей)
+MAD_K = 3.5
+IQR_K = 3.0
+MIN_SAMPLE = 30
+ALL_CATEGORIES = '*'
+
+# Границы пересчитываются не чаще раза в BOUNDS_MAX_AGE,
+# в памяти процесса перечитываются из БД раз в BOUNDS_CACHE_SECONDS
+BOUNDS_MAX_AGE = timedelta(days=1)
+BOUNDS_CACHE_SECONDS = 600
+
+NORMALIZED_COLUMNS = ['salary_norm_min', 'salary_norm_max', 'salary_norm_mid', 'salary_quality']
+
+# data_hash не меняется, поэтому запись в журнал (операция 'N') делается здесь
+RENORMALIZE_QUERY = """
+    WITH updated AS (
+        UPDATE vacancy v SET
+            salary_norm_min = u.salary_norm_min::integer,
+            salary_norm_max = u.salary_norm_max::integer,
+            salary_norm_mid = u.salary_norm_mid::integer,
+            salary_quality = u.salary_quality
+        FROM (VALUES %s) AS u(id, salary_norm_min, salary_norm_max, salary_norm_mid, salary_quality)
+        WHERE v.id = u.id
+        RETURNING v.id, v.data_hash
+    )
+    INSERT INTO vacancy_changes (vacancy_id, operation, old_hash, new_hash, changed_fields)
+    SELECT id, 'N', data_hash, data_hash,
+           ARRAY['salary_norm_max', 'salary_norm_mid', 'salary_norm_min', 'salary_quality']
+    FROM updated;
+"""
+
+_bounds_cache = {'loaded_at': None, 'bounds': {}}
+
+
+TABLES = [
+    # Нормализованные зарплаты (месячные, без нулей и перепутанных границ)
+    # и флаг качества; границы выбросов по категориям - в salary_bounds
+    '''ALTER TABLE vacancy
+        ADD COLUMN IF NOT EXISTS salary_norm_min INTEGER,
+        ADD COLUMN IF NOT EXISTS salary_norm_max INTEGER,
+        ADD COLUMN IF NOT EXISTS salary_norm_mid INTEGER,
+        ADD COLUMN IF NOT EXISTS salary_quality VARCHAR(10);''',
+    '''ALTER TABLE vacancy_archive
+        ADD COLUMN IF NOT EXISTS salary_norm_min INTEGER,
+        ADD COLUMN IF NOT EXISTS salary_norm_max INTEGER,
+        ADD COLUMN IF NOT EXISTS salary_norm_mid INTEGER,
+        ADD COLUMN IF NOT EXISTS salary_quality VARCHAR(10);''',
+    '''CREATE TABLE IF NOT EXISTS salary_bounds (
+        category VARCHAR(100) PRIMARY KEY,
+        lower_bound DOUBLE PRECISION NOT NULL,
+        upper_bound DOUBLE PRECISION NOT NULL,
+        sample_size INTEGER NOT NULL,
+        computed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );'''
+]
+
+
+def clean_salaries(salary_min: pd.Series, salary_max: pd.Series) -> pd.DataFrame:
+    """Чистит вилки зарплат векторно: нули, недостающие границы, почасовые ставки, перепутанные границы"""
+    low = pd.to_numeric(salary_min, errors='coerce').to_numpy(dtype=float)
+    high = pd.to_numeric(salary_max, errors='coerce').to_numpy(dtype=float)
+    low[low <= 0] = np.nan
+    high[high <= 0] = np.nan
+    low = np.where(np.isnan(low), high, low)
+    high = np.where(np.isnan(high), low, high)
+
+    quality = np.full(len(low), QUALITY_OK, dtype=object)
+    hourly_low, hourly_high = low < HOURLY_LIMIT, high < HOURLY_LIMIT
+    low = np.where(hourly_low, low * HOURS_PER_MONTH, low)
+    high = np.where(hourly_high, high * HOURS_PER_MONTH, high)
+    quality[hourly_low | hourly_high] = QUALITY_SCALED
+
+    swapped = low > high
+    low, high = np.where(swapped, high, low), np.where(swapped, low, high)
+    quality[swapped] = QUALITY_SWAPPED
+    quality[np.isnan(low)] = QUALITY_MISSING
+
+    return pd.DataFrame({
+        'low': low,
+        'high': high,
+        'mid': (low + high) / 2,
+        'quality': quality
+    }, index=salary_min.index)
+
+
+def robust_bounds(values: np.ndarray) -> Tuple[float, float]:
+    """Границы выбросов по MAD (или IQR) для логарифмов зарплат"""
+    median = np.median(values)
+    mad = np.median(np.abs(values - median)) * 1.4826
+    if mad > 0:
+        return median - MAD_K * mad, median + MAD_K * mad
+    q1, q3 = np.percentile(values, [25, 75])
+    iqr = q3 - q1
+    return q1 - IQR_K * iqr, q3 + IQR_K * iqr
+
+
+def compute_bounds(mid: pd.Series, categories: pd.Series) -> Dict[str, Tuple[float, float, int]]:
+    """Границы (нижняя, верхняя, размер выборки) по категориям и общие ('*')"""
+    valid = mid.notna() & (mid > 0)
+    logs = np.log(mid[valid].to_numpy(dtype=float))
+    if not len(logs):
+        return {}
+    bounds = {ALL_CATEGORIES: (*np.exp(robust_bounds(logs)), len(logs))}
+    for category, values in pd.Series(logs, index=categories[valid].to_numpy()).groupby(level=0):
+        if len(values) >= MIN_SAMPLE:
+            bounds[category] = (*np.exp(robust_bounds(values.to_numpy())), len(values))
+    return bounds
+
+
+def get_salary_bounds() -> Dict[str, Tuple[float, float, int]]:
+    """Границы из таблицы salary_bounds (кэшируются в памяти процесса)"""
+    loaded_at = _bounds_cache['loaded_at']
+    if loaded_at is None or monotonic() - loaded_at > BOUNDS_CACHE_SECONDS:
+        rows = execute_query(
+            "SELECT category, lower_bound, upper_bound, sample_size FROM salary_bounds;",
+            fetch=True
+        )
+        _bounds_cache['bounds'] = {category: (lower, upper, size) for category, lower, upper, size in rows}
+        _bounds_cache['loaded_at'] = monotonic()
+    return _bounds_cache['bounds']
+
+
+def normalize_salaries(
+    salary_min: pd.Series,
+    salary_max: pd.Series,
+    categories: pd.Series,
+    bounds: Optional[Dict[str, Tuple[float, float, int]]] = None
+) -> pd.DataFrame:
+    """Нормализованные зарплаты и флаг качества (выбросы - по границам категории) для prepare_vacancy_data"""
+    cleaned = clean_salaries(salary_min, salary_max)
+    if bounds is None:
+        bounds = get_salary_bounds()
+
+    quality = cleaned['quality'].to_numpy(dtype=object)
+    if ALL_CATEGORIES in bounds:
+        default_lower, default_upper, _ = bounds[ALL_CATEGORIES]
+        lower = categories.map({c: b[0] for c, b in bounds.items()}).fillna(default_lower).to_numpy(dtype=float)
+        upper = categories.map({c: b[1] for c, b in bounds.items()}).fillna(default_upper).to_numpy(dtype=float)
+        mid = cleaned['mid'].to_numpy()
+        quality[(mid < lower) | (mid > upper)] = QUALITY_OUTLIER
+
+    def as_int(values: pd.Series) -> pd.Series:
+        # Целые python (или None) - их примут и psycopg2, и asyncpg
+        return values.round().map(lambda value: None if pd.isna(value) else int(value))
+
+    return pd.DataFrame({
+        'salary_norm_min': as_int(cleaned['low']),
+        'salary_norm_max': as_int(cleaned['high']),
+        'salary_norm_mid': as_int(cleaned['mid']),
+        'salary_quality': quality
+    }, index=salary_min.index)
+
+
+def refresh_salary_bounds(force: bool = False):
+    """Пересчитывает границы выбросов и нормализованные зарплаты в vacancy"""
+    rows = execute_query("SELECT max(computed_at) FROM salary_bounds;", fetch=True)
+    computed_at = rows[0][0]
+    if not force and computed_at and datetime.now() - computed_at < BOUNDS_MAX_AGE:
+        print("Границы зарплат актуальны")
+        return
+
+    stored = pd.DataFrame(execute_query("""
+        SELECT id, category_specialisation, salary_min, salary_max,
+               salary_norm_min, salary_norm_max, salary_norm_mid, salary_quality
+        FROM vacancy;
+    """, fetch=True), columns=['id', 'category', 'salary_min', 'salary_max', *NORMALIZED_COLUMNS])
+    if stored.empty:
+        return
+
+    cleaned = clean_salaries(stored['salary_min'], stored['salary_max'])
+    bounds = compute_bounds(cleaned['mid'], stored['category'])
+    normalized = normalize_salaries(stored['salary_min'], stored['salary_max'], stored['category'], bounds)
+
+    changed = stored['salary_quality'].fillna('').ne(normalized['salary_quality'])
+    for column in NORMALIZED_COLUMNS[:3]:
+        changed |= pd.to_numeric(stored[column]).fillna(-1).ne(
+            pd.to_numeric(normalized[column]).fillna(-1)
+        )
+    updates = pd.concat([stored['id'], normalized], axis=1)[changed]
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM salary_bounds;")
+            execute_values(cursor, """
+                INSERT INTO salary_bounds (category, lower_bound, upper_bound, sample_size)
+                VALUES %s;
+            """, [(category, float(lower), float(upper), int(size)) for category, (lower, upper, size) in bounds.items()])
+            if not updates.empty:
+                execute_values(cursor, RENORMALIZE_QUERY, list(updates.itertuples(index=False, name=None)))
+            conn.commit()
+    _bounds_cache['loaded_at'] = None
+    print(f"Границы зарплат пересчитаны для {len(bounds)} категорий, обновлено {len(updates)} вакансий")
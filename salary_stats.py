@@ -0,0 +1,171 @@
+import pandas as pd
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+from database import execute_query, get_db_connection
+from change_feed import get_changed_ids, get_current_watermark, save_watermark
+from salary import SALARY_MID_SQL
+
+# Имя потребителя журнала изменений для водяного знака
+WATERMARK_NAME = 'salary_stats'
+
+# Значение измерения "все" в строках-итогах
+ALL = '*'
+
+# Итоги по всем регионам считаются по всей таблице vacancy, поэтому
+# пересчитываются не чаще раза в TOTALS_MAX_AGE (и при полном пересчете)
+TOTALS_MAX_AGE = timedelta(hours=6)
+
+STATS_COLUMNS = [
+    'region_code', 'experience', 'education', 'category',
+    'salary_count', 'salary_mean', 'salary_median',
+    'salary_p25', 'salary_p75', 'salary_p90'
+]
+
+# Строки с измерениями вакансии (опыт приводится к кодам 0-3, как в дашборде)
+SOURCE_QUERY = f"""
+    SELECT c.region_code,
+           CASE WHEN v.requirement_experience ~ '^[0-3]'
+                THEN left(v.requirement_experience, 1) ELSE '0' END AS experience,
+           v.requirement_education AS education,
+           v.category_specialisation AS category,
+           {SALARY_MID_SQL.format(alias='v')} AS salary_avg
+    FROM vacancy v
+    JOIN company c ON v.company_code = c.company_code
+    {{where}}
+"""
+
+AGGREGATE_QUERY = """
+    INSERT INTO salary_stats (
+        region_code, experience, education, category,
+        salary_count, salary_mean, salary_median,
+        salary_p25, salary_p75, salary_p90
+    )
+    SELECT {region},
+           COALESCE(experience, '*'),
+           COALESCE(education, '*'),
+           COALESCE(category, '*'),
+           count(salary_avg),
+           avg(salary_avg),
+           percentile_cont(0.5) WITHIN GROUP (ORDER BY salary_avg),
+           percentile_cont(0.25) WITHIN GROUP (ORDER BY salary_avg),
+           percentile_cont(0.75) WITHIN GROUP (ORDER BY salary_avg),
+           percentile_cont(0.9) WITHIN GROUP (ORDER BY salary_avg)
+    FROM ({source}) s
+    GROUP BY {grouping};
+"""
+
+TABLES = [
+    # Предрассчитанная статистика зарплат ('*' - итог по измерению)
+    '''CREATE TABLE IF NOT EXISTS salary_stats (
+        region_code VARCHAR(20) NOT NULL,
+        experience VARCHAR(100) NOT NULL,
+        education VARCHAR(100) NOT NULL,
+        category VARCHAR(100) NOT NULL,
+        salary_count INTEGER NOT NULL,
+        salary_mean NUMERIC(12, 2),
+        salary_median DOUBLE PRECISION,
+        salary_p25 DOUBLE PRECISION,
+        salary_p75 DOUBLE PRECISION,
+        salary_p90 DOUBLE PRECISION,
+        refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (region_code, experience, education, category)
+    );'''
+]
+
+def refresh_regions(cursor, region_codes: Optional[Iterable[str]] = None, totals: bool = True):
+    """Пересчитывает статистику регионов (None - всех) и при totals итоговые строки"""
+    if region_codes is None:
+        cursor.execute("DELETE FROM salary_stats WHERE region_code <> %s;", (ALL,))
+        where, params = '', None
+    else:
+        region_codes = list(region_codes)
+        cursor.execute("DELETE FROM salary_stats WHERE region_code = ANY(%s);", (region_codes,))
+        where, params = 'WHERE c.region_code = ANY(%s)', (region_codes,)
+
+    if region_codes is None or region_codes:
+        cursor.execute(AGGREGATE_QUERY.format(
+            region='region_code',
+            source=SOURCE_QUERY.format(where=where),
+            grouping='region_code, CUBE (experience, education, category)'
+        ), params)
+
+    if not totals:
+        return
+    cursor.execute("DELETE FROM salary_stats WHERE region_code = %s;", (ALL,))
+    cursor.execute(AGGREGATE_QUERY.format(
+        region="'*'",
+        source=SOURCE_QUERY.format(where=''),
+        grouping='CUBE (experience, education, category)'
+    ))
+
+def get_affected_regions(vacancy_ids: Iterable[str]) -> set:
+    """Регионы вакансий из журнала изменений (включая перенесенные в архив)"""
+    rows = execute_query("""
+        SELECT DISTINCT c.region_code
+        FROM (
+            SELECT company_code FROM vacancy WHERE id = ANY(%s)
+            UNION ALL
+            SELECT company_code FROM vacancy_archive WHERE id = ANY(%s)
+        ) v
+        JOIN company c ON v.company_code = c.company_code;
+    """, (list(vacancy_ids), list(vacancy_ids)), fetch=True)
+    return {region_code for (region_code,) in rows}
+
+def totals_due() -> bool:
+    """Пора ли пересчитать итоги по всем регионам (нет итогов или они старше TOTALS_MAX_AGE)"""
+    rows = execute_query("""
+        SELECT max(refreshed_at) FILTER (WHERE region_code = %s),
+               max(refreshed_at) FILTER (WHERE region_code <> %s)
+        FROM salary_stats;
+    """, (ALL, ALL), fetch=True)
+    totals_at, regions_at = rows[0]
+    if totals_at is None:
+        return True
+    return regions_at is not None and regions_at > totals_at and datetime.now() - totals_at >= TOTALS_MAX_AGE
+
+def refresh_salary_stats(full: bool = False):
+    """Обновляет salary_stats по регионам, затронутым изменениями (full=True - целиком)"""
+    changed_ids, watermark = get_changed_ids(WATERMARK_NAME)
+    if full or watermark is None:
+        watermark = get_current_watermark()
+        regions, totals = None, True
+    else:
+        regions, totals = get_affected_regions(changed_ids) if changed_ids else set(), totals_due()
+        if not regions and not totals:
+            print("Статистика зарплат актуальна")
+            return
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            refresh_regions(cursor, regions, totals)
+            conn.commit()
+    save_watermark(WATERMARK_NAME, watermark)
+    print(
+        "Статистика зарплат пересчитана "
+        + ("полностью" if regions is None else f"для {len(regions)} регионов")
+        + ("" if regions is None or not totals else ", итоги по всем регионам")
+    )
+
+def get_salary_stats(
+    region_code: str = ALL,
+    experience: Optional[str] = None,
+    education: Optional[str] = ALL,
+    category: Optional[str] = ALL
+) -> pd.DataFrame:
+    """Возвращает предрассчитанную статистику зарплат (None - разбивка по измерению, '*' - итог)"""
+    conditions, params = ['region_code = %s'], [region_code]
+    for column, value in (('experience', experience), ('education', education), ('category', category)):
+        if value is None:
+            conditions.append(f"{column} <> %s")
+            params.append(ALL)
+        else:
+            conditions.append(f"{column} = %s")
+            params.append(value)
+
+    rows = execute_query(f"""
+        SELECT {', '.join(STATS_COLUMNS)}
+        FROM salary_stats
+        WHERE {' AND '.join(conditions)}
+        ORDER BY experience, education, category;
+    """, tuple(params), fetch=True, readonly=True)
+    return pd.DataFrame(rows, columns=STATS_COLUMNS)
@@ -0,0 +1,114 @@
+import pandas as pd
+from typing import List, Optional, Tuple
+from database import get_db_connection
+from salary import SALARY_MID_SQL
+
+# Колонки результата поиска (совпадают с таблицей в дашборде)
+SEARCH_COLUMNS = [
+    'id', 'job_name', 'company_name', 'region_name',
+    'salary_min', 'salary_max', 'salary_avg',
+    'employment', 'category_specialisation', 'city', 'date', 'rank'
+]
+
+# Каждая ветка UNION читается по своему индексу: GIN по search_vector,
+# триграммный GIN по job_name и триграммный GIN по company_name с переходом
+# к вакансиям по индексу company_code (через OR планировщик читал бы всю vacancy)
+SEARCH_QUERY = f"""
+WITH matched_ids AS (
+    SELECT id FROM vacancy
+    WHERE search_vector @@ websearch_to_tsquery('russian', %(query)s)
+    UNION
+    SELECT id FROM vacancy
+    WHERE job_name %% %(query)s
+    UNION
+    SELECT v.id
+    FROM company c
+    JOIN vacancy v ON v.company_code = c.company_code
+    WHERE c.company_name %% %(query)s
+), matched AS (
+    SELECT v.*,
+           ts_rank_cd(v.search_vector, websearch_to_tsquery('russian', %(query)s))
+           + similarity(v.job_name, %(query)s) AS rank
+    FROM matched_ids i
+    JOIN vacancy v ON v.id = i.id
+)
+SELECT m.id, m.job_name, c.company_name, r.region_name,
+       m.salary_norm_min AS salary_min, m.salary_norm_max AS salary_max,
+       {SALARY_MID_SQL.format(alias='m')} AS salary_avg,
+       m.employment, m.category_specialisation, r.city, m.last_updated AS date,
+       m.rank, count(*) OVER () AS total
+FROM matched m
+LEFT JOIN company c ON m.company_code = c.company_code
+LEFT JOIN region r ON c.region_code = r.region_code
+WHERE (%(categories)s::text[] IS NULL OR m.category_specialisation = ANY(%(categories)s))
+  AND (%(regions)s::text[] IS NULL OR r.region_name = ANY(%(regions)s))
+  AND (%(employment)s::text[] IS NULL OR m.employment = ANY(%(employment)s))
+  AND (%(salary_from)s::numeric IS NULL OR
+       {SALARY_MID_SQL.format(alias='m')} BETWEEN %(salary_from)s AND %(salary_to)s)
+ORDER BY m.rank DESC, m.last_updated DESC
+LIMIT %(limit)s OFFSET %(offset)s;
+"""
+
+TABLES = [
+    # Полнотекстовый (russian) и триграммный поиск по вакансиям и компаниям.
+    # search_vector пересчитывается триггером при вставке и изменении вакансии
+    '''CREATE EXTENSION IF NOT EXISTS pg_trgm;''',
+    '''ALTER TABLE vacancy ADD COLUMN IF NOT EXISTS search_vector TSVECTOR;''',
+    '''CREATE OR REPLACE FUNCTION vacancy_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('russian', COALESCE(NEW.job_name, '')), 'A') ||
+            setweight(to_tsvector('russian', COALESCE(
+                (SELECT company_name FROM company WHERE company_code = NEW.company_code), ''
+            )), 'B');
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;''',
+    '''DROP TRIGGER IF EXISTS vacancy_search_vector ON vacancy;
+    CREATE TRIGGER vacancy_search_vector
+        BEFORE INSERT OR UPDATE OF job_name, company_code ON vacancy
+        FOR EACH ROW EXECUTE FUNCTION vacancy_search_vector_update();''',
+    '''UPDATE vacancy v SET search_vector =
+            setweight(to_tsvector('russian', v.job_name), 'A') ||
+            setweight(to_tsvector('russian', COALESCE(c.company_name, '')), 'B')
+        FROM company c
+        WHERE c.company_code = v.company_code AND v.search_vector IS NULL;''',
+    '''CREATE INDEX IF NOT EXISTS idx_vacancy_search_vector
+        ON vacancy USING GIN (search_vector);''',
+    '''CREATE INDEX IF NOT EXISTS idx_vacancy_job_name_trgm
+        ON vacancy USING GIN (job_name gin_trgm_ops);''',
+    '''CREATE INDEX IF NOT EXISTS idx_company_name_trgm
+        ON company USING GIN (company_name gin_trgm_ops);''',
+    '''CREATE INDEX IF NOT EXISTS idx_vacancy_company_code
+        ON vacancy (company_code);'''
+]
+
+def search_vacancies(
+    query: str,
+    categories: Optional[List[str]] = None,
+    regions: Optional[List[str]] = None,
+    employment: Optional[List[str]] = None,
+    salary_range: Optional[Tuple[float, float]] = None,
+    limit: int = 50,
+    offset: int = 0
+) -> Tuple[pd.DataFrame, int]:
+    """Полнотекстовый и триграммный поиск: страница результатов по релевантности и общее число"""
+    params = {
+        'query': query.strip(),
+        'categories': list(categories) if categories else None,
+        'regions': list(regions) if regions else None,
+        'employment': list(employment) if employment else None,
+        'salary_from': salary_range[0] if salary_range else None,
+        'salary_to': salary_range[1] if salary_range else None,
+        'limit': limit,
+        'offset': offset
+    }
+    with get_db_connection(readonly=True) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(SEARCH_QUERY, params)
+            rows = cursor.fetchall()
+
+    if not rows:
+        return pd.DataFrame(columns=SEARCH_COLUMNS), 0
+    total = rows[0][-1]
+    return pd.DataFrame([row[:-1] for row in rows], columns=SEARCH_COLUMNS), total
@@ -0,0 +1,119 @@
+import re
+import asyncpg
+import pandas as pd
+from typing import Dict, Iterable, Optional
+from database import execute_query
+
+# Колонки навыков после разворачивания вакансии: skills_0, skills_1, ...
+SKILL_COLUMN = re.compile(r'skills_\d+$')
+
+# Добавляет недостающие навыки (по порядку имен - без взаимных блокировок)
+# и возвращает id всех переданных
+INTERN_QUERY = """
+WITH input AS (
+    SELECT DISTINCT unnest($1::text[]) AS name
+), inserted AS (
+    INSERT INTO skill (name)
+    SELECT name FROM input ORDER BY name
+    ON CONFLICT (name) DO NOTHING
+    RETURNING skill_id, name
+)
+SELECT skill_id, name FROM inserted
+UNION ALL
+SELECT s.skill_id, s.name FROM skill s JOIN input i ON i.name = s.name;
+"""
+
+# Навык, который одновременно добавила другая загрузка, не виден ни в
+# RETURNING, ни в снимке INTERN_QUERY - он читается следующим запросом
+LOOKUP_QUERY = "SELECT skill_id, name FROM skill WHERE name = ANY($1::text[]);"
+
+TOP_SKILLS_QUERY = """
+    SELECT s.name, count(*) AS vacancies
+    FROM vacancy_skill vs
+    JOIN skill s ON s.skill_id = vs.skill_id
+    JOIN vacancy v ON v.id = vs.vacancy_id
+    JOIN company c ON c.company_code = v.company_code
+    JOIN region r ON r.region_code = c.region_code
+    WHERE (%(category)s::text IS NULL OR v.category_specialisation = %(category)s)
+      AND (%(region_name)s::text IS NULL OR r.region_name = %(region_name)s)
+    GROUP BY s.name
+    ORDER BY vacancies DESC, s.name
+    LIMIT %(limit)s;
+"""
+
+
+TABLES = [
+    # Словарь навыков и связь вакансия-навык (вместо колонок skills_0..skills_31)
+    '''CREATE TABLE IF NOT EXISTS skill (
+        skill_id SERIAL PRIMARY KEY,
+        name VARCHAR(255) NOT NULL UNIQUE
+    );''',
+    '''CREATE TABLE IF NOT EXISTS vacancy_skill (
+        vacancy_id VARCHAR(36) NOT NULL,
+        skill_id INTEGER NOT NULL,
+        PRIMARY KEY (vacancy_id, skill_id),
+        FOREIGN KEY (vacancy_id) REFERENCES vacancy(id) ON DELETE CASCADE,
+        FOREIGN KEY (skill_id) REFERENCES skill(skill_id)
+    );''',
+    # Индексы для топа навыков по категории и региону
+    '''CREATE INDEX IF NOT EXISTS idx_vacancy_skill_skill_id
+        ON vacancy_skill (skill_id, vacancy_id);''',
+    '''CREATE INDEX IF NOT EXISTS idx_vacancy_category
+        ON vacancy (category_specialisation);''',
+    '''CREATE INDEX IF NOT EXISTS idx_company_region_code
+        ON company (region_code);''',
+    '''CREATE INDEX IF NOT EXISTS idx_region_name
+        ON region (region_name);'''
+]
+
+
+def normalize_skill(name) -> str:
+    """Приводит навык к виду для словаря: нижний регистр, одиночные пробелы"""
+    return ' '.join(str(name).lower().split())[:255]
+
+
+def extract_skills(df: pd.DataFrame) -> pd.Series:
+    """Собирает навыки из колонок skills_N в список на вакансию (без повторов)"""
+    skill_columns = [column for column in df.columns if SKILL_COLUMN.match(column)]
+    if not skill_columns:
+        return pd.Series([[] for _ in range(len(df))], index=df.index, dtype=object)
+    stacked = df[skill_columns].stack().map(normalize_skill)
+    stacked = stacked[stacked != '']
+    lists = stacked.groupby(level=0).agg(list).map(lambda names: list(dict.fromkeys(names)))
+    return lists.reindex(df.index).map(lambda names: names if isinstance(names, list) else [])
+
+
+class SkillCache:
+    """Кэш id навыков в памяти процесса"""
+
+    def __init__(self):
+        self.ids = {}
+
+    async def resolve(self, conn: asyncpg.Connection, names: Iterable[str]) -> Dict[str, int]:
+        missing = [name for name in set(names) if name not in self.ids]
+        if missing:
+            rows = await conn.fetch(INTERN_QUERY, missing)
+            self.ids.update({row['name']: row['skill_id'] for row in rows})
+            concurrent = [name for name in missing if name not in self.ids]
+            if concurrent:
+                rows = await conn.fetch(LOOKUP_QUERY, concurrent)
+                self.ids.update({row['name']: row['skill_id'] for row in rows})
+        return self.ids
+
+
+# Общий кэш процесса (переживает несколько запусков загрузки)
+skill_cache = SkillCache()
+
+
+def get_top_skills(
+    category: Optional[str] = None,
+    region_name: Optional[str] = None,
+    limit: int = 20
+) -> pd.DataFrame:
+    """Самые востребованные навыки (число вакансий) в категории и/или регионе"""
+    rows = execute_query(TOP_SKILLS_QUERY, {
+        'category': category,
+        'region_name': region_name,
+        'limit': limit
+    }, fetch=True, readonly=True)
+    return pd.DataFrame(rows, columns=['skill', 'vacancies'])
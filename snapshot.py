@@ -0,0 +1,259 @@
+import json
+import os
+import shutil
+import sys
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from datetime import date, datetime
+from typing import Dict, List, Optional
+from pyarrow import fs
+from database import get_db_connection
+from change_feed import get_changed_ids, get_current_watermark, save_watermark
+
+# Имя потребителя журнала изменений для водяного знака
+WATERMARK_NAME = 'snapshot'
+
+# Каталог снимка: hive-секции day=YYYY-MM-DD/region=NN, файлы run-<номер выгрузки>-*
+SNAPSHOT_DIR = os.environ.get(
+    'SNAPSHOT_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'snapshot')
+)
+# Префикс '_' - файл не считается частью набора данных
+MANIFEST_NAME = '_manifest.json'
+
+# parquet - сжатие и чтение только нужных колонок и секций,
+# feather (Arrow IPC без сжатия) - чтение через mmap без копирования
+FORMATS = {'parquet': 'parquet', 'feather': 'ipc'}
+
+# Строк на файл при выгрузке (курсор на стороне сервера, память не растет с объемом)
+CHUNK_SIZE = 50000
+
+# После стольких инкрементальных выгрузок снимок переписывается целиком
+COMPACT_AFTER = 24
+
+SCHEMA = pa.schema([
+    ('id', pa.string()),
+    ('job_name', pa.string()),
+    ('company_code', pa.string()),
+    ('company_name', pa.string()),
+    ('source', pa.string()),
+    ('region_code', pa.string()),
+    ('region_name', pa.string()),
+    ('city', pa.string()),
+    ('salary_min', pa.int32()),
+    ('salary_max', pa.int32()),
+    ('salary_norm_min', pa.int32()),
+    ('salary_norm_max', pa.int32()),
+    ('salary_norm_mid', pa.int32()),
+    ('salary_quality', pa.string()),
+    ('employment', pa.string()),
+    ('schedule', pa.string()),
+    ('category_specialisation', pa.string()),
+    ('requirement_education', pa.string()),
+    ('requirement_experience', pa.string()),
+    ('cluster_id', pa.string()),
+    ('created_at', pa.date32()),
+    ('last_updated', pa.timestamp('us')),
+    ('is_deleted', pa.bool_()),
+    ('snapshot_run', pa.int32()),
+    ('day', pa.string()),
+    ('region', pa.string())
+])
+
+PARTITIONING = ds.partitioning(
+    pa.schema([('day', pa.string()), ('region', pa.string())]),
+    flavor='hive'
+)
+
+# Строки соединения vacancy x company x region в порядке SCHEMA
+# (секции: день публикации и код субъекта)
+EXPORT_QUERY = """
+    SELECT v.id, v.job_name, v.company_code, c.company_name, c.source,
+           c.region_code, r.region_name, r.city,
+           v.salary_min, v.salary_max,
+           v.salary_norm_min, v.salary_norm_max, v.salary_norm_mid, v.salary_quality,
+           v.employment, v.schedule,
+           v.category_specialisation, v.requirement_education, v.requirement_experience,
+           v.cluster_id, v.created_at, v.last_updated,
+           {is_deleted} AS is_deleted,
+           %(run)s AS snapshot_run,
+           to_char(COALESCE(v.created_at, v.last_updated::date), 'YYYY-MM-DD') AS day,
+           COALESCE(left(c.region_code, 2), 'unknown') AS region
+    FROM {table} v
+    LEFT JOIN company c ON v.company_code = c.company_code
+    LEFT JOIN region r ON c.region_code = r.region_code
+    {where}
+"""
+
+# Инкрементальная выгрузка: текущие версии измененных вакансий
+# и "надгробия" для перенесенных в архив
+INCREMENTAL_QUERY = (
+    EXPORT_QUERY.format(table='vacancy', is_deleted='FALSE', where='WHERE v.id = ANY(%(ids)s)')
+    + "UNION ALL"
+    + EXPORT_QUERY.format(table='vacancy_archive', is_deleted='TRUE', where="""
+        WHERE v.id = ANY(%(ids)s)
+          AND NOT EXISTS (SELECT 1 FROM vacancy WHERE vacancy.id = v.id)
+          AND v.archived_at = (
+              SELECT max(archived_at) FROM vacancy_archive WHERE vacancy_archive.id = v.id
+          )
+    """)
+)
+
+
+def read_manifest(root: str = SNAPSHOT_DIR) -> Optional[Dict]:
+    try:
+        with open(os.path.join(root, MANIFEST_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(root: str, manifest: Dict):
+    path = os.path.join(root, MANIFEST_NAME)
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, default=str)
+    os.replace(f"{path}.tmp", path)
+
+
+def write_chunks(cursor, root: str, run: int, file_format: str) -> Dict:
+    """Пишет результат запроса в секции снимка файлами по CHUNK_SIZE строк"""
+    files = []
+    rows = deleted = 0
+    chunk = 0
+    while True:
+        records = cursor.fetchmany(CHUNK_SIZE)
+        if not records:
+            break
+        df = pd.DataFrame(records, columns=SCHEMA.names)
+        table = pa.Table.from_pandas(df, schema=SCHEMA, preserve_index=False)
+        ds.write_dataset(
+            table, root,
+            format=FORMATS[file_format],
+            partitioning=PARTITIONING,
+            basename_template=f"run-{run:06d}-{chunk:05d}-{{i}}.{file_format}",
+            existing_data_behavior='overwrite_or_ignore',
+            file_visitor=lambda written: files.append(os.path.relpath(written.path, root))
+        )
+        rows += len(df)
+        deleted += int(df['is_deleted'].sum())
+        chunk += 1
+    return {'rows': rows, 'deleted': deleted, 'files': files}
+
+
+def export_snapshot(
+    full: bool = False,
+    root: str = SNAPSHOT_DIR,
+    file_format: str = 'parquet'
+) -> Dict:
+    """Выгружает vacancy x company x region в колоночный снимок (инкрементально или целиком)"""
+    manifest = read_manifest(root)
+    changed_ids, watermark = get_changed_ids(WATERMARK_NAME)
+    if (
+        full or watermark is None or manifest is None
+        or manifest['format'] != file_format
+        or manifest['schema'] != SCHEMA.names
+        or len(manifest['runs']) - 1 >= COMPACT_AFTER
+    ):
+        full = True
+        watermark = get_current_watermark()
+        run = (manifest['runs'][-1]['run'] + 1) if manifest else 1
+        target = f"{root}.new"
+        shutil.rmtree(target, ignore_errors=True)
+        query, params = EXPORT_QUERY.format(table='vacancy', is_deleted='FALSE', where=''), {'run': run}
+    elif not changed_ids:
+        print("Снимок актуален")
+        return manifest
+    else:
+        run = manifest['runs'][-1]['run'] + 1
+        target = root
+        query, params = INCREMENTAL_QUERY, {'run': run, 'ids': list(changed_ids)}
+
+    os.makedirs(target, exist_ok=True)
+    started_at = datetime.now()
+    with get_db_connection() as conn:
+        # Именованный курсор: строки читаются с сервера порциями
+        with conn.cursor(name='snapshot_export') as cursor:
+            cursor.itersize = CHUNK_SIZE
+            cursor.execute(query, params)
+            written = write_chunks(cursor, target, run, file_format)
+
+    run_info = {
+        'run': run,
+        'full': full,
+        'started_at': started_at.isoformat(),
+        'finished_at': datetime.now().isoformat(),
+        'watermark': [int(watermark[0]), int(watermark[1])],
+        **written
+    }
+    if full:
+        manifest = {'format': file_format, 'schema': SCHEMA.names, 'runs': [run_info]}
+        write_manifest(target, manifest)
+        if os.path.exists(root):
+            shutil.rmtree(f"{root}.old", ignore_errors=True)
+            os.replace(root, f"{root}.old")
+        os.replace(target, root)
+        shutil.rmtree(f"{root}.old", ignore_errors=True)
+    else:
+        manifest['runs'].append(run_info)
+        write_manifest(root, manifest)
+
+    save_watermark(WATERMARK_NAME, watermark)
+    print(
+        f"Снимок {'выгружен полностью' if full else 'дополнен'}: "
+        f"{written['rows']} строк (снято {written['deleted']}), {len(written['files'])} файлов"
+    )
+    return manifest
+
+
+def load_snapshot(
+    columns: Optional[List[str]] = None,
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+    regions: Optional[List[str]] = None,
+    filter: Optional[ds.Expression] = None,
+    root: str = SNAPSHOT_DIR
+) -> pa.Table:
+    """Читает снимок в pyarrow.Table с отбором секций, колонок и последних версий вакансий"""
+    manifest = read_manifest(root)
+    if manifest is None:
+        raise FileNotFoundError(f"Снимок не найден: {root} (запустите export_snapshot)")
+
+    dataset = ds.dataset(
+        root,
+        schema=SCHEMA,
+        format=FORMATS[manifest['format']],
+        partitioning=PARTITIONING,
+        filesystem=fs.LocalFileSystem(use_mmap=True)
+    )
+    expression = ds.scalar(True)
+    if since is not None:
+        expression &= ds.field('day') >= since.isoformat()
+    if until is not None:
+        expression &= ds.field('day') <= until.isoformat()
+    if regions:
+        expression &= ds.field('region').isin(list(regions))
+    if filter is not None:
+        expression &= filter
+
+    incremental = len(manifest['runs']) > 1
+    read_columns = columns
+    if columns is not None and incremental:
+        read_columns = list(dict.fromkeys(columns + ['id', 'snapshot_run']))
+    table = dataset.to_table(columns=read_columns, filter=expression)
+    if not incremental:
+        return table
+
+    # Новая версия вакансии может лежать в другой секции (сменились день
+    # или регион), поэтому последняя версия ищется без фильтра секций
+    versions = dataset.to_table(columns=['id', 'snapshot_run', 'is_deleted']).to_pandas()
+    latest = versions.sort_values('snapshot_run').drop_duplicates('id', keep='last')
+    live_runs = latest.loc[~latest['is_deleted'], ['id', 'snapshot_run']].set_index('id')['snapshot_run']
+    runs = table.column('id').to_pandas().map(live_runs)
+    keep = (runs == table.column('snapshot_run').to_pandas()).to_numpy()
+    table = table.filter(pa.array(keep))
+    return table.select(columns) if columns is not None else table
+
+
+if __name__ == "__main__":
+    export_snapshot(full='--full' in sys.argv[1:])
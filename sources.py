@@ -0,0 +1,297 @@
+import hashlib
+import queue
+from abc import ABC, abstractmethod
+import re
+import threading
+from typing import Dict, Iterator, List, Optional, Set
+from http_fetcher import API_URL, CachedFetcher, FetchError, crawl_pages, fetcher
+
+# Поля вакансии, по которым одна и та же вакансия узнается в разных источниках
+# (только для сводки обхода: похожие вакансии объединяет dedup.refresh_clusters)
+DEDUP_FIELDS = ['job-name', 'company_name', 'salary_min', 'salary_max']
+
+# Опыт работы hh.ru -> код опыта trudvsem в requirement_experience
+# (0 - без опыта, 1 - 1-3 года, 2 - 3-6 лет, 3 - больше 6 лет)
+HH_EXPERIENCE = {
+    'noExperience': '0',
+    'between1And3': '1',
+    'between3And6': '2',
+    'moreThan6': '3'
+}
+
+
+class SourceCrawlError(FetchError):
+    """Часть источников не удалось обойти полностью"""
+
+    def __init__(self, errors: Dict[str, Exception]):
+        self.errors = errors
+        super().__init__(
+            '; '.join(f"{name}: {error}" for name, error in errors.items())
+        )
+
+
+def flatten_vacancy(vacancy: Dict) -> Dict:
+    """Разворачивает вложенную вакансию в плоский словарь (ключи через '_', элементы списков нумеруются)"""
+    flat_row = {}
+
+    def flatten_dict(d, prefix=''):
+        for key, value in d.items():
+            new_key = f"{prefix}{key}"
+            if isinstance(value, dict):
+                flatten_dict(value, f"{new_key}_")
+            elif isinstance(value, list):
+                for i, item in enumerate(value):
+                    if isinstance(item, dict):
+                        flatten_dict(item, f"{new_key}_{i}_")
+                    else:
+                        flat_row[f"{new_key}_{i}"] = item
+            else:
+                flat_row[new_key] = value
+
+    flatten_dict(vacancy)
+    return flat_row
+
+
+def content_hash(vacancy: Dict) -> str:
+    """Хеш содержимого плоской вакансии без учета источника и ее id"""
+    def normalize(value) -> str:
+        return ' '.join(re.findall(r'\w+', str(value or '').lower()))
+    hash_str = '|'.join(normalize(vacancy.get(field)) for field in DEDUP_FIELDS)
+    return hashlib.md5(hash_str.encode()).hexdigest()
+
+
+class SourceAdapter(ABC):
+    """Источник вакансий: скачивает страницу, приводит вакансии к схеме trudvsem и формирует id"""
+
+    name = ''
+    base_url = ''
+    # Глубже max_depth API не отдает: обход, дошедший до него, не полный
+    max_depth = None
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        rate_limit: float = 1.0,
+        page_size: int = 100,
+        http: Optional[CachedFetcher] = None,
+        max_age: Optional[float] = None
+    ):
+        self.base_url = base_url or self.base_url
+        self.rate_limit = rate_limit
+        self.page_size = page_size
+        # Срок свежести кэша ответов (None - ttl клиента, 0 - всегда перепроверять)
+        self.max_age = max_age
+        # Свой клиент у каждого источника: отдельные пул, кэш-статистика и предохранитель
+        self.http = http or CachedFetcher()
+
+    @abstractmethod
+    def fetch(self, offset: int, limit: int) -> List[Dict]:
+        """Вакансии страницы в формате API источника"""
+
+    @abstractmethod
+    def normalize(self, item: Dict) -> Dict:
+        """Вакансия источника в плоской схеме trudvsem"""
+
+    @abstractmethod
+    def source_id(self, item: Dict) -> str:
+        """id вакансии, уникальный среди всех источников"""
+
+    @abstractmethod
+    def total(self) -> int:
+        """Сколько вакансий можно получить из источника (для плана догрузки)"""
+
+    def fetch_page(self, offset: int = 0, limit: int = 100) -> List[Dict]:
+        """Страница вакансий в общем виде: {'vacancy': плоский словарь, 'source_name': имя источника}"""
+        return [
+            {'vacancy': self.normalize(item), 'source_name': self.name}
+            for item in self.fetch(offset, limit)
+        ]
+
+
+class TrudvsemAdapter(SourceAdapter):
+    """Портал «Работа в России» (opendata.trudvsem.ru)"""
+
+    name = 'trudvsem'
+    base_url = API_URL
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('http', fetcher)
+        super().__init__(*args, **kwargs)
+
+    def fetch(self, offset: int, limit: int) -> List[Dict]:
+        data = self.http.get_json(self.base_url, {"offset": offset, "limit": limit}, self.max_age)
+        return data.get("results", {}).get("vacancies", [])
+
+    def normalize(self, item: Dict) -> Dict:
+        vacancy = flatten_vacancy(item['vacancy'])
+        vacancy['id'] = self.source_id(item)
+        vacancy.setdefault('source', self.name)
+        return vacancy
+
+    def source_id(self, item: Dict) -> str:
+        return item['vacancy']['id']
+
+    def total(self) -> int:
+        data = self.http.get_json(self.base_url, {"offset": 0, "limit": 1}, self.max_age)
+        return int(data.get("meta", {}).get("total", 0))
+
+
+class HeadHunterAdapter(SourceAdapter):
+    """hh.ru (api.hh.ru). Поиск отдает не глубже 2000 вакансий"""
+
+    name = 'hh'
+    base_url = 'https://api.hh.ru/vacancies'
+    max_depth = 2000
+    user_agent = 'vacancy-pipeline/1.0'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # API hh.ru отклоняет запросы без HH-User-Agent
+        self.http.session.headers['HH-User-Agent'] = self.user_agent
+
+    def fetch(self, offset: int, limit: int) -> List[Dict]:
+        if offset >= self.max_depth:
+            return []
+        data = self.http.get_json(self.base_url, {"page": offset // limit, "per_page": limit}, self.max_age)
+        return data.get("items", [])
+
+    def normalize(self, item: Dict) -> Dict:
+        salary = item.get('salary') or {}
+        if salary.get('currency') not in (None, 'RUR'):
+            salary = {}
+        employer = item.get('employer') or {}
+        area = item.get('area') or {}
+        address = item.get('address') or {}
+        roles = item.get('professional_roles') or [{}]
+        city = address.get('city') or area.get('name')
+        street = ', '.join(filter(None, [address.get('street'), address.get('building')]))
+        return {
+            'id': self.source_id(item),
+            'source': 'hh.ru',
+            'job-name': item.get('name'),
+            'salary_min': salary.get('from') or 0,
+            'salary_max': salary.get('to') or 0,
+            'vac_url': item.get('alternate_url'),
+            'employment': (item.get('employment') or {}).get('name'),
+            'schedule': (item.get('schedule') or {}).get('name'),
+            'category_specialisation': roles[0].get('name'),
+            'requirement_education': None,
+            'requirement_experience': HH_EXPERIENCE.get((item.get('experience') or {}).get('id')),
+            'code_profession': None,
+            'creation-date': (item.get('published_at') or '')[:10] or None,
+            'company_companycode': f"hh-{employer.get('id')}",
+            'company_name': employer.get('name'),
+            'company_url': employer.get('alternate_url'),
+            'company_email': None,
+            'company_hr-agency': False,
+            'company_inn': None,
+            'company_kpp': None,
+            'company_ogrn': None,
+            'region_region_code': f"hh-{area.get('id')}",
+            'region_name': area.get('name'),
+            # Тот же формат, что у trudvsem: "регион, город, адрес"
+            'addresses_address_0_location': f"{area.get('name')}, {city}, {street}"
+        }
+
+    def source_id(self, item: Dict) -> str:
+        return f"hh-{item['id']}"
+
+    def total(self) -> int:
+        data = self.http.get_json(self.base_url, {"page": 0, "per_page": 1}, self.max_age)
+        return min(int(data.get("found", 0)), self.max_depth)
+
+
+# Реестр источников по имени
+SOURCES = {adapter.name: adapter for adapter in (TrudvsemAdapter, HeadHunterAdapter)}
+
+# Источники по умолчанию; hh.ru подключается через sources профиля загрузки
+DEFAULT_SOURCES = ['trudvsem']
+
+
+def get_sources(names: Optional[List[str]] = None, **kwargs) -> List[SourceAdapter]:
+    """Создает адаптеры по именам (по умолчанию - источники DEFAULT_SOURCES)"""
+    return [SOURCES[name](**kwargs) for name in names or DEFAULT_SOURCES]
+
+
+def crawl_sources(
+    adapters: List[SourceAdapter],
+    max_vacancies: int,
+    queue_size: int = 10,
+    complete: Optional[Set[str]] = None
+) -> Iterator[List[Dict]]:
+    """Обходит источники одновременно в своих потоках и отдает страницы по мере готовности"""
+    pages = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def put(item):
+        # Не блокируемся навсегда, если потребитель перестал читать
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def worker(adapter: SourceAdapter):
+        error = None
+        collected = 0
+        try:
+            for page in crawl_pages(
+                adapter.fetch_page,
+                max_vacancies,
+                batch_size=adapter.page_size,
+                delay=1.0 / adapter.rate_limit,
+                breaker=adapter.http.breaker
+            ):
+                if stop.is_set():
+                    break
+                collected += len(page)
+                put((adapter.name, page))
+            else:
+                depth = min(max_vacancies, adapter.max_depth or max_vacancies)
+                if complete is not None and collected < depth:
+                    complete.add(adapter.name)
+        except Exception as e:
+            error = e
+        finally:
+            put((adapter.name, error))
+
+    threads = [
+        threading.Thread(target=worker, args=(adapter,), name=f"source-{adapter.name}", daemon=True)
+        for adapter in adapters
+    ]
+    for thread in threads:
+        thread.start()
+
+    # content_hash -> источник, из которого вакансия пришла первой
+    seen = {}
+    counts = {adapter.name: {'fetched': 0, 'duplicates': 0} for adapter in adapters}
+    errors = {}
+    running = len(threads)
+    try:
+        while running:
+            name, page = pages.get()
+            if not isinstance(page, list):
+                running -= 1
+                if page is not None:
+                    print(f"Источник {name} обойден не полностью: {page}")
+                    errors[name] = page
+                continue
+            for item in page:
+                first_source = seen.setdefault(content_hash(item['vacancy']), name)
+                if first_source != name:
+                    counts[name]['duplicates'] += 1
+            counts[name]['fetched'] += len(page)
+            if page:
+                yield page
+    finally:
+        stop.set()
+
+    for adapter in adapters:
+        print(
+            f"Источник {adapter.name}: получено {counts[adapter.name]['fetched']}, "
+            f"совпадений с другими источниками {counts[adapter.name]['duplicates']}"
+        )
+        adapter.http.report()
+    if errors:
+        raise SourceCrawlError(errors)
@@ -0,0 +1,101 @@
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import pytest
+
+# Модули проекта лежат в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class StubServer:
+    """Локальный HTTP-сервер для тестов клиента и адаптеров источников.
+
+    Маршрут - функция (query) -> (статус, JSON-тело[, заголовки]); все запросы
+    записываются в requests как (путь, параметры), их заголовки - в headers.
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+        self.headers = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlsplit(self.path)
+                query = dict(parse_qsl(url.query))
+                stub.requests.append((url.path, query))
+                stub.headers.append(dict(self.headers))
+                route = stub.routes.get(url.path)
+                status, body, *extra = route(query) if route else (404, {'error': 'not found'})
+                payload = json.dumps(body).encode() if status != 304 else b''
+                self.send_response(status)
+                for name, value in (extra[0] if extra else {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True
+        )
+
+    def route(self, path, handler):
+        self.routes[path] = handler
+
+    def offsets(self, path):
+        """Запрошенные смещения маршрута по порядку"""
+        return [int(query['offset']) for request_path, query in self.requests if request_path == path]
+
+
+@pytest.fixture
+def stub():
+    server = StubServer()
+    server.thread.start()
+    yield server
+    server.server.shutdown()
+    server.server.server_close()
+
+
+def trudvsem_vacancy(vacancy_id, job_name='Повар', company='Ромашка', salary_min=30000, salary_max=40000):
+    """Вакансия в формате API trudvsem"""
+    return {'vacancy': {
+        'id': vacancy_id,
+        'job-name': job_name,
+        'salary_min': salary_min,
+        'salary_max': salary_max,
+        'company': {'companycode': f"c-{company}", 'name': company},
+        'region': {'region_code': '7700000000000', 'name': 'г. Москва'}
+    }}
+
+
+def trudvsem_catalogue(items, failures=None):
+    """Маршрут каталога trudvsem по offset/limit.
+
+    failures - смещение -> сколько первых запросов страницы ответить 503
+    (None - отвечать 503 всегда).
+    """
+    failures = dict(failures or {})
+
+    def handler(query):
+        offset, limit = int(query['offset']), int(query['limit'])
+        if offset in failures:
+            if failures[offset] is None:
+                return 503, {'error': 'unavailable'}
+            if failures[offset] > 0:
+                failures[offset] -= 1
+                return 503, {'error': 'unavailable'}
+        page = items[offset:offset + limit]
+        return 200, {'meta': {'total': len(items)}, 'results': {'vacancies': page} if page else {}}
+
+    return handler
@@ -0,0 +1,249 @@
+import os
+import time
+
+import pytest
+import requests
+
+from conftest import trudvsem_catalogue, trudvsem_vacancy
+from http_fetcher import (
+    CachedFetcher,
+    CircuitBreaker,
+    CircuitOpenError,
+    FetchError,
+    IncompleteCrawlError,
+    RetryableFetchError,
+    classify_error,
+    crawl_pages
+)
+
+
+def http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f"HTTP {status}", response=response)
+
+
+def make_fetcher(**kwargs):
+    """Клиент без дискового кэша и без пауз между повторами"""
+    kwargs.setdefault('breaker', CircuitBreaker(failure_threshold=5, reset_timeout=60))
+    return CachedFetcher(cache_dir=None, backoff_base=0, **kwargs)
+
+
+def fetch_trudvsem(http, url):
+    def fetch_page(offset, limit):
+        data = http.get_json(url, {'offset': offset, 'limit': limit})
+        return data.get('results', {}).get('vacancies', [])
+    return fetch_page
+
+
+@pytest.mark.parametrize('exc, retryable', [
+    (http_error(503), True),
+    (http_error(429), True),
+    (http_error(404), False),
+    (http_error(400), False),
+    (requests.ConnectionError('reset'), True),
+    (requests.Timeout('timeout'), True),
+    (ValueError('broken json'), True),
+    (RuntimeError('other'), False)
+])
+def test_classify_error(exc, retryable):
+    error = classify_error(exc)
+    assert isinstance(error, FetchError)
+    assert isinstance(error, RetryableFetchError) is retryable
+
+
+def test_retries_temporary_errors(stub):
+    stub.route('/api', trudvsem_catalogue([trudvsem_vacancy('1')], failures={0: 2}))
+    http = make_fetcher(max_retries=3)
+
+    data = http.get_json(f"{stub.url}/api", {'offset': 0, 'limit': 100})
+
+    assert data['results']['vacancies'][0]['vacancy']['id'] == '1'
+    assert http.stats['retries'] == 2
+    assert len(stub.requests) == 3
+
+
+def test_permanent_error_is_not_retried(stub):
+    http = make_fetcher(max_retries=3)
+
+    with pytest.raises(FetchError) as error:
+        http.get_json(f"{stub.url}/missing")
+
+    assert not isinstance(error.value, RetryableFetchError)
+    assert len(stub.requests) == 1
+
+
+def test_retries_exhausted(stub):
+    stub.route('/api', trudvsem_catalogue([], failures={0: None}))
+    http = make_fetcher(max_retries=2)
+
+    with pytest.raises(RetryableFetchError):
+        http.get_json(f"{stub.url}/api", {'offset': 0, 'limit': 100})
+
+    assert len(stub.requests) == 3
+    assert http.stats['failures'] == 1
+
+
+def test_stale_entry_revalidated_with_etag(stub, tmp_path):
+    def handler(query):
+        if stub.headers[-1].get('If-None-Match') == '"v1"':
+            return 304, None, {'ETag': '"v1"'}
+        return 200, {'meta': {'total': 1}}, {'ETag': '"v1"'}
+
+    stub.route('/api', handler)
+    http = CachedFetcher(cache_dir=str(tmp_path), ttl=0, backoff_base=0)
+    url = f"{stub.url}/api"
+
+    assert http.get_json(url, {'offset': 0}) == {'meta': {'total': 1}}
+    assert http.get_json(url, {'offset': 0}) == {'meta': {'total': 1}}
+
+    assert 'If-None-Match' not in stub.headers[0]
+    assert stub.headers[1]['If-None-Match'] == '"v1"'
+    assert http.stats['downloaded'] == 1
+    assert http.stats['not_modified'] == 1
+
+
+def test_not_modified_without_cache_entry_is_error(stub):
+    stub.route('/api', lambda query: (304, None, {'ETag': '"v1"'}))
+    http = make_fetcher()
+
+    with pytest.raises(FetchError):
+        http.get_json(f"{stub.url}/api")
+
+    assert http.stats['failures'] == 1
+    assert http.stats['downloaded'] == 0
+
+
+def test_breaker_opens_and_stops_requests(stub):
+    stub.route('/api', trudvsem_catalogue([], failures={0: None}))
+    http = make_fetcher(max_retries=5, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60))
+
+    with pytest.raises(CircuitOpenError):
+        http.get_json(f"{stub.url}/api", {'offset': 0, 'limit': 100})
+
+    assert len(stub.requests) == 2
+    with pytest.raises(CircuitOpenError):
+        http.get_json(f"{stub.url}/api", {'offset': 0, 'limit': 100})
+    assert len(stub.requests) == 2
+
+
+def test_breaker_half_open_probe(stub):
+    failures = {0: None}
+    stub.route('/api', trudvsem_catalogue([trudvsem_vacancy('1')], failures=failures))
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.1)
+    http = make_fetcher(max_retries=0, breaker=breaker)
+    url = f"{stub.url}/api"
+
+    for _ in range(2):
+        with pytest.raises(RetryableFetchError):
+            http.get_json(url, {'offset': 0, 'limit': 100})
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+    # Пробный запрос после reset_timeout неудачен - предохранитель снова разомкнут
+    time.sleep(0.15)
+    with pytest.raises(RetryableFetchError):
+        http.get_json(url, {'offset': 0, 'limit': 100})
+    assert breaker.remaining() > 0
+
+    # Удачный пробный запрос замыкает предохранитель
+    stub.route('/api', trudvsem_catalogue([trudvsem_vacancy('1')]))
+    time.sleep(0.15)
+    assert http.get_json(url, {'offset': 0, 'limit': 100})['meta']['total'] == 1
+    assert breaker.opened_at is None
+    assert breaker.failures == 0
+
+
+def test_crawl_resumes_only_failed_pages(stub):
+    items = [trudvsem_vacancy(str(i)) for i in range(300)]
+    stub.route('/api', trudvsem_catalogue(items, failures={100: 1}))
+    http = make_fetcher(max_retries=0)
+
+    pages = list(crawl_pages(
+        fetch_trudvsem(http, f"{stub.url}/api"), max_vacancies=1000,
+        batch_size=100, delay=0, breaker=http.breaker
+    ))
+
+    ids = sorted(int(item['vacancy']['id']) for page in pages for item in page)
+    assert ids == list(range(300))
+    # Успешные страницы не перезапрашиваются, неудавшаяся - один раз в конце
+    assert stub.offsets('/api') == [0, 100, 200, 300, 100]
+
+
+def test_crawl_raises_incomplete_after_resume_passes(stub):
+    items = [trudvsem_vacancy(str(i)) for i in range(300)]
+    stub.route('/api', trudvsem_catalogue(items, failures={100: None}))
+    http = make_fetcher(max_retries=0)
+    pages = []
+
+    with pytest.raises(IncompleteCrawlError) as error:
+        for page in crawl_pages(
+            fetch_trudvsem(http, f"{stub.url}/api"), max_vacancies=1000,
+            batch_size=100, delay=0, resume_passes=2, breaker=http.breaker
+        ):
+            pages.append(page)
+
+    assert error.value.failed_offsets == [100]
+    assert error.value.resume_offset is None
+    # Полученные страницы отданы потребителю до ошибки
+    assert sum(len(page) for page in pages) == 200
+    assert stub.offsets('/api').count(100) == 3
+
+
+def test_crawl_stops_when_breaker_stays_open(stub):
+    stub.route('/api', trudvsem_catalogue([], failures={0: None, 100: None, 200: None}))
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    http = make_fetcher(max_retries=0, breaker=breaker)
+
+    with pytest.raises(IncompleteCrawlError) as error:
+        list(crawl_pages(
+            fetch_trudvsem(http, f"{stub.url}/api"), max_vacancies=1000,
+            batch_size=100, delay=0, max_open_waits=2, breaker=breaker
+        ))
+
+    assert error.value.failed_offsets
+    assert error.value.resume_offset is not None
+
+
+def test_crawl_open_waits_reset_after_success():
+    calls = []
+
+    def fetch_page(offset, limit):
+        # Каждый второй запрос натыкается на разомкнутый предохранитель
+        calls.append(offset)
+        if len(calls) % 2:
+            raise CircuitOpenError('open')
+        return [{'id': offset}] if offset < 500 else []
+
+    pages = list(crawl_pages(
+        fetch_page, max_vacancies=1000, batch_size=100, delay=0,
+        max_open_waits=1, breaker=CircuitBreaker()
+    ))
+
+    assert len(pages) == 5
+
+
+def test_purge_cache_by_age_and_size(tmp_path):
+    http = CachedFetcher(cache_dir=str(tmp_path))
+    now = time.time()
+    for i, age in enumerate([3 * 24 * 3600, 300, 200, 100]):
+        path = tmp_path / f"{i}.json"
+        path.write_bytes(b'x' * 100)
+        os.utime(path, (now - age, now - age))
+
+    assert http.purge_cache(max_age=24 * 3600, max_bytes=250) == 2
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['2.json', '3.json']
+
+
+def test_crawl_respects_max_vacancies(stub):
+    items = [trudvsem_vacancy(str(i)) for i in range(300)]
+    stub.route('/api', trudvsem_catalogue(items))
+    http = make_fetcher()
+
+    pages = list(crawl_pages(
+        fetch_trudvsem(http, f"{stub.url}/api"), max_vacancies=150,
+        batch_size=100, delay=0, breaker=http.breaker
+    ))
+
+    assert sum(len(page) for page in pages) == 150
+    assert stub.offsets('/api') == [0, 100]
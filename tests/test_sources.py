@@ -0,0 +1,156 @@
+import pytest
+
+from conftest import trudvsem_catalogue, trudvsem_vacancy
+from http_fetcher import CachedFetcher
+from sources import HeadHunterAdapter, SourceAdapter, TrudvsemAdapter, crawl_sources
+
+
+def hh_vacancy(vacancy_id, name='Повар', employer='Ромашка', salary_from=30000, salary_to=40000, currency='RUR'):
+    """Вакансия в формате API hh.ru"""
+    return {
+        'id': vacancy_id,
+        'name': name,
+        'salary': {'from': salary_from, 'to': salary_to, 'currency': currency},
+        'alternate_url': f"https://hh.ru/vacancy/{vacancy_id}",
+        'employer': {'id': '7', 'name': employer},
+        'area': {'id': '1', 'name': 'Москва'},
+        'address': {'city': 'Москва', 'street': 'Тверская', 'building': '1'},
+        'experience': {'id': 'between1And3'},
+        'professional_roles': [{'name': 'Повар'}],
+        'published_at': '2025-05-01T10:00:00+0300'
+    }
+
+
+def hh_catalogue(items):
+    """Маршрут поиска hh.ru по page/per_page"""
+    def handler(query):
+        page, per_page = int(query['page']), int(query['per_page'])
+        return 200, {'found': len(items), 'items': items[page * per_page:(page + 1) * per_page]}
+    return handler
+
+
+def make_adapter(adapter_class, stub, path, **kwargs):
+    return adapter_class(
+        base_url=f"{stub.url}{path}", rate_limit=1000,
+        http=CachedFetcher(cache_dir=None, backoff_base=0), **kwargs
+    )
+
+
+def test_adapter_requires_all_methods():
+    class PartialAdapter(SourceAdapter):
+        name = 'partial'
+
+        def fetch(self, offset, limit):
+            return []
+
+        def normalize(self, item):
+            return item
+
+    with pytest.raises(TypeError, match='source_id'):
+        PartialAdapter(http=CachedFetcher(cache_dir=None))
+
+
+def test_trudvsem_adapter(stub):
+    stub.route('/trudvsem', trudvsem_catalogue([trudvsem_vacancy(str(i)) for i in range(5)]))
+    adapter = make_adapter(TrudvsemAdapter, stub, '/trudvsem', page_size=2)
+
+    page = adapter.fetch_page(2, 2)
+
+    assert adapter.total() == 5
+    assert [item['vacancy']['id'] for item in page] == ['2', '3']
+    assert {item['source_name'] for item in page} == {'trudvsem'}
+    vacancy = page[0]['vacancy']
+    assert vacancy['source'] == 'trudvsem'
+    assert vacancy['company_name'] == 'Ромашка'
+    assert vacancy['region_region_code'] == '7700000000000'
+
+
+def test_adapter_max_age_bypasses_fresh_cache(stub, tmp_path):
+    stub.route('/trudvsem', trudvsem_catalogue([trudvsem_vacancy(str(i)) for i in range(3)]))
+    http = CachedFetcher(cache_dir=str(tmp_path), backoff_base=0)
+    cached = TrudvsemAdapter(base_url=f"{stub.url}/trudvsem", http=http)
+    revalidated = TrudvsemAdapter(base_url=f"{stub.url}/trudvsem", http=http, max_age=0)
+
+    cached.fetch_page(0, 2)
+    cached.fetch_page(0, 2)
+    assert len(stub.requests) == 1
+
+    revalidated.fetch_page(0, 2)
+    assert len(stub.requests) == 2
+    assert http.stats['cache_hits'] == 1
+
+
+def test_hh_adapter_normalizes_to_trudvsem_schema(stub):
+    stub.route('/hh', hh_catalogue([hh_vacancy('1'), hh_vacancy('2', currency='USD')]))
+    adapter = make_adapter(HeadHunterAdapter, stub, '/hh')
+
+    rub, usd = [item['vacancy'] for item in adapter.fetch_page(0, 100)]
+
+    assert rub['id'] == 'hh-1'
+    assert rub['job-name'] == 'Повар'
+    assert (rub['salary_min'], rub['salary_max']) == (30000, 40000)
+    assert rub['company_companycode'] == 'hh-7'
+    assert rub['region_region_code'] == 'hh-1'
+    assert rub['requirement_experience'] == '1'
+    assert rub['creation-date'] == '2025-05-01'
+    assert rub['addresses_address_0_location'] == 'Москва, Москва, Тверская, 1'
+    # Зарплата не в рублях не переводится и считается неуказанной
+    assert (usd['salary_min'], usd['salary_max']) == (0, 0)
+    assert stub.requests[0][1] == {'page': '0', 'per_page': '100'}
+    assert stub.requests[0][0] == '/hh'
+
+
+@pytest.mark.parametrize('experience, code', [
+    ('noExperience', '0'),
+    ('between1And3', '1'),
+    ('between3And6', '2'),
+    ('moreThan6', '3'),
+    ('unknown', None)
+])
+def test_hh_experience_uses_trudvsem_codes(experience, code):
+    item = hh_vacancy('1')
+    item['experience'] = {'id': experience}
+    adapter = HeadHunterAdapter(http=CachedFetcher(cache_dir=None))
+
+    assert adapter.normalize(item)['requirement_experience'] == code
+
+
+def test_hh_adapter_depth_limit(stub):
+    stub.route('/hh', hh_catalogue([hh_vacancy(str(i)) for i in range(10)]))
+    adapter = make_adapter(HeadHunterAdapter, stub, '/hh')
+    adapter.max_depth = 4
+
+    assert adapter.total() == 4
+    assert adapter.fetch_page(4, 2) == []
+    assert len(stub.requests) == 1
+
+
+def test_crawl_sources_keeps_same_content_postings(stub):
+    # Одна сеть нанимает в нескольких городах: одинаковое содержимое, разные id
+    stub.route('/trudvsem', trudvsem_catalogue([trudvsem_vacancy(str(i)) for i in range(3)]))
+    stub.route('/hh', hh_catalogue([hh_vacancy('1')]))
+    adapters = [
+        make_adapter(TrudvsemAdapter, stub, '/trudvsem', page_size=2),
+        make_adapter(HeadHunterAdapter, stub, '/hh', page_size=2)
+    ]
+    complete = set()
+
+    pages = list(crawl_sources(adapters, max_vacancies=100, complete=complete))
+
+    ids = sorted(item['vacancy']['id'] for page in pages for item in page)
+    assert ids == ['0', '1', '2', 'hh-1']
+    assert complete == {'trudvsem', 'hh'}
+
+
+def test_crawl_sources_limited_crawl_is_not_complete(stub):
+    stub.route('/trudvsem', trudvsem_catalogue([trudvsem_vacancy(str(i)) for i in range(5)]))
+    stub.route('/hh', hh_catalogue([hh_vacancy(str(i)) for i in range(10)]))
+    hh = make_adapter(HeadHunterAdapter, stub, '/hh', page_size=2)
+    hh.max_depth = 4
+    adapters = [make_adapter(TrudvsemAdapter, stub, '/trudvsem', page_size=2), hh]
+    complete = set()
+
+    pages = list(crawl_sources(adapters, max_vacancies=4, complete=complete))
+
+    assert sum(len(page) for page in pages) == 8
+    assert complete == set()
@@ -0,0 +1,140 @@
+import json
+import re
+import pandas as pd
+from typing import Dict, List, Optional
+from psycopg2.extras import Json, execute_values
+from database import get_db_connection
+from skills import SKILL_COLUMN
+
+# Значение по умолчанию для незаполненных текстовых полей
+MISSING = 'Нет данных'
+
+# Граница INTEGER в PostgreSQL
+INT_MAX = 2 ** 31 - 1
+
+# Реестр колонок плоской вакансии: целевая колонка -> путь в API, тип,
+# значение по умолчанию и максимальная длина (по размерам колонок таблиц)
+COLUMN_REGISTRY = {
+    'id': {'path': 'id', 'type': 'str', 'default': None, 'length': 36},
+    'source': {'path': 'source', 'type': 'str', 'default': MISSING, 'length': 50},
+    'job-name': {'path': 'job-name', 'type': 'str', 'default': MISSING, 'length': 255},
+    'salary_min': {'path': 'salary_min', 'type': 'int', 'default': 0},
+    'salary_max': {'path': 'salary_max', 'type': 'int', 'default': 0},
+    'vac_url': {'path': 'vac_url', 'type': 'str', 'default': MISSING, 'length': 255},
+    'employment': {'path': 'employment', 'type': 'str', 'default': MISSING, 'length': 50},
+    'schedule': {'path': 'schedule', 'type': 'str', 'default': MISSING, 'length': 50},
+    'category_specialisation': {'path': 'category.specialisation', 'type': 'str', 'default': MISSING, 'length': 100},
+    'requirement_education': {'path': 'requirement.education', 'type': 'str', 'default': MISSING, 'length': 100},
+    'requirement_experience': {'path': 'requirement.experience', 'type': 'str', 'default': MISSING, 'length': 100},
+    'code_profession': {'path': 'code_profession', 'type': 'str', 'default': '0'},
+    'creation-date': {'path': 'creation-date', 'type': 'date', 'default': None},
+    'company_companycode': {'path': 'company.companycode', 'type': 'str', 'default': None, 'length': 50},
+    'company_name': {'path': 'company.name', 'type': 'str', 'default': MISSING, 'length': 255},
+    'company_email': {'path': 'company.email', 'type': 'str', 'default': MISSING, 'length': 100},
+    'company_hr-agency': {'path': 'company.hr-agency', 'type': 'bool', 'default': False},
+    'company_inn': {'path': 'company.inn', 'type': 'str', 'default': MISSING, 'length': 20},
+    'company_kpp': {'path': 'company.kpp', 'type': 'str', 'default': MISSING, 'length': 20},
+    'company_ogrn': {'path': 'company.ogrn', 'type': 'str', 'default': MISSING, 'length': 20},
+    'company_url': {'path': 'company.url', 'type': 'str', 'default': MISSING, 'length': 255},
+    'region_region_code': {'path': 'region.region_code', 'type': 'str', 'default': None, 'length': 20},
+    'region_name': {'path': 'region.name', 'type': 'str', 'default': MISSING, 'length': 100},
+    'addresses_address_0_location': {'path': 'addresses.address[0].location', 'type': 'str', 'default': MISSING}
+}
+
+# Без этих полей вакансию не записать (первичный и внешние ключи)
+REQUIRED_COLUMNS = ['id', 'company_companycode', 'region_region_code']
+
+
+TABLES = [
+    # Карантин: вакансии и страницы, не прошедшие проверку по реестру колонок
+    '''CREATE TABLE IF NOT EXISTS vacancy_quarantine (
+        quarantine_id BIGSERIAL PRIMARY KEY,
+        source VARCHAR(50),
+        vacancy_id VARCHAR(255),
+        reason TEXT NOT NULL,
+        payload JSONB,
+        quarantined_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );'''
+]
+
+
+class PageQuarantined(ValueError):
+    """Страница не прошла проверку и отправлена в карантин"""
+
+
+def flat_key(path: str) -> str:
+    """Ключ плоской вакансии для пути в API (как в flatten_vacancy)"""
+    return re.sub(r'\[(\d+)\]', r'_\1', path).replace('.', '_')
+
+
+def coerce(series: pd.Series, spec: Dict) -> pd.Series:
+    """Приводит колонку к типу из реестра одной векторной операцией"""
+    if spec['type'] == 'int':
+        values = pd.to_numeric(series, errors='coerce').clip(0, INT_MAX)
+        return values.fillna(spec['default']).astype('int64')
+    if spec['type'] == 'bool':
+        return series.astype(str).str.lower().isin(['true', '1'])
+    if spec['type'] == 'date':
+        values = pd.to_datetime(series, errors='coerce')
+        return values.dt.date.astype(object).where(values.notna(), None)
+    values = series.astype(object).where(series.notna(), spec['default'])
+    values = values.map(str, na_action='ignore') if spec['default'] is None else values.astype(str)
+    if spec.get('length'):
+        values = values.str.slice(0, spec['length'])
+    return values
+
+
+def empty_frame() -> pd.DataFrame:
+    """Пустая страница с колонками реестра"""
+    return pd.DataFrame({column: pd.Series(dtype=object) for column in COLUMN_REGISTRY})
+
+
+def conform_columns(flat: pd.DataFrame) -> pd.DataFrame:
+    """Приводит плоскую страницу к колонкам реестра, вакансии без обязательных значений - в карантин"""
+    missing = [
+        column for column in REQUIRED_COLUMNS
+        if flat_key(COLUMN_REGISTRY[column]['path']) not in flat.columns
+    ]
+    if missing:
+        raise PageQuarantined(f"нет обязательных полей: {', '.join(missing)}")
+
+    invalid = pd.Series(False, index=flat.index)
+    for column in REQUIRED_COLUMNS:
+        values = flat[flat_key(COLUMN_REGISTRY[column]['path'])]
+        invalid |= values.isna() | values.astype(str).str.strip().eq('')
+    if invalid.any():
+        quarantine(flat[invalid].to_dict('records'), 'нет значений обязательных полей')
+        flat = flat[~invalid]
+
+    conformed = pd.DataFrame({
+        column: coerce(
+            flat[flat_key(spec['path'])] if flat_key(spec['path']) in flat.columns
+            else pd.Series(spec['default'], index=flat.index, dtype=object),
+            spec
+        )
+        for column, spec in COLUMN_REGISTRY.items()
+    }, index=flat.index)
+    skill_columns = [column for column in flat.columns if SKILL_COLUMN.match(column)]
+    return pd.concat([conformed, flat[skill_columns]], axis=1).reset_index(drop=True)
+
+
+def quarantine(payloads: List[Dict], reason: str, source: Optional[str] = None):
+    """Сохраняет отбракованные вакансии (или страницу) в vacancy_quarantine"""
+    rows = []
+    for payload in payloads:
+        # NaN не допускается в jsonb, заменяем на null
+        payload = {key: None if isinstance(value, float) and value != value else value for key, value in payload.items()}
+        rows.append((
+            source or payload.get('source'),
+            str(payload.get('id'))[:255] if payload.get('id') is not None else None,
+            reason,
+            Json(payload, dumps=lambda data: json.dumps(data, ensure_ascii=False, default=str))
+        ))
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            execute_values(cursor, """
+                INSERT INTO vacancy_quarantine (source, vacancy_id, reason, payload)
+                VALUES %s;
+            """, rows)
+            conn.commit()
+    print(f"В карантин отправлено {len(rows)} записей: {reason}")
@@ -0,0 +1,187 @@
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List
+from psycopg2.extras import execute_values
+from database import execute_query, get_db_connection
+
+# Вакансия считается снятой, если ее не видели дольше этого срока
+# и она не встретилась в MISSED_PASSES последних полных проходах своего источника
+DEFAULT_MAX_AGE_DAYS = 7
+
+# Обход по смещениям может пропустить живую вакансию, если каталог
+# сдвинулся во время прохода, поэтому одного пропуска недостаточно
+MISSED_PASSES = 2
+
+START_PASS_QUERY = "INSERT INTO crawl_pass (source, profile) VALUES (%s, %s) RETURNING pass_id;"
+
+FINISH_PASSES_QUERY = """
+    UPDATE crawl_pass SET finished_at = CURRENT_TIMESTAMP, complete = (source = ANY(%s))
+    WHERE pass_id = ANY(%s);
+"""
+
+# Самый ранний из missed последних полных проходов каждого источника
+# (источники, у которых столько полных проходов еще нет, не попадают)
+SWEEP_PASSES_QUERY = """
+    SELECT source, min(pass_id)
+    FROM (
+        SELECT source, pass_id,
+               row_number() OVER (PARTITION BY source ORDER BY pass_id DESC) AS n
+        FROM crawl_pass
+        WHERE complete
+    ) p
+    WHERE n <= %(missed)s
+    GROUP BY source
+    HAVING count(*) = %(missed)s;
+"""
+
+TABLES = [
+    # Когда вакансию последний раз видели при обходе API (узкая таблица,
+    # чтобы отметка не переписывала строки vacancy и не попадала в журнал)
+    '''CREATE TABLE IF NOT EXISTS vacancy_seen (
+        id VARCHAR(36) PRIMARY KEY,
+        last_seen TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );''',
+    '''CREATE INDEX IF NOT EXISTS idx_vacancy_seen_last_seen
+        ON vacancy_seen (last_seen);''',
+    # Уже загруженные вакансии считаются увиденными сейчас: снимут их
+    # только следующие полные проходы (см. sweep_expired_vacancies)
+    '''INSERT INTO vacancy_seen (id, last_seen)
+        SELECT id, CURRENT_TIMESTAMP FROM vacancy
+        ON CONFLICT (id) DO NOTHING;''',
+    # Проход - один обход каталога источника (загрузка или догрузка);
+    # complete - каталог пройден до конца
+    '''CREATE TABLE IF NOT EXISTS crawl_pass (
+        pass_id SERIAL PRIMARY KEY,
+        source VARCHAR(50) NOT NULL,
+        profile VARCHAR(20) NOT NULL,
+        started_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        finished_at TIMESTAMP,
+        complete BOOLEAN NOT NULL DEFAULT FALSE
+    );''',
+    '''CREATE INDEX IF NOT EXISTS idx_crawl_pass_complete
+        ON crawl_pass (source, pass_id) WHERE complete;''',
+    # Источник вакансии и последний проход, в котором она встретилась
+    '''ALTER TABLE vacancy_seen
+        ADD COLUMN IF NOT EXISTS source VARCHAR(50),
+        ADD COLUMN IF NOT EXISTS last_seen_pass INTEGER;''',
+    # id вакансий hh.ru начинаются с 'hh-' (HeadHunterAdapter.source_id)
+    '''UPDATE vacancy_seen
+        SET source = CASE WHEN id LIKE 'hh-%' THEN 'hh' ELSE 'trudvsem' END
+        WHERE source IS NULL;''',
+    '''CREATE INDEX IF NOT EXISTS idx_vacancy_seen_source_pass
+        ON vacancy_seen (source, last_seen_pass);''',
+    # Архив снятых вакансий
+    '''CREATE TABLE IF NOT EXISTS vacancy_archive (
+        LIKE vacancy INCLUDING DEFAULTS,
+        archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );''',
+    '''CREATE INDEX IF NOT EXISTS idx_vacancy_archive_id
+        ON vacancy_archive (id);''',
+    '''ALTER TABLE vacancy_archive ADD COLUMN IF NOT EXISTS created_at DATE;''',
+    '''CREATE INDEX IF NOT EXISTS idx_vacancy_archive_created_at
+        ON vacancy_archive (created_at);''',
+    '''CREATE INDEX IF NOT EXISTS idx_vacancy_archive_archived_at
+        ON vacancy_archive (archived_at);'''
+]
+
+def touch_vacancies(ids: Iterable[str]):
+    """Отмечает вакансии как увиденные при текущем обходе"""
+    data = [(vacancy_id,) for vacancy_id in set(ids)]
+    if not data:
+        return
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            execute_values(cursor, """
+                INSERT INTO vacancy_seen (id, last_seen)
+                SELECT v.id, CURRENT_TIMESTAMP FROM (VALUES %s) AS v (id)
+                ON CONFLICT (id) DO UPDATE SET last_seen = EXCLUDED.last_seen;
+            """, data)
+            conn.commit()
+
+def start_passes(source_names: List[str], profile: str) -> Dict[str, int]:
+    """Начинает проходы источников, возвращает источник -> pass_id"""
+    passes = {}
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            for name in source_names:
+                cursor.execute(START_PASS_QUERY, (name, profile))
+                passes[name] = cursor.fetchone()[0]
+            conn.commit()
+    return passes
+
+def finish_passes(passes: Dict[str, int], complete: Iterable[str]):
+    """Завершает проходы; полными отмечаются источники из complete"""
+    if passes:
+        execute_query(FINISH_PASSES_QUERY, (list(complete), list(passes.values())))
+
+def get_vacancy_columns() -> str:
+    """Общие колонки vacancy и vacancy_archive (для переноса в архив)"""
+    rows = execute_query("""
+        SELECT v.column_name
+        FROM information_schema.columns v
+        JOIN information_schema.columns a
+          ON a.table_name = 'vacancy_archive' AND a.column_name = v.column_name
+        WHERE v.table_name = 'vacancy'
+        ORDER BY v.ordinal_position;
+    """, fetch=True)
+    return ', '.join(name for (name,) in rows)
+
+def get_sweep_passes(missed_passes: int = MISSED_PASSES) -> Dict[str, int]:
+    """Источник -> проход, начиная с которого вакансия должна была встретиться"""
+    return dict(execute_query(SWEEP_PASSES_QUERY, {'missed': missed_passes}, fetch=True))
+
+def sweep_expired_vacancies(max_age_days: int = DEFAULT_MAX_AGE_DAYS, batch_size: int = 1000) -> int:
+    """Переносит снятые вакансии в vacancy_archive пачками по batch_size, возвращает их число"""
+    passes = get_sweep_passes()
+    if not passes:
+        print(f"Перенос в архив пропущен: ни у одного источника нет {MISSED_PASSES} полных проходов")
+        return 0
+    cutoff = datetime.now() - timedelta(days=max_age_days)
+
+    columns = get_vacancy_columns()
+    sweep_query = f"""
+        WITH expired AS (
+            SELECT s.id
+            FROM vacancy_seen s
+            JOIN unnest(%(sources)s::text[], %(passes)s::integer[]) AS p(source, pass_id)
+              ON p.source = s.source
+            WHERE COALESCE(s.last_seen_pass, 0) < p.pass_id
+              AND s.last_seen < %(cutoff)s
+            ORDER BY s.last_seen
+            LIMIT %(batch_size)s
+            FOR UPDATE OF s SKIP LOCKED
+        ), moved AS (
+            DELETE FROM vacancy v
+            USING expired e
+            WHERE v.id = e.id
+            RETURNING {columns}
+        ), archived AS (
+            INSERT INTO vacancy_archive ({columns})
+            SELECT {columns} FROM moved
+            RETURNING id
+        ), forgotten AS (
+            DELETE FROM vacancy_seen s
+            USING expired e
+            WHERE s.id = e.id
+            RETURNING s.id
+        )
+        SELECT (SELECT count(*) FROM forgotten), (SELECT count(*) FROM archived);
+    """
+
+    archived = 0
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            while True:
+                cursor.execute(sweep_query, {
+                    'sources': list(passes), 'passes': list(passes.values()),
+                    'cutoff': cutoff, 'batch_size': batch_size
+                })
+                forgotten, moved = cursor.fetchone()
+                conn.commit()
+                if forgotten == 0:
+                    break
+                archived += moved
+    print(
+        f"В архив перенесено {archived} вакансий (не встречены в {MISSED_PASSES} последних "
+        f"полных проходах источников {', '.join(passes)} и с {cutoff:%Y-%m-%d %H:%M})"
+    )
+    return archived
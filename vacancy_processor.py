@@ -1,113 +1,106 @@
 import pandas as pd
-import requests
-from time import sleep
+from http_fetcher import API_URL, crawl_pages, fetcher
+from sources import flatten_vacancy
+from skills import SKILL_COLUMN, extract_skills
+from vacancy_columns import MISSING, PageQuarantined, conform_columns, empty_frame, quarantine
 import ast
 import hashlib
-import spacy
 from typing import List, Dict, Optional
 
-# Инициализация NLP модели один раз при загрузке модуля
-nlp = spacy.load('ru_core_news_sm')
+# NLP-модель загружается при первом использовании (импорт spacy и загрузка
+# модели занимают несколько секунд и не нужны без NLP-обработки названий)
+NLP_MODEL = 'ru_core_news_sm'
+# Для частей речи синтаксический разбор и поиск сущностей не нужны
+NLP_DISABLE = ['parser', 'ner']
+NLP_BATCH_SIZE = 256
+
+_nlp = None
+
+def get_nlp():
+    """NLP-модель spacy (загружается один раз на процесс)"""
+    global _nlp
+    if _nlp is None:
+        import spacy
+        _nlp = spacy.load(NLP_MODEL, disable=NLP_DISABLE)
+    return _nlp
 
 def get_vacancies_batch(offset: int = 0, limit: int = 100) -> List[Dict]:
     """Получает одну партию вакансий с API"""
-    url = "https://opendata.trudvsem.ru/api/v1/vacancies"
     params = {"offset": offset, "limit": limit}
-    
-    try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
-        return data.get("results", {}).get("vacancies", [])
-    except Exception as e:
-        print(f"Ошибка при запросе: {e}")
-        return []
+    data = fetcher.get_json(API_URL, params)
+    return data.get("results", {}).get("vacancies", [])
 
 def collect_vacancies(max_vacancies: int = 2000) -> pd.DataFrame:
     """Собирает вакансии с API"""
     all_vacancies = []
-    offset = 0
-    batch_size = 100
     
-    while len(all_vacancies) < max_vacancies:
-        print(f"Собрано {len(all_vacancies)} вакансий...")
-        vacancies = get_vacancies_batch(offset, batch_size)
-        if not vacancies:
-            break
+    for vacancies in crawl_pages(get_vacancies_batch, max_vacancies, batch_size=100, delay=1):
         all_vacancies.extend(vacancies)
-        offset += batch_size
-        sleep(1)
+        print(f"Собрано {len(all_vacancies)} вакансий...")
     
+    fetcher.report()
     return pd.DataFrame(all_vacancies[:max_vacancies])
 
 def expand_vacancy_data(df: pd.DataFrame) -> pd.DataFrame:
     """Преобразует вложенные структуры вакансий в плоский DataFrame"""
-    if isinstance(df['vacancy'].iloc[0], str):
-        df['vacancy'] = df['vacancy'].apply(ast.literal_eval)
-    
-    all_rows = []
-    for vacancy_dict in df['vacancy']:
-        flat_row = {}
-        
-        def flatten_dict(d, prefix=''):
-            for key, value in d.items():
-                new_key = f"{prefix}{key}"
-                if isinstance(value, dict):
-                    flatten_dict(value, f"{new_key}_")
-                elif isinstance(value, list):
-                    for i, item in enumerate(value):
-                        if isinstance(item, dict):
-                            flatten_dict(item, f"{new_key}_{i}_")
-                        else:
-                            flat_row[f"{new_key}_{i}"] = item
-                else:
-                    flat_row[new_key] = value
-        
-        flatten_dict(vacancy_dict)
-        all_rows.append(flat_row)
-    
-    return pd.DataFrame(all_rows)
+    try:
+        vacancies = df['vacancy']
+        if len(vacancies) and isinstance(vacancies.iloc[0], str):
+            vacancies = vacancies.apply(ast.literal_eval)
+        all_rows = [flatten_vacancy(vacancy_dict) for vacancy_dict in vacancies]
+        return conform_columns(pd.DataFrame(all_rows))
+    except (PageQuarantined, KeyError, TypeError, AttributeError, ValueError, SyntaxError) as e:
+        quarantine(
+            [
+                item if isinstance(item, dict) else {'value': item}
+                for item in df.get('vacancy', pd.Series(dtype=object)).tolist()
+            ] or [{}],
+            f"страница не разобрана: {e!r}"
+        )
+        return empty_frame()
 
-def clean_data(df: pd.DataFrame) -> pd.DataFrame:
-    """Очистка и предобработка данных"""
-    # Удаление ненужных столбцов
-    columns_to_drop = [
-        'duty', 'company_site', 'term_text', 'typicalPosition',
-        *[f'skills_{i}' for i in range(32)],
-        *[f'contact_list_{i}_contact_type' for i in range(1,4)],
-        *[f'contact_list_{i}_contact_value' for i in range(1,4)],
-        'medicalDocuments', 'shift_0', 'shift_1',
-        'requirement_qualification', 'hireDate', 'benefit',
-        'scheduleTypeComment', 'addressOffice', 'medicalCertificate'
-    ]
-    df.drop(columns=[col for col in columns_to_drop if col in df.columns], inplace=True)
+def clean_data(df: pd.DataFrame, nlp: bool = True) -> pd.DataFrame:
+    """Очистка и предобработка данных (nlp=False - названия вакансий без NLP-обработки)"""
+    # Навыки из широких колонок skills_N собираются в список (таблицы skill/vacancy_skill)
+    df['skills'] = extract_skills(df)
     
-    # Заполнение пропусков
-    df['code_profession'].fillna(0, inplace = True)
-    df.fillna('Нет данных', inplace=True)
+    # Остальные колонки уже приведены к реестру и заполнены в expand_vacancy_data
+    df = df.drop(columns=[col for col in df.columns if SKILL_COLUMN.match(col)])
     
-    # Извлечение города и адреса
-    df[["city", "address"]] = df["addresses_address_0_location"].str.split(",", n=2, expand=True).iloc[:, 1:3]
-    df["city"] = df["city"].str.strip()
-    df["address"] = df["address"].str.strip()
+    # Извлечение города и адреса (в адресе может не быть запятых)
+    location = df["addresses_address_0_location"].str.split(",", n=2, expand=True)
+    location = location.reindex(columns=[0, 1, 2]).astype(object)
+    df["city"] = location[1].str.strip().fillna(MISSING)
+    df["address"] = location[2].str.strip().fillna(MISSING)
     
     # Обработка названий вакансий
-    df['job-name'] = df['job-name'].str.lower().apply(extract_profession)
-    df['city'] = df['city'].str.replace('^г', '', regex=True)
+    if nlp:
+        df['job-name'] = extract_professions(df['job-name'].str.lower())
+    df['city'] = df['city'].str.replace('^г', '', regex=True).str.slice(0, 100)
     
     return df
 
 def extract_profession(text: str) -> str:
     """Извлекает профессию из текста"""
-    doc = nlp(text)
+    doc = get_nlp()(text)
     return ' '.join([token.text for token in doc if token.pos_ == 'NOUN'])
 
+def extract_professions(texts: pd.Series) -> pd.Series:
+    """Извлекает профессии из названий пачкой"""
+    unique = texts.drop_duplicates().tolist()
+    docs = get_nlp().pipe(unique, batch_size=NLP_BATCH_SIZE)
+    professions = {
+        text: ' '.join(token.text for token in doc if token.pos_ == 'NOUN')
+        for text, doc in zip(unique, docs)
+    }
+    return texts.map(professions)
+
 def calculate_hash(row: Dict) -> str:
     """Вычисляет хеш строки для сравнения"""
     return hashlib.md5(str(row).encode()).hexdigest()
 
-def prepare_vacancies(df_raw: pd.DataFrame) -> pd.DataFrame:
+def prepare_vacancies(df_raw: pd.DataFrame, nlp: bool = True) -> pd.DataFrame:
     """Полный цикл обработки сырых данных"""
     df = expand_vacancy_data(df_raw)
-    df = clean_data(df)
+    df = clean_data(df, nlp=nlp)
     return df
\ No newline at end of file